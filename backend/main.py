@@ -6,13 +6,14 @@ Backend اصلی پروژه
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 import uvicorn
 import json
 from datetime import datetime
 import asyncio
 import os
 import tempfile
+import uuid
 from pathlib import Path
 
 import sys
@@ -26,6 +27,9 @@ from brain.core.personality import PersonalityEngine
 from brain.interfaces.speech_handler import speech_handler
 from brain.learning.dynamic_name_learning import dynamic_name_learning
 from brain.learning.personal_learning_system import personal_learning_system
+from brain.utils.learning_pipeline import learning_pipeline
+from brain.utils.log_store import log_store
+from brain.utils.message_analysis import MessageAnalysis
 
 app = FastAPI(title="روباه AI Assistant", version="1.0.0")
 
@@ -48,10 +52,18 @@ personality_engine = PersonalityEngine()
 async def startup_event():
     """راه‌اندازی اولیه سیستم"""
     print("🚀 در حال راه‌اندازی سیستم روباه...")
+    await learning_pipeline.start()  # یادگیری پس‌زمینه (و بازیابی کارهای ناتمام)
     await ai_brain.initialize_model()
     await speech_handler.initialize()  # راه‌اندازی سیستم صوتی
     print("✅ سیستم آماده است!")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """آزادسازی منابع هنگام خاموشی"""
+    await learning_pipeline.stop()  # اجرای کارهای یادگیری باقی‌مانده
+    await ai_brain.close()
+    await asyncio.get_running_loop().run_in_executor(None, memory_manager.close)
+
 class ConnectionManager:
     def __init__(self):
         self.active_connections: list[WebSocket] = []
@@ -79,20 +91,27 @@ async def root():
 async def get_status():
     return {
         "status": "active",
-        "brain_loaded": ai_brain.is_loaded(),
+        "brain_loaded": await ai_brain.is_loaded(),
         "memory_size": memory_manager.get_memory_count(),
+        "retrieval": memory_manager.get_retrieval_stats(),
         "personality_level": personality_engine.get_development_level(),
         "web_search": ai_brain.get_web_status(),
         "model_policy": {
             "allow_heavy": ai_brain.allow_heavy_models,
             "current_model": ai_brain.current_model
         },
+        "llm_scheduler": ai_brain.scheduler.get_stats(),
+        "model_router": ai_brain.router.get_stats(),
+        "model_residency": ai_brain.residency.get_status(),
+        "speculative_drafts": ai_brain.speculative.get_stats(),
         "timestamp": datetime.now().isoformat()
     }
 
 @app.websocket("/chat")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
+    # هر اتصال یک مکالمه جدا (context مدل مشترک نیست)
+    conversation_id = f"ws:{uuid.uuid4().hex[:12]}"
     
     try:
         while True:
@@ -114,20 +133,59 @@ async def websocket_endpoint(websocket: WebSocket):
                 except:
                     pass  # اگر ارسال ناموفق بود، نادیده بگیر
             
+            # ارسال توکن‌ها به محض تولید (با "stream": false غیرفعال می‌شود)
+            async def stream_callback(token: str):
+                delta_response = {
+                    "type": "delta",
+                    "message": token,
+                    "timestamp": datetime.now().isoformat()
+                }
+                try:
+                    await websocket.send_text(json.dumps(delta_response, ensure_ascii=False))
+                except:
+                    pass  # اگر ارسال ناموفق بود، نادیده بگیر
+            
+            # پیش‌نویس مدل سریع برای پیام‌های کوتاه (با "speculative": false غیرفعال می‌شود)
+            async def draft_callback(draft: str):
+                draft_response = {
+                    "type": "draft",
+                    "message": draft,
+                    "timestamp": datetime.now().isoformat()
+                }
+                try:
+                    await websocket.send_text(json.dumps(draft_response, ensure_ascii=False))
+                except:
+                    pass  # اگر ارسال ناموفق بود، نادیده بگیر
+            
             # پردازش پیام توسط AI
-            response = await process_user_message(user_message["message"], thinking_callback)
+            speculation = {}
+            response = await process_user_message(
+                user_message["message"],
+                thinking_callback,
+                stream_callback if user_message.get("stream", True) else None,
+                draft_callback if user_message.get("speculative", True) else None,
+                speculation,
+                session_id=user_message.get("conversation_id") or conversation_id
+            )
             
-            # ارسال پاسخ
+            # ارسال پاسخ - draft: پاسخ نهایی پیش‌نویس را تأیید (confirmed) یا جایگزین (replaced) می‌کند
             ai_response = {
                 "type": "ai",
                 "message": response,
                 "timestamp": datetime.now().isoformat()
             }
+            if speculation.get("draft"):
+                ai_response["draft"] = speculation["outcome"]
             
             await manager.send_message(json.dumps(ai_response, ensure_ascii=False), websocket)
             
     except WebSocketDisconnect:
         manager.disconnect(websocket)
+        ai_brain.generation_sessions.reset(conversation_id)
+
+def conversation_id_of(request: dict) -> str:
+    """شناسه مکالمه درخواست HTTP - conversation_id کلاینت، وگرنه یک مکالمه برای هر کاربر"""
+    return request.get("conversation_id") or f"http:{request.get('user_id', 'anonymous')}"
 
 @app.post("/chat")
 async def http_chat_endpoint(request: dict):
@@ -142,7 +200,7 @@ async def http_chat_endpoint(request: dict):
         print(f"📨 پیام HTTP از {user_id}: {message}")
         
         # پردازش پیام
-        response = await process_user_message(message)
+        response = await process_user_message(message, session_id=conversation_id_of(request))
         
         return {
             "response": response,
@@ -158,6 +216,56 @@ async def http_chat_endpoint(request: dict):
             "success": False
         }
 
+@app.post("/chat/stream")
+async def http_chat_stream_endpoint(request: dict):
+    """HTTP endpoint چت با پاسخ chunked - هر خط یک رویداد JSON (NDJSON)"""
+    message = request.get("message", "")
+    
+    if not message.strip():
+        return {"error": "پیام خالی است"}
+    
+    events: asyncio.Queue = asyncio.Queue()
+    
+    async def thinking_callback(text: str):
+        await events.put({"type": "thinking", "message": text, "timestamp": datetime.now().isoformat()})
+    
+    async def stream_callback(token: str):
+        await events.put({"type": "delta", "message": token, "timestamp": datetime.now().isoformat()})
+    
+    async def draft_callback(draft: str):
+        await events.put({"type": "draft", "message": draft, "timestamp": datetime.now().isoformat()})
+    
+    async def run():
+        try:
+            speculation = {}
+            response = await process_user_message(
+                message, thinking_callback, stream_callback,
+                draft_callback if request.get("speculative", True) else None,
+                speculation,
+                session_id=conversation_id_of(request)
+            )
+            event = {"type": "ai", "message": response, "timestamp": datetime.now().isoformat()}
+            if speculation.get("draft"):
+                event["draft"] = speculation["outcome"]
+            await events.put(event)
+        finally:
+            await events.put(None)
+    
+    async def event_stream():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        finally:
+            # قطع اتصال کلاینت: تولید پاسخ هم لغو می‌شود
+            if not task.done():
+                task.cancel()
+    
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
 @app.post("/web-search/toggle")
 async def toggle_web_search(enabled: bool = None):
     """فعال/غیرفعال کردن جستجوی وب"""
@@ -207,6 +315,12 @@ async def get_dataset_stats():
         "total_interactions": ai_brain.dataset_manager.get_stats()
     }
 
+@app.get("/memory/retrieval")
+async def get_retrieval_stats(evaluate: bool = False):
+    """زمان بازیابی معنایی و recall@k (evaluate=true ارزیابی را دوباره اجرا می‌کند)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, memory_manager.get_retrieval_stats, evaluate)
+
 @app.get("/user/profile")
 async def get_user_profile():
     """دریافت پروفایل کاربر"""
@@ -521,16 +635,18 @@ async def list_uploaded_files():
 async def get_conversation_analytics():
     """آمار مکالمات"""
     try:
-        # آمار ساده از حافظه
-        memory_stats = memory_manager.get_memory_count()
+        # آمار از log_store (با SQLite پرس‌وجوی ایندکس شده)
+        latest = log_store.query("learning_conversations", limit=1)
         
         return {
-            "total_conversations": memory_stats.get("conversations", 0),
-            "total_messages": memory_stats.get("short_term", 0),
+            "total_conversations": log_store.count("learning_conversations"),
+            "total_messages": log_store.count("user_interactions"),
             "personality_level": personality_engine.get_development_level(),
-            "last_interaction": datetime.now().isoformat(),
-            "active_topics": ["برنامه‌نویسی", "هوش مصنوعی", "فارسی"],  # نمونه
-            "mood_trend": "مثبت"  # نمونه
+            "last_interaction": latest[0].get("timestamp") if latest else None,
+            "active_topics": [topic for topic, _ in log_store.topic_counts("user_interactions", limit=5)],
+            "mood_trend": personality_engine.get_mood_trend(),
+            "daily_conversations": dict(log_store.daily_counts("learning_conversations", days=7)),
+            "storage_backend": log_store.backend.name
         }
         
     except Exception as e:
@@ -547,7 +663,7 @@ async def get_personality_analytics():
             "development_level": personality_engine.get_development_level(),
             "interaction_count": personality_engine.get_interaction_count(),
             "growth_trend": "رو به رشد",  # نمونه
-            "favorite_topics": ["فناوری", "یادگیری", "کمک به دیگران"]  # نمونه
+            "favorite_topics": [topic for topic, _ in log_store.topic_counts("user_interactions", limit=3)]
         }
         
     except Exception as e:
@@ -559,7 +675,7 @@ async def get_dashboard_data():
     try:
         return {
             "overview": {
-                "total_conversations": memory_manager.get_memory_count().get("conversations", 0),
+                "total_conversations": log_store.count("learning_conversations"),
                 "personality_level": personality_engine.get_development_level(),
                 "web_searches": 0,  # نمونه
                 "files_processed": len(list(Path("data/uploads").glob("*"))) if Path("data/uploads").exists() else 0
@@ -1009,7 +1125,7 @@ async def system_health():
         health_status = {
             "overall": "healthy",
             "components": {
-                "ai_brain": ai_brain.is_loaded(),
+                "ai_brain": await ai_brain.is_loaded(),
                 "memory": memory_manager.get_memory_count().get("short_term", 0) >= 0,
                 "personality": personality_engine.get_development_level() > 0,
                 "speech": speech_handler.get_status()["initialized"],
@@ -1037,7 +1153,8 @@ async def system_health():
             "timestamp": datetime.now().isoformat()
         }
 
-async def process_user_message(message: str, thinking_callback=None) -> str:
+async def process_user_message(message: str, thinking_callback=None, stream_callback=None,
+                               draft_callback=None, speculation: dict = None, session_id: str = None) -> str:
     """پردازش پیام کاربر و تولید پاسخ"""
     try:
         # به‌روزرسانی اطلاعات کاربر از پیام
@@ -1046,30 +1163,30 @@ async def process_user_message(message: str, thinking_callback=None) -> str:
         # ذخیره در حافظه
         memory_manager.store_conversation("user", message)
         
+        # تحلیل یک‌باره پیام - بین شخصیت و همه مراحل مغز مشترک است
+        message_analysis = MessageAnalysis(message)
+        
         # تحلیل شخصیت و احساسات
-        personality_context = personality_engine.analyze_interaction(message)
+        personality_context = personality_engine.analyze_interaction(message, message_analysis=message_analysis)
         
         # تولید پاسخ توسط AI
         response = await ai_brain.generate_response(
             message=message,
-            context=memory_manager.get_relevant_context(message),
+            context=memory_manager.get_relevant_context(message, message_analysis=message_analysis),
             personality=personality_context,
-            thinking_callback=thinking_callback
+            thinking_callback=thinking_callback,
+            stream_callback=stream_callback,
+            message_analysis=message_analysis,
+            draft_callback=draft_callback,
+            speculation=speculation,
+            session_id=session_id
         )
         
         # ذخیره پاسخ در حافظه
         memory_manager.store_conversation("ai", response)
         
-        # ذخیره در حافظه کاربر
-        user_memory.remember_conversation(message, response)
-        
-        # یادگیری غیرمستقیم از مکالمه (ایده از پرامپت)
-        passive_result = personal_learning_system.passive_learning_from_conversation(message, response)
-        if passive_result["facts_learned"] > 0:
-            print(f"🔍 یادگیری غیرمستقیم: {passive_result['facts_learned']} اطلاعات جدید")
-        
-        # به‌روزرسانی شخصیت
-        personality_engine.update_from_interaction(message, response)
+        # یادگیری از مکالمه در پس‌زمینه - پاسخ منتظر آن نمی‌ماند
+        await learning_pipeline.submit("conversation_learning", message, response)
         
         return response
         
@@ -1079,6 +1196,25 @@ async def process_user_message(message: str, thinking_callback=None) -> str:
         print(f"جزئیات خطا: {traceback.format_exc()}")
         return "متأسفم، مشکلی پیش آمده. لطفاً دوباره تلاش کنید."
 
+async def learn_from_conversation(message: str, response: str):
+    """یادگیری پس از پاسخ (اجرا در صف یادگیری پس‌زمینه)
+
+    روی event loop اجرا می‌شود چون همان اشیائی را تغییر می‌دهد که مسیر درخواست می‌خواند؛
+    ذخیره فایل‌ها با تأخیر در thread جدای state_store انجام می‌شود
+    """
+    # ذخیره در حافظه کاربر
+    user_memory.remember_conversation(message, response)
+    
+    # یادگیری غیرمستقیم از مکالمه (ایده از پرامپت)
+    passive_result = personal_learning_system.passive_learning_from_conversation(message, response)
+    if passive_result["facts_learned"] > 0:
+        print(f"🔍 یادگیری غیرمستقیم: {passive_result['facts_learned']} اطلاعات جدید")
+    
+    # به‌روزرسانی شخصیت
+    personality_engine.update_from_interaction(message, response)
+
+learning_pipeline.register("conversation_learning", learn_from_conversation)
+
 async def send_thinking_message(message: str):
     """ارسال پیام میانی به کاربر"""
     try:
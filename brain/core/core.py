@@ -4,8 +4,8 @@
 """
 
 import asyncio
+import functools
 import json
-import requests
 import re
 from typing import Dict, List, Optional
 from datetime import datetime
@@ -14,6 +14,21 @@ import random
 from ..utils.web_search import WebSearchEngine
 from ..utils.dataset_manager import DatasetManager
 from ..utils.code_analyzer import code_analyzer
+from ..utils.ollama_client import OllamaClient, OllamaError
+from ..utils.model_registry import ModelRegistry
+from ..utils.llm_scheduler import GenerationScheduler, AdmissionRejected
+from ..utils.model_router import ModelRouter
+from ..utils.model_residency import ModelResidencyManager
+from ..utils.speculative_draft import SpeculativeDraftPolicy
+from ..utils.stage_graph import StageGraph
+from ..utils.learning_pipeline import learning_pipeline
+from ..utils.state_store import state_store
+from ..utils.log_store import log_store
+from ..utils.topic_index import LearnedTopicIndex
+from ..utils.keyword_matcher import KeywordMatcher
+from ..utils.message_analysis import MessageAnalysis, MessageLike
+from ..utils.generation_session import GenerationSessionManager
+from ..utils.prompt_fragments import prompt_fragments
 from .user_profiler import user_profiler
 from ..learning.dynamic_name_learning import dynamic_name_learning
 from ..learning.personal_learning_system import personal_learning_system
@@ -38,6 +53,65 @@ except ImportError:
     OPTIMIZATION_ENABLED = False
     print("⚠️ سیستم‌های بهینه‌سازی غیرفعال - حالت ساده")
 
+# نسخه قالب‌های prompt - با تغییر قالب‌ها افزایش یابد تا پاسخ‌های کش شده قدیمی استفاده نشوند
+PROMPT_TEMPLATE_VERSION = 1
+
+# درخواست‌های وابسته به وضعیت یا اطلاعات شخصی که پاسخشان نباید کش شود
+STATEFUL_KEYWORDS = KeywordMatcher({
+    "personal": [
+        "من", "منو", "مرا", "برام", "خودم", "اسمم", "اسم من", "یادت", "یادته", "یادت هست",
+        "گفتم", "گفتی", "قبلی", "قبلا", "قبلاً", "دیروز",
+        "my", "me", "remember", "you said"
+    ],
+    "time": ["امروز", "امشب", "فردا", "الان", "ساعت", "today", "now", "tomorrow"]
+}, whole_words=True)
+
+# کلمات کلیدی انتخاب مدل (ترتیب دسته‌ها = اولویت)
+MODEL_KEYWORDS = KeywordMatcher({
+    "code": ['کد', 'برنامه', 'function', 'class', 'def', 'import', 'python', 'javascript', 'html', 'css', 'sql', 'debug', 'error', 'bug'],
+    "reasoning": ['تحلیل', 'استدلال', 'منطق', 'چرا', 'علت', 'دلیل', 'مقایسه', 'بررسی', 'تفکر', 'reasoning', 'logic', 'analyze'],
+    "heavy": [
+        "مدل سنگین", "مدل قوی", "کیفیت بالا", "مدل بزرگ", "بهترین کیفیت",
+        "qwen", "llama4", "مدل 32b", "مدل 70b", "مدل خیلی بزرگ"
+    ]
+})
+
+# نشانه‌های وجود کد در پیام
+# (SELECT و INSERT حذف شدند: پیش‌تر با متن lowercase مقایسه می‌شدند و هرگز تطبیق نمی‌خوردند،
+# و پس از یکسان‌سازی حروف، کلمات عادی انگلیسی مثل select را کد تشخیص می‌دادند)
+CODE_INDICATORS = KeywordMatcher({
+    "code": [
+        'def ', 'function', 'class ', 'import ', 'from ',
+        'var ', 'let ', 'const ', 'if (', 'for (', 'while (',
+        'public class', '#include',
+        '```', 'کد', 'برنامه', 'اسکریپت', 'function',
+        '{', '}', '()', '=>', '==', '!=', '&&', '||'
+    ]
+})
+
+# کلمات کلیدی موضوعات پایه
+STATIC_TOPICS = KeywordMatcher({
+    "ورزش": ["فوتبال", "بسکتبال", "والیبال", "تنیس", "شنا", "بازی", "مسابقه", "تیم", "ورزشکار", "گل", "امتیاز"],
+    "موسیقی": ["آهنگ", "خواننده", "ساز", "موزیک", "کنسرت", "آلبوم", "ترانه", "نوازنده"],
+    "برنامه‌نویسی": ["کد", "برنامه", "python", "javascript", "html", "css", "function", "variable", "loop", "تابع", "متغیر"],
+    "آب و هوا": ["دما", "هوا", "بارش", "باران", "برف", "آفتابی", "ابری", "گرما", "سرما", "هواشناسی"],
+    "آشپزی": ["غذا", "پخت", "دستور", "مواد", "طبخ", "آشپزی", "خوراک", "طعام"],
+    "سفر": ["سفر", "مسافرت", "شهر", "کشور", "هتل", "بلیط", "گردشگری", "جاهای دیدنی"],
+    "تکنولوژی": ["کامپیوتر", "موبایل", "اپلیکیشن", "نرم‌افزار", "هوش مصنوعی", "AI", "فناوری"],
+    "سلامتی": ["سلامت", "بیماری", "دکتر", "دارو", "ورزش", "تغذیه", "بهداشت"],
+    "تحصیل": ["درس", "دانشگاه", "مدرسه", "امتحان", "یادگیری", "کتاب", "مطالعه"]
+})
+
+# کلمه -> موضوع برای استخراج داینامیک (فقط کلمات کامل)
+DYNAMIC_TOPIC_INDICATORS = KeywordMatcher({
+    "ورزش": ["فوتبال", "بسکتبال", "والیبال", "تنیس", "شنا", "بازی", "مسابقه", "تیم", "ورزشکار"],
+    "موسیقی": ["آهنگ", "موزیک", "ساز", "خواننده", "کنسرت", "آلبوم", "ترانه", "نوازنده"],
+    "سینما": ["فیلم", "سریال", "بازیگر", "کارگردان", "سینما", "نمایش"],
+    "برنامه‌نویسی": ["python", "javascript", "کد", "برنامه", "تابع", "متغیر"],
+    "آشپزی": ["غذا", "پخت", "آشپزی", "طبخ", "خوراک", "طعام", "دستور"],
+    "سفر": ["سفر", "مسافرت", "گردشگری", "هتل", "بلیط", "شهر", "کشور"]
+}, whole_words=True)
+
 class AIBrain:
     def __init__(self):
         # تنظیمات چند مدله - مدل‌های دانلود شده و کارآمد
@@ -55,6 +129,20 @@ class AIBrain:
         
         self.current_model = self.models["persian"]  # مدل پیش‌فرض
         self.ollama_url = "http://localhost:11434"
+        self.ollama = OllamaClient(self.ollama_url)  # کلاینت غیرهمزمان با connection pool مشترک
+        self.model_registry = ModelRegistry(self.ollama, self.models)  # وضعیت کش شده مدل‌ها
+        # صف و سقف همزمانی هر مدل - مدل سریع کنار مدل اصلی در حافظه می‌ماند
+        self.scheduler = GenerationScheduler(self.ollama, self.model_registry, co_resident=[self.models["fast"]])
+        self.router = ModelRouter(self.scheduler, fallback_model=self.models["fast"])  # مسیریابی بر اساس تأخیر اندازه‌گیری شده
+        # گرم نگه داشتن مدل‌هایی که احتمالاً لازم می‌شوند (مدل‌های سنگین فقط با اجازه سیاست مدل)
+        self.residency = ModelResidencyManager(
+            self.ollama, self.model_registry, self.scheduler,
+            default_models=[self.models["persian"], self.models["fast"]],
+            is_allowed=lambda model: self.allow_heavy_models or model not in self.heavy_models
+        )
+        self.speculative = SpeculativeDraftPolicy()  # پیش‌نویس مدل سریع برای پیام‌های کوتاه
+        self.generation_sessions = GenerationSessionManager()  # استفاده مجدد از context مدل در مکالمه
+        self.default_session_id = "default"  # برای فراخوانی‌هایی که شناسه مکالمه ندارند
         self.is_model_loaded = False
         self.conversation_history = []
         self.learning_data = []
@@ -68,6 +156,7 @@ class AIBrain:
         
         # سیستم ردیابی مکالمه
         self.current_conversation_topic = None
+        self.topic_index = LearnedTopicIndex("data/learning/learned_topics.json")  # ایندکس معکوس موضوعات یادگیری شده
         self.conversation_context_window = 10  # نگه‌داری آخرین 10 پیام
         self.topic_continuity_threshold = 3  # حداقل 3 پیام برای تشخیص موضوع مداوم
         
@@ -81,13 +170,17 @@ class AIBrain:
             "cache_hits": 0,
             "average_response_time": 0,
             "model_switches": 0,
-            "personal_interactions": 0
+            "personal_interactions": 0,
+            "last_stage_timings": {}  # زمان مراحل تحلیل پیش از تولید (میلی‌ثانیه)
         }
         
         # سیاست انتخاب مدل بر اساس سخت‌افزار فعلی
         self.allow_heavy_models = False  # پیش‌فرض: جلوگیری از مدل‌های بسیار سنگین
         self.heavy_models = {self.models["heavy_general"], self.models["ultra"]}
         
+        # یادگیری بعد از پاسخ در پس‌زمینه اجرا می‌شود
+        learning_pipeline.register("brain_learning", self._learn_from_response, transient=("message_analysis",))
+        
         print("� روباه - دستیار شخصی هوشمند آماده است!")
         print(f"👤 مالک: {self.personal_ai.owner_name}")
         print(f"🤝 سطح رابطه: {self.personal_ai.relationship_level.name}")
@@ -115,9 +208,11 @@ class AIBrain:
             await self._handle_physical_response(message, personal_response)
             
             # 3. انتخاب مدل بر اساس تحلیل شخصی
-            selected_model = self._select_model_for_personal_context(
+            requested_model = self.model_registry.resolve(self._select_model_for_personal_context(
                 message, personal_response
-            )
+            ))
+            self.residency.record_use(requested_model)
+            selected_model = self.router.route(requested_model, max_tokens=400, reason="personal")
             
             # 4. تولید پاسخ AI
             if thinking_callback:
@@ -212,52 +307,49 @@ class AIBrain:
         print(f"🔍 DEBUG: URL: {self.ollama_url}/api/generate")
         
         try:
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": model,
-                    "prompt": personal_prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.7,
-                        "top_p": 0.9,
-                        "max_tokens": 400
-                    }
+            data = await self.scheduler.generate(
+                model=model,
+                prompt=personal_prompt,
+                options={
+                    "temperature": 0.7,
+                    "top_p": 0.9,
+                    "max_tokens": 400
                 },
-                proxies={'http': None, 'https': None},
                 timeout=30
             )
             
-            print(f"🔍 DEBUG: Status Code: {response.status_code}")
+            self.model_registry.mark_success(model)
+            self.router.observe(model, data)
+            result = data.get("response", "متأسفم، نتوانستم پاسخ مناسبی تولید کنم.")
+            print(f"🔍 DEBUG: پاسخ دریافت شد: {result[:50]}...")
+            return result
             
-            if response.status_code == 200:
-                result = response.json().get("response", "متأسفم، نتوانستم پاسخ مناسبی تولید کنم.")
-                print(f"🔍 DEBUG: پاسخ دریافت شد: {result[:50]}...")
-                return result
-            else:
-                print(f"🔍 DEBUG: خطا: {response.text}")
-                return "مشکلی در پردازش پیش آمد."
-                
+        except AdmissionRejected as e:
+            print(f"🚦 درخواست در صف مدل پذیرفته نشد: {e}")
+            return "الان سرم خیلی شلوغه! لطفاً چند لحظه دیگه دوباره بپرس."
+        except OllamaError as e:
+            print(f"🔍 DEBUG: خطا: {e}")
+            self.model_registry.invalidate(model)
+            self.router.record_failure(model)
+            return "مشکلی در پردازش پیش آمد."
         except Exception as e:
             print(f"🔍 DEBUG: Exception: {e}")
             return "متأسفم، الان نمی‌تونم پاسخ بدم. لطفاً دوباره امتحان کن."
     
-    def _select_best_model(self, message: str, context: Dict = None) -> str:
+    def _select_best_model(self, message: MessageLike, context: Dict = None) -> str:
         """انتخاب بهترین مدل برای پیام - مدل‌های جدید 2025"""
         
-        # تحلیل نوع پیام
-        message_lower = message.lower()
-        
-        # کلمات کلیدی برای انواع مختلف
-        code_keywords = ['کد', 'برنامه', 'function', 'class', 'def', 'import', 'python', 'javascript', 'html', 'css', 'sql', 'debug', 'error', 'bug']
-        reasoning_keywords = ['تحلیل', 'استدلال', 'منطق', 'چرا', 'علت', 'دلیل', 'مقایسه', 'بررسی', 'تفکر', 'reasoning', 'logic', 'analyze']
+        # تحلیل نوع پیام - یک پیمایش برای همه دسته‌های کلمات کلیدی
+        message_analysis = MessageAnalysis.of(message)
+        message = message_analysis.text
+        matched = message_analysis.scan(MODEL_KEYWORDS)
         
         # انتخاب مدل بر اساس محتوا
-        if any(keyword in message_lower for keyword in code_keywords):
+        if "code" in matched:
             print("🤖 انتخاب مدل کد: deepseek-coder-v2")
             return self.models["code"]
             
-        elif any(keyword in message_lower for keyword in reasoning_keywords):
+        elif "reasoning" in matched:
             print("🧠 انتخاب مدل استدلال: deepseek-r1")
             return self.models["reasoning"]
             
@@ -266,7 +358,7 @@ class AIBrain:
             return self.models["general"]
         
         # استفاده از مدل سنگین فقط با درخواست صریح و اجازه
-        if self._is_heavy_model_requested(message_lower) and self.allow_heavy_models:
+        if "heavy" in matched and self.allow_heavy_models:
             print("🏋️ استفاده از مدل سنگین با درخواست کاربر")
             return self.models["heavy_general"]
         
@@ -276,11 +368,7 @@ class AIBrain:
 
     def _is_heavy_model_requested(self, message_lower: str) -> bool:
         """تشخیص درخواست صریح برای مدل‌های سنگین/کیفیت بالا"""
-        heavy_indicators = [
-            "مدل سنگین", "مدل قوی", "کیفیت بالا", "مدل بزرگ", "بهترین کیفیت",
-            "qwen", "llama4", "مدل 32b", "مدل 70b", "مدل خیلی بزرگ"
-        ]
-        return any(indicator in message_lower for indicator in heavy_indicators)
+        return MODEL_KEYWORDS.contains(message_lower, "heavy")
     
     def _build_personal_prompt(self, message: str, personal_context: Dict) -> str:
         """ساخت prompt شخصی‌سازی شده"""
@@ -404,7 +492,8 @@ class AIBrain:
             }
             
             # 3. انتخاب مدل بهینه
-            selected_model = self._select_best_model(message, relevant_contexts)
+            selected_model = self.router.route(self.model_registry.resolve(self._select_best_model(message, relevant_contexts)),
+                                               max_tokens=500, reason="optimized")
             if selected_model != self.current_model:
                 self.current_model = selected_model
                 self.performance_stats["model_switches"] += 1
@@ -420,7 +509,8 @@ class AIBrain:
                 message=message,
                 model=selected_model,
                 context=relevant_contexts,
-                priority=TaskPriority.HIGH
+                priority=QueuePriority.HIGH,
+                timeout=30.0
             )
             
             # انتظار برای تکمیل task
@@ -514,45 +604,29 @@ class AIBrain:
     
     async def _call_ollama_async(self, message: str, model: str, context: List) -> str:
         """فراخوانی غیرهمزمان Ollama"""
-        # پیاده‌سازی فراخوانی async به Ollama
-        # (این بخش باید با کتابخانه async HTTP مثل aiohttp پیاده‌سازی شود)
-        
-        # فعلاً از روش sync استفاده می‌کنیم
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            None, 
-            self._call_ollama_sync, 
-            message, model, context
-        )
-    
-    def _call_ollama_sync(self, message: str, model: str, context: List) -> str:
-        """فراخوانی همزمان Ollama"""
         try:
             # ساخت prompt
             prompt = self._build_prompt(message, context)
             
-            # فراخوانی API
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.7,
-                        "top_p": 0.9,
-                        "max_tokens": 500
-                    }
+            # فراخوانی API از طریق زمان‌بند و connection pool مشترک
+            data = await self.scheduler.generate(
+                model=model,
+                prompt=prompt,
+                options={
+                    "temperature": 0.7,
+                    "top_p": 0.9,
+                    "max_tokens": 500
                 },
-                proxies={'http': None, 'https': None},
                 timeout=30
             )
-            
-            if response.status_code == 200:
-                return response.json().get("response", "متأسفم، نتوانستم پاسخ مناسبی تولید کنم.")
-            else:
-                return "خطا در ارتباط با مدل AI."
-                
+            self.router.observe(model, data)
+            return data.get("response", "متأسفم، نتوانستم پاسخ مناسبی تولید کنم.")
+        
+        except OllamaError:
+            self.router.record_failure(model)
+            return "خطا در ارتباط با مدل AI."
+        except AdmissionRejected:
+            return "خطا در ارتباط با مدل AI."
         except Exception as e:
             print(f"خطا در فراخوانی Ollama: {e}")
             return "متأسفم، مشکلی در پردازش پیام شما پیش آمد."
@@ -607,6 +681,9 @@ class AIBrain:
             "performance": self.performance_stats,
             "cache": cache_stats,
             "task_queue": queue_stats,
+            "learning_pipeline": learning_pipeline.get_stats(),
+            "generation_sessions": self.generation_sessions.get_stats(),
+            "prompt_fragments": prompt_fragments.get_stats(),
             "context_manager": context_stats,
             "template_engine": template_stats
         }
@@ -635,48 +712,31 @@ class AIBrain:
         print("🧠 انتخاب مدل عمومی قدرتمند")
         return self.models["general"]
     
-    def _detect_code_in_message(self, message: str) -> bool:
+    def _detect_code_in_message(self, message: MessageLike) -> bool:
         """تشخیص وجود کد در پیام"""
-        code_indicators = [
-            'def ', 'function', 'class ', 'import ', 'from ',
-            'var ', 'let ', 'const ', 'if (', 'for (', 'while (',
-            'public class', '#include', 'SELECT', 'INSERT',
-            '```', 'کد', 'برنامه', 'اسکریپت', 'function',
-            '{', '}', '()', '=>', '==', '!=', '&&', '||'
-        ]
-        
-        message_lower = message.lower()
-        return any(indicator in message_lower for indicator in code_indicators)
+        message_analysis = MessageAnalysis.of(message)
+        return message_analysis.memo("has_code", lambda: message_analysis.contains(CODE_INDICATORS))
 
-    def is_loaded(self) -> bool:
-        """بررسی آماده بودن مدل"""
-        try:
-            # تنظیمات برای عدم استفاده از proxy برای localhost
-            proxies = {'http': None, 'https': None}
-            
-            response = requests.get(f"{self.ollama_url}/api/tags", proxies=proxies)
-            if response.status_code == 200:
-                models = response.json().get("models", [])
-                # بررسی وجود حداقل یکی از مدل‌ها
-                available_models = [model["name"] for model in models]
-                for model_name in self.models.values():
-                    if any(model_name in available for available in available_models):
-                        return True
-        except:
-            pass
-        return False
+    async def is_loaded(self) -> bool:
+        """بررسی آماده بودن مدل (از وضعیت کش شده رجیستری)"""
+        await self.model_registry.ensure_fresh()
+        # بررسی وجود حداقل یکی از مدل‌ها
+        return self.model_registry.is_ready()
     
     async def initialize_model(self):
         """راه‌اندازی اولیه مدل‌ها"""
         print("🧠 در حال بررسی مدل‌های موجود...")
         
         # بررسی مدل‌های موجود
-        available_models = await self._get_available_models()
+        await self.model_registry.refresh()
+        self.model_registry.start()  # به‌روزرسانی دوره‌ای وضعیت مدل‌ها در پس‌زمینه
+        # گرم‌سازی مدل‌های پیش‌بینی شده بر اساس ساعت و علایق کاربر
+        self.residency.start(lambda: user_profiler.user_profile["preferences"]["topics_of_interest"])
         
         # انتخاب بهترین مدل موجود
         best_model = None
         for model_type, model_name in self.models.items():
-            if any(model_name in available for available in available_models):
+            if self.model_registry.is_pulled(model_name):
                 best_model = model_name
                 print(f"✅ مدل {model_type} موجود: {model_name}")
                 break
@@ -697,7 +757,7 @@ class AIBrain:
 کاربر: سلام
 {dynamic_name_learning.get_current_name()}:"""
         
-        test_response = await self._generate_raw(test_prompt, None)
+        test_response = await self._generate_raw(test_prompt, None, model=best_model)
         if test_response and len(test_response.strip()) > 0:
             self.is_model_loaded = True
             print(f"✅ مدل با موفقیت بارگذاری شد! پاسخ تست: {test_response[:50]}...")
@@ -707,16 +767,9 @@ class AIBrain:
             self.is_model_loaded = True
     
     async def _get_available_models(self) -> List[str]:
-        """دریافت لیست مدل‌های موجود"""
-        try:
-            proxies = {'http': None, 'https': None}
-            response = requests.get(f"{self.ollama_url}/api/tags", proxies=proxies)
-            if response.status_code == 200:
-                models = response.json().get("models", [])
-                return [model["name"] for model in models]
-        except:
-            pass
-        return []
+        """دریافت لیست مدل‌های موجود (از وضعیت کش شده رجیستری)"""
+        await self.model_registry.ensure_fresh()
+        return self.model_registry.available_models()
     
     async def _pull_model(self, model_name: str = None):
         """دانلود مدل از Ollama"""
@@ -724,28 +777,30 @@ class AIBrain:
             model_name = self.current_model
             
         try:
-            # تنظیمات برای عدم استفاده از proxy برای localhost
-            proxies = {'http': None, 'https': None}
-            
             print(f"📥 در حال دانلود {model_name}...")
-            response = requests.post(
-                f"{self.ollama_url}/api/pull",
-                json={"name": model_name},
-                stream=True,
-                proxies=proxies
+            await self.ollama.pull(
+                model_name,
+                progress_callback=lambda data: print(f"📊 {data['status']}")
             )
-            
-            for line in response.iter_lines():
-                if line:
-                    data = json.loads(line)
-                    if "status" in data:
-                        print(f"📊 {data['status']}")
+            await self.model_registry.refresh()
                         
         except Exception as e:
             print(f"خطا در دانلود مدل: {e}")
     
-    async def generate_response(self, message: str, context: List[Dict] = None, personality: Dict = None, thinking_callback=None) -> str:
-        """تولید پاسخ با رویکرد جدید: AI اول، بعد بهبود با dataset + Context Awareness"""
+    async def generate_response(self, message: str, context: List[Dict] = None, personality: Dict = None, thinking_callback=None, stream_callback=None, message_analysis: MessageAnalysis = None,
+                                draft_callback=None, speculation: Dict = None, session_id: str = None) -> str:
+        """تولید پاسخ با رویکرد جدید: AI اول، بعد بهبود با dataset + Context Awareness
+        
+        اگر stream_callback داده شود، توکن‌های خام مدل به محض دریافت به آن ارسال می‌شوند.
+        message_analysis: تحلیل یک‌باره پیام که بین همه مراحل و زیرسیستم‌ها مشترک است.
+        draft_callback: برای هدف‌های تنظیم شده، پیش‌نویس مدل سریع پیش از پاسخ اصلی به آن ارسال می‌شود؛
+        speculation (در صورت ارسال) با نتیجه مقایسه پیش‌نویس و پاسخ اصلی پر می‌شود
+        session_id: شناسه مکالمه (اتصال WebSocket / conversation_id) - context مدل فقط بین نوبت‌های
+        همان مکالمه استفاده مجدد می‌شود
+        """
+        session_id = session_id or self.default_session_id
+        if message_analysis is None or message_analysis.text != message:
+            message_analysis = MessageAnalysis(message)
         
         # نمایش پیام ساده thinking
         if thinking_callback:
@@ -759,83 +814,88 @@ class AIBrain:
         # مرحله 1: تحلیل اولیه پیام و context
         print("🔍 مرحله 1: تحلیل پیام و context مکالمه...")
         
-        # مرحله 0: بررسی یادگیری نام
-        name_analysis = dynamic_name_learning.analyze_message_for_name(message)
-        if name_analysis:
-            print(f"🎭 تشخیص درخواست نام: {name_analysis['type']}")
-            name_result = dynamic_name_learning.learn_name(name_analysis)
-            if name_result.get("response"):
-                print(f"✅ پاسخ نام: {name_result['response'][:50]}...")
-                return name_result["response"]
-        
-        # مرحله 0.5: بررسی یادگیری شخصی (واژگان، قوانین، لحن)
-        personal_analysis = personal_learning_system.analyze_message_for_learning(message)
-        if personal_analysis:
-            print(f"🧠 تشخیص یادگیری شخصی: {personal_analysis['type']}")
-            learning_result = personal_learning_system.learn_from_analysis(personal_analysis)
-            if learning_result.get("response"):
-                print(f"✅ پاسخ یادگیری: {learning_result['response'][:50]}...")
-                return learning_result["response"]
-        
-        # مرحله 0.6: یادگیری ضمنی پروفایل کاربر
-        profile_updates = personal_learning_system.learn_profile_from_message(message)
-        if profile_updates:
-            print(f"👤 بروزرسانی پروفایل: {len(profile_updates)} مورد")
-        
-        # مرحله 0.7: مشاهده تعامل برای رشد رابطه و حافظه شخصی
-        try:
-            await self.personal_ai.observe_interaction(message, context={"context": context or []})
-        except Exception as e:
-            print(f"⚠️ خطا در مشاهده تعامل شخصی: {e}")
-        
-        # تشخیص موضوع فعلی و ارتباط با مکالمه قبلی
-        conversation_topic = self._detect_conversation_topic(message, context)
-        topic_continuity = self._check_topic_continuity(conversation_topic, context)
-        
-        print(f"📋 موضوع مکالمه: {conversation_topic}")
-        print(f"🔗 ادامه موضوع قبلی: {'بله' if topic_continuity else 'خیر'}")
+        # مراحل تحلیل به صورت گراف وابستگی اجرا می‌شوند؛ مراحل مستقل همزمان
+        graph = self._build_analysis_graph(message_analysis, context)
+        results, timings, halted_by = await graph.run()
+        self.performance_stats["last_stage_timings"] = timings
+        print(f"⏱️ زمان مراحل تحلیل (ms): {timings}")
         
-        # به‌روزرسانی موضوع فعلی مکالمه
-        if topic_continuity:
-            print(f"✅ ادامه مکالمه درباره: {self.current_conversation_topic}")
-        else:
-            # اگر درخواست تغییر موضوع بود، context رو محدود کن
-            if self._is_topic_change_request(message):
-                print("🔄 پاک کردن context قدیمی برای موضوع جدید")
-                # فقط آخرین پیام رو نگه دار
-                context = context[-1:] if context else []
-            
-            self.current_conversation_topic = conversation_topic
-            print(f"🆕 شروع موضوع جدید: {conversation_topic}")
+        # مرحله 0 / 0.5: پاسخ مستقیم یادگیری نام یا یادگیری شخصی
+        if halted_by and halted_by != "cache":
+            return results[halted_by]
         
-        code_analysis = self.analyze_user_code(message)
-        user_analysis = user_profiler.analyze_message(message)
-        user_profiler.update_profile(message, user_analysis)
-        analysis = self.dataset_manager.analyze_user_message(message, context)
+        topic_info = results["topic"] or {"context": context, "continuity": False}
+        context = topic_info["context"]
+        topic_continuity = topic_info["continuity"]
+        code_analysis = results["code"]
+        analysis = results["dataset"] or {}
         
         # اضافه کردن اطلاعات موضوع به تحلیل
         analysis['conversation_topic'] = self.current_conversation_topic
         analysis['topic_continuity'] = topic_continuity
         
+        # پاسخ کش شده - بدون فراخوانی مدل
+        if halted_by == "cache":
+            return await self._serve_cached_response(message_analysis, results["cache"], analysis, context,
+                                                     stream_callback)
+        
         print(f"📊 تحلیل: {analysis}")
         
-        # مرحله 2: جستجوی وب (اگر نیاز باشه)
-        web_info = None
-        if self.web_enabled and self.web_search.should_search_web(message, context):
-            if self.web_search.is_online():
-                print("🌐 مرحله 2: جستجوی اطلاعات از اینترنت...")
-                web_info = await self.web_search.search_and_summarize(message)
-        
-        # انتخاب بهترین مدل برای این پیام
-        selected_model = self._select_best_model(message, context)
+        web_info = results["web"]
+        
+        # انتخاب بهترین مدل برای این پیام - با جایگزینی مدل سریع اگر SLO تأخیر نقض شود
+        requested_model = results["model"] or self.model_registry.resolve(self._select_best_model(message_analysis, context))
+        self.residency.record_use(requested_model, (results["user_profile"] or {}).get("topics", []))
+        selected_model = self.router.route(requested_model, reason="chat")
         self.current_model = selected_model
         
         # مرحله 3: تولید پاسخ اولیه توسط AI مدل با context بهبود یافته
         print("🤖 مرحله 3: تولید پاسخ اولیه توسط مدل AI...")
-        initial_prompt = self._build_initial_prompt(message, context, personality, web_info, code_analysis)
-        initial_response = await self._generate_raw(initial_prompt, thinking_callback)
+        prompt_parts = self._build_prompt_parts(message, context, personality, web_info, code_analysis)
+        # پیش‌نویس سریع همزمان با مدل اصلی؛ پاسخ اصلی دیگر stream نمی‌شود تا با پیش‌نویس قاطی نشود
+        draft_task = None
+        if (draft_callback and selected_model != self.models["fast"]
+                and self.speculative.should_draft(self.dataset_manager._detect_intent(message_analysis),
+                                                  message_analysis.word_count)):
+            draft_task = asyncio.create_task(
+                self._generate_draft(self._compose_full_prompt(prompt_parts), draft_callback)
+            )
+            stream_callback = None
         
-        if not initial_response or initial_response.strip() == "":
+        try:
+            # نوبت‌های یک مکالمه پشت سر هم: هر نوبت از context نوبت قبلی همان مکالمه ادامه می‌دهد
+            generation_info = {}
+            async with self.generation_sessions.lock(session_id):
+                initial_prompt, session_context = self.generation_sessions.prepare(
+                    session_id, selected_model,
+                    stable_prompt=prompt_parts["system"],
+                    full_prompt=self._compose_full_prompt(prompt_parts),
+                    delta_prompt=self._compose_delta_prompt(prompt_parts)
+                )
+                initial_response = await self._generate_raw(initial_prompt, thinking_callback, stream_callback,
+                                                            model=selected_model,
+                                                            context_tokens=session_context,
+                                                            generation_info=generation_info)
+                if generation_info:
+                    self.generation_sessions.update(session_id, generation_info, used_context=session_context is not None)
+                else:
+                    self.generation_sessions.reset(session_id)
+            
+            model_answered = bool(initial_response and initial_response.strip())
+            if draft_task:
+                draft_result = await self._settle_draft(draft_task, initial_response if model_answered else None)
+                if speculation is not None:
+                    speculation.update(draft_result)
+                if draft_result["outcome"] == "draft_only":
+                    # مدل اصلی پاسخ نداد - همان پیش‌نویس ارسال شده پاسخ است
+                    initial_response, model_answered = draft_result["draft"], True
+                    selected_model = self.models["fast"]
+        finally:
+            # لغو درخواست (مثلاً قطع WebSocket) یا خطا - پیش‌نویس نوبت مدل سریع را نگه ندارد
+            if draft_task and not draft_task.done():
+                draft_task.cancel()
+        
+        if not model_answered:
             print("⚠️ مدل پاسخ خالی داد، استفاده از fallback")
             initial_response = self._generate_fallback_response(message, web_info)
         
@@ -853,41 +913,234 @@ class AIBrain:
             message, enhanced_response, analysis, web_info, code_analysis
         )
         
+        # ذخیره پاسخ (پیش از شخصی‌سازی) برای درخواست‌های مشابه بعدی - پاسخ fallback کش نمی‌شود
+        if model_answered and final_response and self._is_response_cacheable(message_analysis, topic_info):
+            smart_cache.cache_response(
+                message,
+                {"response": final_response, "model_used": selected_model},
+                scope=self._response_cache_scope(selected_model)
+            )
+        
         # مرحله 5.5: شخصی‌سازی نهایی بر اساس یادگیری‌ها
         final_response = self._personalize_final_response(
             message, final_response, analysis
         )
         
-        # مرحله 6: تبدیل به prompt برای یادگیری
-        print("🧠 مرحله 6: ایجاد prompt یادگیری...")
-        learning_prompt = self._create_learning_prompt(message, final_response, analysis, context)
+        # مرحله 6: یادگیری در پس‌زمینه - پاسخ منتظر آن نمی‌ماند
+        await learning_pipeline.submit("brain_learning", message, final_response, analysis, context, web_info,
+                                       message_analysis=message_analysis)
         
-        # ذخیره برای یادگیری
-        self._store_for_learning(message, final_response, context, web_info, learning_prompt)
-        self.dataset_manager.learn_from_interaction(message, final_response)
+        return final_response
+    
+    async def _learn_from_response(self, message: str, final_response: str, analysis: Dict, context: List[Dict] = None, web_info: Dict = None, message_analysis: MessageAnalysis = None):
+        """یادگیری از تعامل (اجرا در صف یادگیری پس‌زمینه)
+
+        message_analysis در ژورنال ذخیره نمی‌شود و پس از بازیابی دوباره از متن ساخته می‌شود.
+        """
+        message_analysis = MessageAnalysis.of(message_analysis or message)
+        # بخش همزمان فایل می‌نویسد - خارج از event loop تا درخواست‌ها منتظر نمانند
+        await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+            self._record_learning, message, final_response, analysis, context, web_info, message_analysis
+        ))
         
         # تحلیل عمیق شخصیت و ذخیره
         try:
             await deep_personality_learning.analyze_interaction(
                 message=message,
                 context={"context": context or []},
-                response=final_response
+                response=final_response,
+                message_analysis=message_analysis
             )
         except Exception as e:
             print(f"⚠️ خطا در تحلیل عمیق شخصیت: {e}")
+    
+    def _record_learning(self, message: str, final_response: str, analysis: Dict, context: List[Dict],
+                         web_info: Dict, message_analysis: MessageAnalysis):
+        """ساخت prompt یادگیری و ذخیره تعامل (اجرا در thread pool)"""
+        # تبدیل به prompt برای یادگیری
+        print("🧠 مرحله 6: ایجاد prompt یادگیری...")
+        learning_prompt = self._create_learning_prompt(message, final_response, analysis, context)
+        
+        # ذخیره برای یادگیری
+        self._store_for_learning(message, final_response, context, web_info, learning_prompt, analysis.get("conversation_topic"))
+        self.dataset_manager.learn_from_interaction(message, final_response, message_analysis=message_analysis)
+    
+    def _is_response_cacheable(self, message_analysis: MessageAnalysis, topic_info: Dict = None) -> bool:
+        """آیا پاسخ این پیام فقط به متن پیام بستگی دارد؟
         
+        درخواست‌های شخصی، وابسته به زمان، نیازمند جستجوی وب یا ادامه موضوع قبلی کش نمی‌شوند.
+        """
+        if not OPTIMIZATION_ENABLED:
+            return False
+        if topic_info and topic_info.get("continuity"):
+            return False
+        if message_analysis.contains(STATEFUL_KEYWORDS):
+            return False
+        if self.web_enabled and self.web_search.should_search_web(message_analysis.text, None, message_analysis):
+            return False
+        return True
+    
+    def _response_cache_scope(self, model: str) -> str:
+        """بخش کلید کش که پاسخ را تغییر می‌دهد: مدل، نام فعلی، قوانین شخصی و نسخه قالب"""
+        return "|".join([
+            model,
+            dynamic_name_learning.get_current_name(),
+            personal_learning_system.get_personalization_fingerprint(),
+            f"v{PROMPT_TEMPLATE_VERSION}"
+        ])
+    
+    async def _serve_cached_response(self, message_analysis: MessageAnalysis, cached_response: str, analysis: Dict,
+                                     context: List[Dict] = None, stream_callback=None) -> str:
+        """پاسخ از کش - بدون مدل، ولی شخصی‌سازی، stream و یادگیری مثل پاسخ مدل"""
+        self.performance_stats["cache_hits"] += 1
+        print("⚡ پاسخ از cache")
+        message = message_analysis.text
+        final_response = self._personalize_final_response(message, cached_response, analysis)
+        
+        # کلاینت‌های stream همان رویداد delta را (یکجا) دریافت می‌کنند
+        if stream_callback:
+            await stream_callback(final_response)
+        
+        # سؤال‌های تکراری هم به یادگیری دیتاست و شخصیت می‌رسند
+        await learning_pipeline.submit("brain_learning", message, final_response, analysis, context, None,
+                                       message_analysis=message_analysis)
         return final_response
     
+    def _build_analysis_graph(self, message_analysis: MessageAnalysis, context: List[Dict] = None) -> StageGraph:
+        """تعریف مراحل تحلیل پیش از تولید پاسخ و وابستگی‌های آن‌ها
+        
+        name → personal → {profile, observe, topic, code, user_analysis → user_profile}
+        topic → {dataset, model} → cache → web
+        همه مراحل از یک MessageAnalysis مشترک استفاده می‌کنند.
+        """
+        graph = StageGraph()
+        message = message_analysis.text
+        
+        # مرحله 0: بررسی یادگیری نام
+        def name_stage(results):
+            name_analysis = dynamic_name_learning.analyze_message_for_name(message)
+            if name_analysis:
+                print(f"🎭 تشخیص درخواست نام: {name_analysis['type']}")
+                name_result = dynamic_name_learning.learn_name(name_analysis)
+                if name_result.get("response"):
+                    print(f"✅ پاسخ نام: {name_result['response'][:50]}...")
+                    return name_result["response"]
+            return None
+        
+        # مرحله 0.5: بررسی یادگیری شخصی (واژگان، قوانین، لحن)
+        def personal_stage(results):
+            personal_analysis = personal_learning_system.analyze_message_for_learning(message)
+            if personal_analysis:
+                print(f"🧠 تشخیص یادگیری شخصی: {personal_analysis['type']}")
+                learning_result = personal_learning_system.learn_from_analysis(personal_analysis)
+                if learning_result.get("response"):
+                    print(f"✅ پاسخ یادگیری: {learning_result['response'][:50]}...")
+                    return learning_result["response"]
+            return None
+        
+        # مرحله 0.6: یادگیری ضمنی پروفایل کاربر
+        def profile_stage(results):
+            profile_updates = personal_learning_system.learn_profile_from_message(message)
+            if profile_updates:
+                print(f"👤 بروزرسانی پروفایل: {len(profile_updates)} مورد")
+            return profile_updates
+        
+        # مرحله 0.7: مشاهده تعامل برای رشد رابطه و حافظه شخصی
+        async def observe_stage(results):
+            await self.personal_ai.observe_interaction(message, context={"context": context or []},
+                                                       message_analysis=message_analysis)
+        
+        # تشخیص موضوع فعلی و ارتباط با مکالمه قبلی
+        def topic_stage(results):
+            topic_context = context
+            conversation_topic = self._detect_conversation_topic(message_analysis, topic_context)
+            topic_continuity = self._check_topic_continuity(conversation_topic, topic_context)
+            
+            print(f"📋 موضوع مکالمه: {conversation_topic}")
+            print(f"🔗 ادامه موضوع قبلی: {'بله' if topic_continuity else 'خیر'}")
+            
+            # به‌روزرسانی موضوع فعلی مکالمه
+            if topic_continuity:
+                print(f"✅ ادامه مکالمه درباره: {self.current_conversation_topic}")
+            else:
+                # اگر درخواست تغییر موضوع بود، context رو محدود کن
+                if self._is_topic_change_request(message):
+                    print("🔄 پاک کردن context قدیمی برای موضوع جدید")
+                    # فقط آخرین پیام رو نگه دار
+                    topic_context = topic_context[-1:] if topic_context else []
+                
+                self.current_conversation_topic = conversation_topic
+                print(f"🆕 شروع موضوع جدید: {conversation_topic}")
+            
+            return {"context": topic_context, "continuity": topic_continuity}
+        
+        def code_stage(results):
+            return self.analyze_user_code(message_analysis)
+        
+        def user_analysis_stage(results):
+            return user_profiler.analyze_message(message, message_analysis=message_analysis)
+        
+        def user_profile_stage(results):
+            user_analysis = results["user_analysis"]
+            if user_analysis is not None:
+                user_profiler.update_profile(message, user_analysis)
+            return user_analysis
+        
+        def topic_context_of(results):
+            return (results["topic"] or {"context": context})["context"]
+        
+        def dataset_stage(results):
+            return self.dataset_manager.analyze_user_message(message, topic_context_of(results),
+                                                             message_analysis=message_analysis)
+        
+        # انتخاب ایستای مدل - یک بار، هم برای scope کش و هم برای تولید
+        def model_stage(results):
+            return self.model_registry.resolve(self._select_best_model(message_analysis, topic_context_of(results)))
+        
+        # بررسی کش پاسخ - hit کل گراف (از جمله جستجوی وب) را متوقف می‌کند
+        def cache_stage(results):
+            if results["model"] is None or not self._is_response_cacheable(message_analysis, results["topic"]):
+                return None
+            cached = smart_cache.get_cached_response(message, scope=self._response_cache_scope(results["model"]))
+            if cached:
+                return cached["response"]["response"]
+            return None
+        
+        # مرحله 2: جستجوی وب (اگر نیاز باشه)
+        async def web_stage(results):
+            topic_context = topic_context_of(results)
+            if self.web_enabled and self.web_search.should_search_web(message, topic_context, message_analysis):
+                if self.web_search.is_online():
+                    print("🌐 مرحله 2: جستجوی اطلاعات از اینترنت...")
+                    return await self.web_search.search_and_summarize(message)
+            return None
+        
+        graph.add("name", name_stage, halts=True)
+        graph.add("personal", personal_stage, depends_on=["name"], halts=True)
+        # فقط تحلیل‌های بدون تغییر state در thread اجرا می‌شوند؛ مراحلی که singleton ها
+        # (پروفایل، موضوع فعلی مکالمه) را تغییر می‌دهند روی event loop می‌مانند
+        graph.add("profile", profile_stage, depends_on=["personal"])
+        graph.add("observe", observe_stage, depends_on=["personal"])
+        graph.add("topic", topic_stage, depends_on=["personal"])
+        graph.add("code", code_stage, depends_on=["personal"], in_thread=True)
+        graph.add("user_analysis", user_analysis_stage, depends_on=["personal"], in_thread=True)
+        graph.add("user_profile", user_profile_stage, depends_on=["user_analysis"])
+        graph.add("dataset", dataset_stage, depends_on=["topic"], in_thread=True)
+        graph.add("model", model_stage, depends_on=["topic"])
+        graph.add("cache", cache_stage, depends_on=["model", "dataset"], halts=True)
+        graph.add("web", web_stage, depends_on=["topic", "cache"])
+        return graph
+    
     def _build_prompt(self, message: str, context: List[Dict] = None, personality: Dict = None, web_info: Dict = None) -> str:
         """ساخت prompt کامل"""
         
-        system_prompt = f"""تو {dynamic_name_learning.get_current_name()} هستی، یک دستیار هوش مصنوعی فارسی که:
+        system_prompt = prompt_fragments.get("short_system_prompt", ("name",), lambda: f"""تو {dynamic_name_learning.get_current_name()} هستی، یک دستیار هوش مصنوعی فارسی که:
 - همیشه به فارسی پاسخ می‌دهی
 - دوستانه و مفید هستی
 - نام تو "{dynamic_name_learning.get_current_name()}" است
 - پاسخ‌هایت کوتاه و مفید باشند (حداکثر 2-3 جمله)
 - مستقیم به سؤال جواب می‌دهی
-- نام تو قابل تغییر است و از مکالمه یاد می‌گیری"""
+- نام تو قابل تغییر است و از مکالمه یاد می‌گیری""")
         
         # اضافه کردن اطلاعات وب اگر موجود باشه
         web_text = ""
@@ -913,75 +1166,168 @@ class AIBrain:
         
         return full_prompt
     
-    async def _generate_raw(self, prompt: str, thinking_callback=None) -> Optional[str]:
-        """تولید پاسخ خام از مدل"""
-        max_retries = 3  # افزایش تعداد تلاش‌ها
+    async def _generate_draft(self, prompt: str, draft_callback) -> Optional[str]:
+        """پیش‌نویس مدل سریع - به محض آماده شدن برای کاربر ارسال می‌شود"""
+        fast_model = self.models["fast"]
+        try:
+            data = await self.scheduler.generate(
+                model=fast_model,
+                prompt=prompt,
+                options=self._generation_options(),
+                timeout=20,
+                queue_deadline=2,
+                keep_alive=self.residency.keep_alive_for(fast_model)
+            )
+        except (OllamaError, AdmissionRejected, asyncio.TimeoutError) as e:
+            print(f"⚠️ پیش‌نویس سریع ساخته نشد: {e}")
+            self.speculative.record("failed")
+            return None
         
-        # تنظیمات برای عدم استفاده از proxy برای localhost
-        proxies = {
-            'http': None,
-            'https': None
-        }
+        self.router.observe(fast_model, data)
+        draft = data.get("response", "").strip()
+        if draft:
+            self.speculative.record("drafts")
+            print(f"⚡ پیش‌نویس سریع ارسال شد: {draft[:50]}...")
+            await draft_callback(draft)
+        return draft or None
+    
+    async def _settle_draft(self, draft_task: asyncio.Task, primary: Optional[str]) -> Dict:
+        """نتیجه پیش‌نویس پس از پایان مدل اصلی: confirmed / replaced / draft_only / cancelled"""
+        if primary and not draft_task.done():
+            # مدل اصلی زودتر رسید - پیش‌نویس دیگر لازم نیست
+            draft_task.cancel()
+            self.speculative.record("cancelled")
+            return {"outcome": "cancelled", "draft_model": self.models["fast"]}
         
-        # تست اتصال اولیه
         try:
-            test_response = requests.get(f"{self.ollama_url}/api/tags", proxies=proxies, timeout=5)
-            if test_response.status_code != 200:
-                print("❌ Ollama Server در دسترس نیست")
-                return None
-        except:
+            draft = await draft_task
+        except asyncio.CancelledError:
+            draft = None
+        
+        if not draft:
+            return {"outcome": "none", "draft_model": self.models["fast"]}
+        if not primary:
+            result = {"outcome": "draft_only"}
+        else:
+            result = self.speculative.judge(draft, primary)
+        self.speculative.record(result["outcome"])
+        print(f"⚡ نتیجه پیش‌نویس: {result['outcome']}")
+        return {**result, "draft": draft, "draft_model": self.models["fast"]}
+    
+    def _generation_options(self) -> Dict:
+        return {
+            "temperature": 0.7,
+            "top_p": 0.9,
+            "num_predict": 150,  # محدود کردن تعداد توکن‌های تولیدی
+            "stop": ["\n\nکاربر:", "\nکاربر:", "Human:", "User:", "\n\n"]  # توقف در نقاط مناسب
+        }
+    
+    async def _generate_raw(self, prompt: str, thinking_callback=None, stream_callback=None, model: str = None,
+                            context_tokens: List[int] = None, generation_info: Dict = None) -> Optional[str]:
+        """تولید پاسخ خام از مدل
+
+        model: مدل انتخاب شده همین درخواست (پیش‌فرض current_model) - در طول انتظارها ثابت می‌ماند
+        context_tokens: context برگشتی نوبت قبل - prompt فقط بخش جدید مکالمه است
+        generation_info: در صورت موفقیت با اطلاعات پایانی مدل (context، زمان‌ها) پر می‌شود
+        """
+        max_retries = 3  # افزایش تعداد تلاش‌ها
+        options = self._generation_options()
+        # درخواست‌های همزمان دیگر ممکن است current_model را عوض کنند
+        model = model or self.current_model
+        
+        # تست اتصال اولیه - از وضعیت کش شده، بدون درخواست اضافه
+        await self.model_registry.ensure_fresh()
+        if not self.model_registry.server_online:
             print("❌ خطا در اتصال به Ollama Server")
             return None
         
+        # نگه داشتن مدل در حافظه بین نوبت‌ها (بر اساس پیش‌بینی استفاده) و ادامه از context قبلی
+        extra = {"keep_alive": self.residency.keep_alive_for(model)}
+        if context_tokens:
+            extra["context"] = context_tokens
+        
         for attempt in range(max_retries):
             try:
                 print(f"🤖 تلاش {attempt + 1} برای تولید پاسخ...")
                 
-                response = requests.post(
-                    f"{self.ollama_url}/api/generate",
-                    json={
-                        "model": self.current_model,  # استفاده از مدل انتخاب شده
-                        "prompt": prompt,
-                        "stream": False,
-                        "options": {
-                            "temperature": 0.7,
-                            "top_p": 0.9,
-                            "num_predict": 150,  # محدود کردن تعداد توکن‌های تولیدی
-                            "stop": ["\n\nکاربر:", "\nکاربر:", "Human:", "User:", "\n\n"]  # توقف در نقاط مناسب
-                        }
-                    },
-                    timeout=60,  # افزایش timeout به 60 ثانیه
-                    proxies=proxies  # عدم استفاده از proxy
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
+                if stream_callback:
+                    generated_text, result = await self._generate_streaming(model, prompt, options, stream_callback, **extra)
+                else:
+                    result = await self.scheduler.generate(
+                        model=model,  # استفاده از مدل انتخاب شده
+                        prompt=prompt,
+                        options=options,
+                        timeout=60,  # افزایش timeout به 60 ثانیه
+                        **extra
+                    )
                     generated_text = result.get("response", "").strip()
-                    
-                    if generated_text:
-                        print(f"✅ پاسخ تولید شد: {generated_text[:50]}...")
-                        return generated_text
-                    else:
-                        print("⚠️ پاسخ خالی دریافت شد")
-                        
+                
+                self.model_registry.mark_success(model)
+                self.router.observe(model, result)
+                if generated_text:
+                    if generation_info is not None:
+                        generation_info.update({key: value for key, value in result.items() if key != "response"})
+                    print(f"✅ پاسخ تولید شد: {generated_text[:50]}...")
+                    return generated_text
                 else:
-                    print(f"❌ خطای HTTP: {response.status_code}")
+                    print("⚠️ پاسخ خالی دریافت شد")
                     
-            except requests.exceptions.Timeout:
+            except AdmissionRejected as e:
+                # صف مدل پر است - تلاش مجدد فقط بار را بیشتر می‌کند
+                print(f"🚦 درخواست در صف مدل پذیرفته نشد: {e}")
+                return None
+                
+            except asyncio.TimeoutError:
                 print(f"⏰ Timeout در تلاش {attempt + 1}")
+                self.model_registry.invalidate(model)
+                self.router.record_failure(model)
                 if attempt < max_retries - 1:
                     print("🔄 تلاش مجدد...")
                     await asyncio.sleep(3)  # افزایش زمان انتظار
                     
             except Exception as e:
                 print(f"❌ خطا در تولید پاسخ (تلاش {attempt + 1}): {e}")
+                if isinstance(e, OllamaError):
+                    self.model_registry.invalidate(model)
+                    self.router.record_failure(model)
                 if attempt < max_retries - 1:
                     await asyncio.sleep(2)
         
         print("❌ تمام تلاش‌ها ناموفق بود")
         return None
     
-    def _store_for_learning(self, user_message: str, ai_response: str, context: List[Dict], web_info: Dict = None, learning_prompt: str = None):
+    async def _generate_streaming(self, model: str, prompt: str, options: Dict, stream_callback, **extra):
+        """تولید پاسخ به صورت stream و ارسال هر توکن به callback
+
+        خروجی: (متن کامل، chunk پایانی مدل که context و زمان‌ها را دارد)
+        """
+        chunks = []
+        final_chunk = {}
+        try:
+            # نوبت مدل تا پایان stream نگه داشته می‌شود
+            async with self.scheduler.slot(model):
+                async for chunk in self.ollama.generate_stream(
+                    model=model,
+                    prompt=prompt,
+                    options=options,
+                    timeout=60,
+                    **extra
+                ):
+                    token = chunk.get("response", "")
+                    if token:
+                        chunks.append(token)
+                        await stream_callback(token)
+                    if chunk.get("done"):
+                        final_chunk = chunk
+        except (OllamaError, asyncio.TimeoutError) as e:
+            # اگر بخشی از پاسخ ارسال شده، تلاش مجدد باعث تکرار توکن‌ها می‌شود
+            if not chunks:
+                raise
+            print(f"⚠️ stream نیمه‌کاره قطع شد: {e}")
+        
+        return "".join(chunks).strip(), final_chunk
+    
+    def _store_for_learning(self, user_message: str, ai_response: str, context: List[Dict], web_info: Dict = None, learning_prompt: str = None, topic: str = None):
         """ذخیره داده برای یادگیری آینده"""
         learning_entry = {
             "timestamp": datetime.now().isoformat(),
@@ -991,20 +1337,18 @@ class AIBrain:
             "web_search_used": bool(web_info),
             "web_sources": web_info.get('sources', 0) if web_info else 0,
             "learning_prompt": learning_prompt,
+            "topic": topic,
             "quality_score": None  # بعداً با feedback کاربر پر می‌شود
         }
         
         self.learning_data.append(learning_entry)
         
-        # ذخیره در فایل
-        os.makedirs("data/learning", exist_ok=True)
-        with open("data/learning/conversations.jsonl", "a", encoding="utf-8") as f:
-            f.write(json.dumps(learning_entry, ensure_ascii=False) + "\n")
+        # ذخیره در log_store (فایل JSONL یا SQLite)
+        log_store.append("learning_conversations", learning_entry, topic=topic)
         
         # ذخیره prompt یادگیری جداگانه
         if learning_prompt:
-            with open("data/learning/learning_prompts.md", "a", encoding="utf-8") as f:
-                f.write(f"\n\n---\n\n{learning_prompt}")
+            log_store.append("learning_prompts", {"timestamp": learning_entry["timestamp"], "text": learning_prompt}, topic=topic)
         
         print("📚 داده‌های یادگیری ذخیره شد")
     
@@ -1071,7 +1415,12 @@ class AIBrain:
         return {
             "current_model": self.current_model,
             "available_models": self.models,
-            "is_loaded": self.is_model_loaded
+            "is_loaded": self.is_model_loaded,
+            "registry": self.model_registry.get_status(),
+            "scheduler": self.scheduler.get_stats(),
+            "router": self.router.get_stats(),
+            "residency": self.residency.get_status(),
+            "speculative": self.speculative.get_stats()
         }
     
     async def switch_model(self, model_type: str) -> bool:
@@ -1084,8 +1433,8 @@ class AIBrain:
         print(f"🔄 تغییر مدل به: {new_model}")
         
         # بررسی وجود مدل
-        available_models = await self._get_available_models()
-        if not any(new_model in available for available in available_models):
+        await self.model_registry.ensure_fresh()
+        if not self.model_registry.is_pulled(new_model):
             print(f"📥 دانلود مدل {new_model}...")
             await self._pull_model(new_model)
         
@@ -1093,6 +1442,14 @@ class AIBrain:
         print(f"✅ مدل تغییر یافت به: {new_model}")
         return True
 
+    async def close(self):
+        """بستن اتصال‌های باز به Ollama و ذخیره وضعیت‌های باقی‌مانده"""
+        await self.residency.stop()
+        await self.model_registry.stop()
+        await self.ollama.close()
+        await self.web_search.close()
+        state_store.flush_all()
+
     async def fine_tune_from_data(self):
         """Fine-tuning مدل بر اساس داده‌های جمع‌آوری شده"""
         # این بخش بعداً پیاده‌سازی می‌شود
@@ -1115,7 +1472,8 @@ class AIBrain:
         return {
             "web_enabled": self.web_enabled,
             "internet_connected": self.web_search.is_online() if hasattr(self, 'web_search') else False,
-            "search_engines": list(self.web_search.search_engines.keys()) if hasattr(self, 'web_search') else []
+            "search_engines": list(self.web_search.search_engines.keys()) if hasattr(self, 'web_search') else [],
+            "search_stats": self.web_search.get_stats() if hasattr(self, 'web_search') else {}
         }
     
     def _build_code_analysis_prompt(self, code_analysis: Dict) -> str:
@@ -1175,18 +1533,10 @@ class AIBrain:
         
         return prompt
 
-    def detect_code_in_message(self, message: str) -> bool:
+    def detect_code_in_message(self, message: MessageLike) -> bool:
         """تشخیص وجود کد در پیام"""
-        code_indicators = [
-            'def ', 'function', 'class ', 'import ', 'from ',
-            'var ', 'let ', 'const ', 'if (', 'for (', 'while (',
-            'public class', '#include', 'SELECT', 'INSERT',
-            '```', 'کد', 'برنامه', 'اسکریپت', 'function',
-            '{', '}', '()', '=>', '==', '!=', '&&', '||'
-        ]
-        
-        message_lower = message.lower()
-        return any(indicator in message_lower for indicator in code_indicators)
+        message_analysis = MessageAnalysis.of(message)
+        return message_analysis.memo("has_code", lambda: message_analysis.contains(CODE_INDICATORS))
     
     def extract_code_from_message(self, message: str) -> str:
         """استخراج کد از پیام"""
@@ -1214,12 +1564,12 @@ class AIBrain:
         
         return '\n'.join(code_lines).strip()
     
-    def analyze_user_code(self, message: str) -> Optional[Dict]:
+    def analyze_user_code(self, message: MessageLike) -> Optional[Dict]:
         """تحلیل کد کاربر"""
         if not self.detect_code_in_message(message):
             return None
         
-        code = self.extract_code_from_message(message)
+        code = self.extract_code_from_message(str(message))
         if not code:
             return None
         
@@ -1237,6 +1587,30 @@ class AIBrain:
     
     def _build_initial_prompt(self, message: str, context: List[Dict] = None, personality: Dict = None, web_info: Dict = None, code_analysis: Dict = None) -> str:
         """ساخت prompt اولیه برای مدل AI با context قوی‌تر"""
+        return self._compose_full_prompt(
+            self._build_prompt_parts(message, context, personality, web_info, code_analysis)
+        )
+    
+    def _compose_full_prompt(self, parts: Dict) -> str:
+        """prompt کامل: بخش ثابت + تاریخچه مکالمه + بخش این نوبت"""
+        return f"""{parts["system"]}
+
+{parts["conversation"]}
+{parts["turn"]}"""
+    
+    def _compose_delta_prompt(self, parts: Dict) -> str:
+        """فقط بخش این نوبت - ادامه context نوبت قبل (که پاسخ قبلی را هم دارد)"""
+        return f"""
+
+{parts["turn"]}"""
+    
+    def _build_prompt_parts(self, message: str, context: List[Dict] = None, personality: Dict = None, web_info: Dict = None, code_analysis: Dict = None) -> Dict:
+        """بخش‌های prompt اولیه
+
+        system: بخش ثابت بین نوبت‌ها (نام، رابطه، لحن، پروفایل) - کلید استفاده مجدد از context
+        conversation: تاریخچه مکالمه (فقط در prompt کامل)
+        turn: بخش مخصوص همین پیام (قوانین مرتبط، موضوع، وب، کد، پیام کاربر)
+        """
         
         # اعمال واژگان شخصی به پیام کاربر
         processed_message = personal_learning_system.apply_vocabulary_to_message(message)
@@ -1246,6 +1620,53 @@ class AIBrain:
         # دریافت قوانین فعال برای این context
         active_rules = personal_learning_system.get_active_rules_for_context(processed_message)
         
+        # بخش ثابت - فقط با تغییر یادگیری‌ها، نام یا سطح رابطه دوباره ساخته می‌شود
+        current_ai_name = dynamic_name_learning.get_current_name()
+        system_prompt = prompt_fragments.get(
+            "initial_system_prompt", ("personal_learning", "profile", "name"),
+            self._build_initial_system_prompt,
+            extra=self.personal_ai.relationship_level.name
+        )
+        
+        # ساخت context قوی‌تر از مکالمه
+        conversation_context = self._build_conversation_context(context)
+        
+        # تشخیص موضوع فعلی مکالمه
+        current_topic = self._detect_conversation_topic(processed_message, context)
+        
+        # اضافه کردن اطلاعات وب
+        web_text = ""
+        if web_info and web_info.get('summary'):
+            web_text = f"\n\nاطلاعات جدید از اینترنت:\n{web_info['summary']}\n"
+        
+        # اضافه کردن تحلیل کد
+        code_text = ""
+        if code_analysis:
+            code_text = f"\n\nتحلیل کد:\n{self._build_code_analysis_prompt(code_analysis)}\n"
+        
+        # قوانین شخصی یادگیری شده به پیام وابسته‌اند، پس جزء بخش این نوبت هستند
+        rules_text = ""
+        if active_rules:
+            rules_text = "\nقوانین شخصی یادگیری شده:\n"
+            for rule in active_rules[:3]:  # حداکثر 3 قانون
+                rules_text += f"- {rule['rule_text']}\n"
+        
+        turn_prompt = f"""{rules_text}
+موضوع فعلی مکالمه: {current_topic}
+{web_text}
+{code_text}
+
+کاربر: {processed_message}
+{current_ai_name}:"""
+        
+        return {
+            "system": system_prompt,
+            "conversation": conversation_context,
+            "turn": turn_prompt
+        }
+    
+    def _build_initial_system_prompt(self) -> str:
+        """بخش ثابت prompt اولیه: نام، رابطه، لحن و پروفایل"""
         # دریافت ترجیحات لحن
         tone_preferences = personal_learning_system.get_tone_preferences()
         
@@ -1263,12 +1684,6 @@ class AIBrain:
         # اضافه کردن سطح رابطه (دستیار شخصی)
         system_prompt += f"\n- سطح رابطه: {self.personal_ai.relationship_level.name}"
         
-        # اضافه کردن قوانین شخصی یادگیری شده
-        if active_rules:
-            system_prompt += "\n\nقوانین شخصی یادگیری شده:\n"
-            for rule in active_rules[:3]:  # حداکثر 3 قانون
-                system_prompt += f"- {rule['rule_text']}\n"
-        
         # اضافه کردن ترجیحات لحن
         if tone_preferences:
             tone_text = ""
@@ -1294,34 +1709,7 @@ class AIBrain:
         except Exception:
             pass
         
-        # ساخت context قوی‌تر از مکالمه
-        conversation_context = self._build_conversation_context(context)
-        
-        # تشخیص موضوع فعلی مکالمه
-        current_topic = self._detect_conversation_topic(processed_message, context)
-        
-        # اضافه کردن اطلاعات وب
-        web_text = ""
-        if web_info and web_info.get('summary'):
-            web_text = f"\n\nاطلاعات جدید از اینترنت:\n{web_info['summary']}\n"
-        
-        # اضافه کردن تحلیل کد
-        code_text = ""
-        if code_analysis:
-            code_text = f"\n\nتحلیل کد:\n{self._build_code_analysis_prompt(code_analysis)}\n"
-        
-        prompt = f"""{system_prompt}
-
-{conversation_context}
-
-موضوع فعلی مکالمه: {current_topic}
-{web_text}
-{code_text}
-
-کاربر: {processed_message}
-{current_ai_name}:"""
-        
-        return prompt
+        return system_prompt
     
     def _build_conversation_context(self, context: List[Dict] = None) -> str:
         """ساخت context قوی‌تر از مکالمه"""
@@ -1415,8 +1803,10 @@ class AIBrain:
         
         return text
     
-    def _detect_conversation_topic(self, current_message: str, context: List[Dict] = None) -> str:
+    def _detect_conversation_topic(self, current_message: MessageLike, context: List[Dict] = None) -> str:
         """تشخیص موضوع فعلی مکالمه - داینامیک و یادگیرنده"""
+        message_analysis = MessageAnalysis.of(current_message)
+        current_message = message_analysis.text
         
         # بررسی درخواست تغییر موضوع
         if self._is_topic_change_request(current_message):
@@ -1424,15 +1814,15 @@ class AIBrain:
             # پاک کردن موضوع فعلی
             self.current_conversation_topic = None
             # استخراج موضوع جدید از پیام
-            new_topic = self._extract_dynamic_topic(current_message)
+            new_topic = self._extract_dynamic_topic(message_analysis)
             return new_topic if new_topic != "مکالمه عمومی" else "موضوع جدید"
         
         # اگر context نداریم، موضوع رو از پیام فعلی استخراج کن
         if not context or len(context) == 0:
-            return self._extract_dynamic_topic(current_message)
+            return self._extract_dynamic_topic(message_analysis)
         
         # ابتدا موضوع پیام فعلی رو بررسی کن (نه کل context)
-        current_topic_from_message = self._extract_dynamic_topic(current_message)
+        current_topic_from_message = self._extract_dynamic_topic(message_analysis)
         
         # بررسی موضوع از یادگیری شده‌ها
         learned_topic = self._detect_learned_topic(current_message)
@@ -1440,7 +1830,7 @@ class AIBrain:
             return learned_topic
         
         # بررسی موضوع از موضوعات پایه
-        static_topic = self._detect_static_topic(current_message)
+        static_topic = self._detect_static_topic(message_analysis)
         if static_topic != "مکالمه عمومی":
             return static_topic
         
@@ -1453,29 +1843,10 @@ class AIBrain:
         
         return new_topic
     
-    def _detect_static_topic(self, text: str) -> str:
+    def _detect_static_topic(self, text: MessageLike) -> str:
         """تشخیص موضوع از موضوعات پایه"""
-        text_lower = text.lower()
-        
-        # کلمات کلیدی موضوعات پایه
-        static_topics = {
-            "ورزش": ["فوتبال", "بسکتبال", "والیبال", "تنیس", "شنا", "بازی", "مسابقه", "تیم", "ورزشکار", "گل", "امتیاز"],
-            "موسیقی": ["آهنگ", "خواننده", "ساز", "موزیک", "کنسرت", "آلبوم", "ترانه", "نوازنده"],
-            "برنامه‌نویسی": ["کد", "برنامه", "python", "javascript", "html", "css", "function", "variable", "loop", "تابع", "متغیر"],
-            "آب و هوا": ["دما", "هوا", "بارش", "باران", "برف", "آفتابی", "ابری", "گرما", "سرما", "هواشناسی"],
-            "آشپزی": ["غذا", "پخت", "دستور", "مواد", "طبخ", "آشپزی", "خوراک", "طعام"],
-            "سفر": ["سفر", "مسافرت", "شهر", "کشور", "هتل", "بلیط", "گردشگری", "جاهای دیدنی"],
-            "تکنولوژی": ["کامپیوتر", "موبایل", "اپلیکیشن", "نرم‌افزار", "هوش مصنوعی", "AI", "فناوری"],
-            "سلامتی": ["سلامت", "بیماری", "دکتر", "دارو", "ورزش", "تغذیه", "بهداشت"],
-            "تحصیل": ["درس", "دانشگاه", "مدرسه", "امتحان", "یادگیری", "کتاب", "مطالعه"]
-        }
-        
-        # امتیازدهی به هر موضوع
-        topic_scores = {}
-        for topic, keywords in static_topics.items():
-            score = sum(1 for keyword in keywords if keyword in text_lower)
-            if score > 0:
-                topic_scores[topic] = score
+        # امتیازدهی به هر موضوع (تعداد کلمات کلیدی یافت شده) در یک پیمایش
+        topic_scores = MessageAnalysis.of(text).scores(STATIC_TOPICS)
         
         # انتخاب موضوع با بالاترین امتیاز
         if topic_scores:
@@ -1485,32 +1856,13 @@ class AIBrain:
         return "مکالمه عمومی"
     
     def _detect_learned_topic(self, text: str) -> Optional[str]:
-        """تشخیص موضوع از موضوعات یادگیری شده"""
-        learned_topics = self._load_learned_topics()
-        
-        if not learned_topics:
-            return None
-        
-        text_lower = text.lower()
-        best_topic = None
-        best_score = 0
-        
-        for topic_name, topic_data in learned_topics.items():
-            keywords = topic_data.get('keywords', [])
-            score = sum(1 for keyword in keywords if keyword in text_lower)
-            
-            if score > best_score:
-                best_score = score
-                best_topic = topic_name
-        
+        """تشخیص موضوع از موضوعات یادگیری شده (از طریق ایندکس معکوس)"""
         # حداقل 2 کلمه مطابقت داشته باشه
-        return best_topic if best_score >= 2 else None
+        return self.topic_index.detect(text)
     
-    def _extract_dynamic_topic(self, text: str) -> str:
+    def _extract_dynamic_topic(self, text: MessageLike) -> str:
         """استخراج موضوع جدید از متن به صورت داینامیک"""
-        import re
-        
-        text_lower = text.lower()
+        message_analysis = MessageAnalysis.of(text)
         
         # حذف کلمات رایج و غیرمفید
         stop_words = [
@@ -1522,39 +1874,18 @@ class AIBrain:
             "دوست", "داری", "آخرین", "گوش", "دادی", "بود", "چی", "سؤال", "دارم", "یاد", "بگیرم"
         ]
         
+        # جستجوی کلمات کلیدی موضوعات شناخته شده - اولین کلمه یافت شده در متن
+        matched_topics = message_analysis.scan(DYNAMIC_TOPIC_INDICATORS)
+        if matched_topics:
+            return next(iter(matched_topics))
+        
         # استخراج کلمات مهم (اسامی، صفات، افعال مهم)
-        words = re.findall(r'[آ-ی]+', text_lower)
+        words = message_analysis.persian_words
         important_words = [word for word in words if len(word) > 3 and word not in stop_words]
         
         if not important_words:
             return "مکالمه عمومی"
         
-        # جستجوی کلمات کلیدی موضوعات شناخته شده
-        topic_indicators = {
-            "فوتبال": "ورزش", "بسکتبال": "ورزش", "والیبال": "ورزش", "تنیس": "ورزش", "شنا": "ورزش",
-            "بازی": "ورزش", "مسابقه": "ورزش", "تیم": "ورزش", "ورزشکار": "ورزش",
-            
-            "آهنگ": "موسیقی", "موزیک": "موسیقی", "ساز": "موسیقی", "خواننده": "موسیقی",
-            "کنسرت": "موسیقی", "آلبوم": "موسیقی", "ترانه": "موسیقی", "نوازنده": "موسیقی",
-            
-            "فیلم": "سینما", "سریال": "سینما", "بازیگر": "سینما", "کارگردان": "سینما",
-            "سینما": "سینما", "نمایش": "سینما",
-            
-            "python": "برنامه‌نویسی", "javascript": "برنامه‌نویسی", "کد": "برنامه‌نویسی",
-            "برنامه": "برنامه‌نویسی", "تابع": "برنامه‌نویسی", "متغیر": "برنامه‌نویسی",
-            
-            "غذا": "آشپزی", "پخت": "آشپزی", "آشپزی": "آشپزی", "طبخ": "آشپزی",
-            "خوراک": "آشپزی", "طعام": "آشپزی", "دستور": "آشپزی",
-            
-            "سفر": "سفر", "مسافرت": "سفر", "گردشگری": "سفر", "هتل": "سفر",
-            "بلیط": "سفر", "شهر": "سفر", "کشور": "سفر"
-        }
-        
-        # بررسی کلمات مهم برای تشخیص موضوع
-        for word in important_words:
-            if word in topic_indicators:
-                return topic_indicators[word]
-        
         # اگر موضوع مشخصی پیدا نشد، از اولین کلمه مهم استفاده کن
         if important_words:
             first_important = important_words[0]
@@ -1617,49 +1948,18 @@ class AIBrain:
         words = re.findall(r'[آ-ی]+', text_lower)
         keywords = [word for word in words if len(word) > 2 and word not in stop_words]
         
-        # بارگذاری موضوعات یادگیری شده
-        learned_topics = self._load_learned_topics()
-        
-        # اگر موضوع وجود داره، کلمات جدید اضافه کن
-        if topic_name in learned_topics:
-            existing_keywords = set(learned_topics[topic_name]['keywords'])
-            new_keywords = set(keywords)
-            combined_keywords = list(existing_keywords.union(new_keywords))
-            learned_topics[topic_name]['keywords'] = combined_keywords
-            learned_topics[topic_name]['usage_count'] += 1
-        else:
-            # موضوع جدید ایجاد کن
-            learned_topics[topic_name] = {
-                'keywords': keywords[:10],  # حداکثر 10 کلمه کلیدی
-                'created_at': datetime.now().isoformat(),
-                'usage_count': 1
-            }
-        
-        # ذخیره موضوعات یادگیری شده
-        self._save_learned_topics(learned_topics)
+        # به‌روزرسانی درجای موضوع و ایندکس - ذخیره روی دیسک با تأخیر
+        self.topic_index.learn(topic_name, keywords)
         
         print(f"🧠 موضوع جدید یاد گرفته شد: {topic_name} با {len(keywords)} کلمه کلیدی")
     
     def _load_learned_topics(self) -> Dict:
-        """بارگذاری موضوعات یادگیری شده"""
-        topics_file = "data/learning/learned_topics.json"
-        
-        if os.path.exists(topics_file):
-            try:
-                with open(topics_file, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except:
-                return {}
-        
-        return {}
+        """بارگذاری موضوعات یادگیری شده (فایل فقط در صورت تغییر mtime دوباره خوانده می‌شود)"""
+        return self.topic_index.get_topics()
     
     def _save_learned_topics(self, topics: Dict):
-        """ذخیره موضوعات یادگیری شده"""
-        topics_file = "data/learning/learned_topics.json"
-        os.makedirs("data/learning", exist_ok=True)
-        
-        with open(topics_file, "w", encoding="utf-8") as f:
-            json.dump(topics, f, ensure_ascii=False, indent=2)
+        """ذخیره موضوعات یادگیری شده (با تأخیر، توسط state_store)"""
+        self.topic_index.replace(topics)
     
     def _extract_topic_from_message(self, message: str) -> str:
         """استخراج موضوع از یک پیام"""
@@ -2009,7 +2309,6 @@ class AIBrain:
     
     def reset_learned_topics(self):
         """پاک کردن تمام موضوعات یادگیری شده"""
-        topics_file = "data/learning/learned_topics.json"
-        if os.path.exists(topics_file):
-            os.remove(topics_file)
+        # از طریق state_store تا ذخیره تأخیری قبلی موضوعات را برنگرداند
+        self._save_learned_topics({})
         print("🗑️ تمام موضوعات یادگیری شده پاک شدند")
@@ -13,6 +13,9 @@ import os
 from datetime import datetime
 from typing import List, Dict, Optional
 import hashlib
+from ..utils.log_store import log_store
+from ..utils.semantic_retrieval import semantic_retrieval
+from ..utils.vector_write_queue import VectorWriteQueue
 
 class MemoryManager:
     def __init__(self):
@@ -34,6 +37,16 @@ class MemoryManager:
             metadata={"description": "دانش و اطلاعات یادگیری شده"}
         )
         
+        # بازیابی معنایی مشترک: یک embedding برای هر متن، گزارش زمان و recall
+        semantic_retrieval.register_collection("conversations", self.conversations)
+        semantic_retrieval.register_collection("knowledge", self.knowledge)
+        
+        # نوشتن‌ها در صف جمع و در پس‌زمینه به صورت دسته‌ای embed و upsert می‌شوند
+        # (اگر مدل embedding در دسترس نباشد، ChromaDB خودش embed می‌کند)
+        self.vector_writes = VectorWriteQueue(embed_texts=semantic_retrieval.embed_texts)
+        self.vector_writes.register_collection("conversations", self.conversations)
+        self.vector_writes.register_collection("knowledge", self.knowledge)
+        
         # حافظه کوتاه‌مدت (در RAM)
         self.short_term_memory = []
         self.max_short_term = 50
@@ -69,8 +82,18 @@ class MemoryManager:
         
         print(f"💾 ذخیره شد: {role} - {content[:50]}...")
     
-    def get_relevant_context(self, query: str, limit: int = 5) -> List[Dict]:
-        """بازیابی context مرتبط برای query"""
+    def _query(self, name: str, collection, query, n_results: int) -> Dict:
+        """پرس‌وجو با embedding مشترک پیام؛ اگر مدل embedding در دسترس نبود، Chroma خودش embed می‌کند"""
+        results = semantic_retrieval.query_collection(name, collection, query, n_results)
+        if results is None:
+            results = collection.query(query_texts=[str(query)], n_results=n_results)
+        return results
+    
+    def get_relevant_context(self, query: str, limit: int = 5, message_analysis=None) -> List[Dict]:
+        """بازیابی context مرتبط برای query
+
+        message_analysis: تحلیل مشترک پیام - embedding آن یک بار محاسبه و بین همه بازیابی‌ها تقسیم می‌شود
+        """
         
         relevant_memories = []
         
@@ -80,10 +103,7 @@ class MemoryManager:
         
         # جستجو در vector database با error handling
         try:
-            results = self.conversations.query(
-                query_texts=[query],
-                n_results=min(limit, 10)
-            )
+            results = self._query("conversations", self.conversations, message_analysis or query, min(limit, 10))
             
             if results['documents'] and results['documents'][0]:
                 for i, doc in enumerate(results['documents'][0]):
@@ -106,31 +126,36 @@ class MemoryManager:
         return {
             "short_term": len(self.short_term_memory),
             "conversations": self.conversations.count(),
-            "knowledge": self.knowledge.count()
+            "knowledge": self.knowledge.count(),
+            "pending_writes": self.vector_writes.pending_count()
         }
     
+    def get_retrieval_stats(self, evaluate: bool = False) -> Dict:
+        """زمان بازیابی و recall@k (evaluate=True ارزیابی recall را دوباره اجرا می‌کند)"""
+        if evaluate:
+            semantic_retrieval.evaluate_recall()
+        return {**semantic_retrieval.get_stats(), "writes": self.vector_writes.get_stats()}
+    
+    def close(self):
+        """نوشتن آیتم‌های باقی‌مانده در صف برداری"""
+        self.vector_writes.close()
+    
     def _store_to_long_term(self, memory_item: Dict):
         """انتقال به حافظه بلندمدت"""
-        os.makedirs("data/memory/long_term", exist_ok=True)
-        
-        filename = f"data/memory/long_term/{memory_item['timestamp'][:10]}.jsonl"
-        with open(filename, "a", encoding="utf-8") as f:
-            f.write(json.dumps(memory_item, ensure_ascii=False) + "\n")
+        log_store.append("long_term_memory", memory_item, role=memory_item["role"])
     
     def _store_to_vector_db(self, memory_item: Dict):
-        """ذخیره در vector database"""
-        try:
-            self.conversations.add(
-                documents=[memory_item["content"]],
-                metadatas=[{
-                    "role": memory_item["role"],
-                    "timestamp": memory_item["timestamp"],
-                    **memory_item.get("metadata", {})
-                }],
-                ids=[memory_item["id"]]
-            )
-        except Exception as e:
-            print(f"خطا در ذخیره vector: {e}")
+        """ذخیره در vector database (از طریق صف نوشتن دسته‌ای)"""
+        self.vector_writes.enqueue(
+            "conversations",
+            memory_item["id"],
+            memory_item["content"],
+            {
+                "role": memory_item["role"],
+                "timestamp": memory_item["timestamp"],
+                **memory_item.get("metadata", {})
+            }
+        )
     
     def _is_important_conversation(self, content: str) -> bool:
         """تشخیص اهمیت مکالمه"""
@@ -151,27 +176,23 @@ class MemoryManager:
         """ذخیره دانش جدید"""
         knowledge_id = self._generate_id(f"{topic}_{information}")
         
-        try:
-            self.knowledge.add(
-                documents=[information],
-                metadatas=[{
-                    "topic": topic,
-                    "source": source,
-                    "timestamp": datetime.now().isoformat()
-                }],
-                ids=[knowledge_id]
-            )
-            print(f"📚 دانش جدید ذخیره شد: {topic}")
-        except Exception as e:
-            print(f"خطا در ذخیره دانش: {e}")
+        # upsert: ذخیره دوباره همان دانش فقط زمان و منبع را به‌روز می‌کند
+        self.vector_writes.enqueue(
+            "knowledge",
+            knowledge_id,
+            information,
+            {
+                "topic": topic,
+                "source": source,
+                "timestamp": datetime.now().isoformat()
+            }
+        )
+        print(f"📚 دانش جدید ذخیره شد: {topic}")
     
-    def search_knowledge(self, query: str, limit: int = 3) -> List[Dict]:
+    def search_knowledge(self, query: str, limit: int = 3, message_analysis=None) -> List[Dict]:
         """جستجو در دانش ذخیره شده"""
         try:
-            results = self.knowledge.query(
-                query_texts=[query],
-                n_results=limit
-            )
+            results = self._query("knowledge", self.knowledge, message_analysis or query, limit)
             
             knowledge_items = []
             if results['documents'] and results['documents'][0]:
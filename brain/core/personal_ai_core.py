@@ -10,6 +10,46 @@ from typing import Dict, List, Optional, Any
 from dataclasses import dataclass
 from enum import Enum
 import os
+from ..utils.state_store import state_store
+from ..utils.keyword_matcher import KeywordMatcher
+from ..utils.message_analysis import MessageAnalysis, MessageLike
+from ..utils.semantic_retrieval import semantic_retrieval
+
+# نوع درخواست (ترتیب دسته‌ها = اولویت)
+REQUEST_TYPES = KeywordMatcher({
+    "how_to": ["چطور", "راه", "روش"],
+    "what_is": ["چی", "چه", "کدام"],
+    "when": ["کی", "زمان"],
+    "task_request": ["کمک", "انجام", "بکن"],
+    "opinion": ["نظر", "فکر", "پیشنهاد"]
+})
+
+# حوزه‌های موضوعی
+DOMAINS = KeywordMatcher({
+    "work": ["کار", "شرکت", "پروژه", "تیم", "مدیریت"],
+    "tech": ["فناوری", "برنامه", "سیستم", "کد", "AI"],
+    "personal": ["شخصی", "خانواده", "سلامت", "تفریح"],
+    "learning": ["یادگیری", "آموزش", "مطالعه", "کتاب"]
+})
+
+# نشانه‌های سبک ارتباط و فوریت
+STYLE_INDICATORS = KeywordMatcher({
+    "urgent": ["فوری", "سریع", "الان", "زود", "عجله"],
+    "not_urgent": ["وقت داری", "فرصت", "آینده"],
+    "formal": ["لطفاً", "ممنون", "متشکرم", "احترام"],
+    "informal": ["سلام", "چطوری", "مرسی", "باشه"],
+    "polite": ["لطفاً", "ممنون", "متشکرم", "اگه ممکنه"]
+})
+
+# حالت عاطفی مالک (ترتیب دسته‌ها = اولویت)
+OWNER_EMOTIONS = KeywordMatcher({
+    "happy": ["خوشحال", "عالی", "فوق‌العاده", "😊", "😄"],
+    "stressed": ["استرس", "فشار", "عجله", "مشکل", "سخت"],
+    "tired": ["خسته", "کسل", "بی‌حال"],
+    "excited": ["هیجان", "جالب", "باحال", "کول"],
+    "frustrated": ["عصبانی", "کلافه", "اعصاب"],
+    "curious": ["جالب", "کنجکاو", "چطور", "چرا"]
+})
 
 class PersonalityTrait(Enum):
     LOYALTY = "loyalty"           # وفاداری
@@ -138,27 +178,25 @@ class PersonalAI:
             json.dump(profile, f, ensure_ascii=False, indent=2)
     
     def _save_state(self):
-        """ذخیره وضعیت دستیار شخصی"""
-        try:
-            os.makedirs("data/personality", exist_ok=True)
-            data = {
-                "owner_name": self.owner_name,
-                "ai_name": self.ai_name,
-                "birth_date": self.birth_date.isoformat(),
-                "relationship_level": self.relationship_level.value,
-                "personal_memories": {k: self._memory_to_dict(v) for k, v in self.personal_memories.items()},
-                "learned_patterns": self.learned_patterns,
-                "current_mood": self.current_mood,
-                "energy_level": self.energy_level,
-                "focus_area": self.focus_area,
-                "last_interaction": self.last_interaction.isoformat() if self.last_interaction else None,
-                "relationship_stats": self.relationship_stats,
-                "last_companion_note_at": self.last_companion_note_at.isoformat() if self.last_companion_note_at else None
-            }
-            with open(self.state_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"⚠️ خطا در ذخیره وضعیت دستیار شخصی: {e}")
+        """ذخیره وضعیت دستیار شخصی (با تأخیر، توسط state_store)"""
+        state_store.schedule_save(self.state_file, self._state_snapshot, indent=2)
+    
+    def _state_snapshot(self) -> Dict:
+        """وضعیت فعلی برای ذخیره"""
+        return {
+            "owner_name": self.owner_name,
+            "ai_name": self.ai_name,
+            "birth_date": self.birth_date.isoformat(),
+            "relationship_level": self.relationship_level.value,
+            "personal_memories": {k: self._memory_to_dict(v) for k, v in self.personal_memories.items()},
+            "learned_patterns": self.learned_patterns,
+            "current_mood": self.current_mood,
+            "energy_level": self.energy_level,
+            "focus_area": self.focus_area,
+            "last_interaction": self.last_interaction.isoformat() if self.last_interaction else None,
+            "relationship_stats": self.relationship_stats,
+            "last_companion_note_at": self.last_companion_note_at.isoformat() if self.last_companion_note_at else None
+        }
     
     def _load_state(self):
         """بارگذاری وضعیت دستیار شخصی"""
@@ -244,28 +282,29 @@ class PersonalAI:
         if "J" in owner_type:  # قضاوتی
             self.personality[PersonalityTrait.MEMORY] *= 1.1
     
-    async def process_interaction(self, message: str, context: Dict = None) -> Dict:
+    async def process_interaction(self, message: str, context: Dict = None, message_analysis: MessageAnalysis = None) -> Dict:
         """پردازش تعامل شخصی"""
+        message_analysis = MessageAnalysis.of(message_analysis or message)
         
         # به‌روزرسانی آمار
         self.relationship_stats["total_interactions"] += 1
         self.last_interaction = datetime.now()
         
         # تحلیل پیام برای یادگیری
-        learning_insights = self._analyze_for_learning(message, context)
+        learning_insights = self._analyze_for_learning(message_analysis, context)
         
         # به‌روزرسانی حافظه شخصی
         await self._update_personal_memory(learning_insights)
         
         # تشخیص وضعیت عاطفی مالک
-        owner_emotion = self._detect_owner_emotion(message)
+        owner_emotion = self._detect_owner_emotion(message_analysis)
         
         # انتخاب نحوه پاسخ بر اساس رابطه
         response_style = self._determine_response_style(owner_emotion)
         
         # تولید پاسخ شخصی‌سازی شده
         response = await self._generate_personal_response(
-            message, learning_insights, response_style
+            message, learning_insights, response_style, message_analysis=message_analysis
         )
         
         # یادگیری از نتیجه
@@ -280,15 +319,16 @@ class PersonalAI:
             "owner_emotion": owner_emotion
         }
     
-    async def observe_interaction(self, message: str, context: Dict = None) -> Dict:
+    async def observe_interaction(self, message: str, context: Dict = None, message_analysis: MessageAnalysis = None) -> Dict:
         """ثبت تعامل برای یادگیری بدون تولید پاسخ"""
+        message_analysis = MessageAnalysis.of(message_analysis or message)
         self.relationship_stats["total_interactions"] += 1
         self.last_interaction = datetime.now()
         
-        learning_insights = self._analyze_for_learning(message, context)
+        learning_insights = self._analyze_for_learning(message_analysis, context)
         await self._update_personal_memory(learning_insights)
         
-        owner_emotion = self._detect_owner_emotion(message)
+        owner_emotion = self._detect_owner_emotion(message_analysis)
         self._update_relationship_level()
         await self._update_learned_patterns(message, response="", context=context or {})
         
@@ -316,8 +356,9 @@ class PersonalAI:
         self.last_companion_note_at = datetime.now()
         self._save_state()
     
-    def _analyze_for_learning(self, message: str, context: Dict = None) -> Dict:
-        """تحلیل پیام برای یادگیری الگوها"""
+    def _analyze_for_learning(self, message: MessageLike, context: Dict = None) -> Dict:
+        """تحلیل پیام برای یادگیری الگوها (message می‌تواند MessageAnalysis مشترک باشد)"""
+        message = MessageAnalysis.of(message)
         insights = {}
         
         # تحلیل زمان (الگوهای کاری)
@@ -347,73 +388,42 @@ class PersonalAI:
         work_hours = self.owner_profile.get("work_hours", {"start": 9, "end": 18})
         return work_hours["start"] <= time.hour <= work_hours["end"]
     
-    def _classify_request(self, message: str) -> str:
+    def _classify_request(self, message: MessageLike) -> str:
         """طبقه‌بندی نوع درخواست"""
-        message_lower = message.lower()
-        
-        if any(word in message_lower for word in ["چطور", "راه", "روش"]):
-            return "how_to"
-        elif any(word in message_lower for word in ["چی", "چه", "کدام"]):
-            return "what_is"
-        elif any(word in message_lower for word in ["کی", "زمان"]):
-            return "when"
-        elif any(word in message_lower for word in ["کمک", "انجام", "بکن"]):
-            return "task_request"
-        elif any(word in message_lower for word in ["نظر", "فکر", "پیشنهاد"]):
-            return "opinion"
-        else:
-            return "general"
+        return MessageAnalysis.of(message).first_category(REQUEST_TYPES) or "general"
     
-    def _assess_urgency(self, message: str) -> str:
+    def _assess_urgency(self, message: MessageLike) -> str:
         """ارزیابی سطح فوریت"""
-        urgent_indicators = ["فوری", "سریع", "الان", "زود", "عجله"]
-        normal_indicators = ["وقت داری", "فرصت", "آینده"]
-        
-        message_lower = message.lower()
+        matched = MessageAnalysis.of(message).scan(STYLE_INDICATORS)
         
-        if any(indicator in message_lower for indicator in urgent_indicators):
+        if "urgent" in matched:
             return "high"
-        elif any(indicator in message_lower for indicator in normal_indicators):
+        elif "not_urgent" in matched:
             return "low"
         else:
             return "medium"
     
-    def _identify_domain(self, message: str) -> str:
+    def _identify_domain(self, message: MessageLike) -> str:
         """شناسایی حوزه موضوعی"""
-        domains = {
-            "work": ["کار", "شرکت", "پروژه", "تیم", "مدیریت"],
-            "tech": ["فناوری", "برنامه", "سیستم", "کد", "AI"],
-            "personal": ["شخصی", "خانواده", "سلامت", "تفریح"],
-            "learning": ["یادگیری", "آموزش", "مطالعه", "کتاب"]
-        }
-        
-        message_lower = message.lower()
-        
-        for domain, keywords in domains.items():
-            if any(keyword in message_lower for keyword in keywords):
-                return domain
-        
-        return "general"
+        return MessageAnalysis.of(message).first_category(DOMAINS) or "general"
     
-    def _analyze_communication_style(self, message: str) -> Dict:
+    def _analyze_communication_style(self, message: MessageLike) -> Dict:
         """تحلیل سبک ارتباط"""
+        message = MessageAnalysis.of(message)
         return {
             "formality": self._assess_formality(message),
             "emotion": self._detect_owner_emotion(message),
-            "length": len(message.split()),
-            "question_count": message.count("؟"),
+            "length": message.word_count,
+            "question_count": message.text.count("؟"),
             "politeness": self._assess_politeness(message)
         }
     
-    def _assess_formality(self, message: str) -> float:
+    def _assess_formality(self, message: MessageLike) -> float:
         """ارزیابی سطح رسمی بودن"""
-        formal_indicators = ["لطفاً", "ممنون", "متشکرم", "احترام"]
-        informal_indicators = ["سلام", "چطوری", "مرسی", "باشه"]
+        scores = MessageAnalysis.of(message).scores(STYLE_INDICATORS)
         
-        message_lower = message.lower()
-        
-        formal_count = sum(1 for indicator in formal_indicators if indicator in message_lower)
-        informal_count = sum(1 for indicator in informal_indicators if indicator in message_lower)
+        formal_count = scores.get("formal", 0)
+        informal_count = scores.get("informal", 0)
         
         total = formal_count + informal_count
         if total == 0:
@@ -421,32 +431,14 @@ class PersonalAI:
         
         return formal_count / total
     
-    def _assess_politeness(self, message: str) -> float:
+    def _assess_politeness(self, message: MessageLike) -> float:
         """ارزیابی سطح مؤدب بودن"""
-        polite_indicators = ["لطفاً", "ممنون", "متشکرم", "اگه ممکنه"]
-        message_lower = message.lower()
-        
-        polite_count = sum(1 for indicator in polite_indicators if indicator in message_lower)
+        polite_count = MessageAnalysis.of(message).scores(STYLE_INDICATORS).get("polite", 0)
         return min(1.0, polite_count / 3)
     
-    def _detect_owner_emotion(self, message: str) -> str:
+    def _detect_owner_emotion(self, message: MessageLike) -> str:
         """تشخیص حالت عاطفی مالک"""
-        emotions = {
-            "happy": ["خوشحال", "عالی", "فوق‌العاده", "😊", "😄"],
-            "stressed": ["استرس", "فشار", "عجله", "مشکل", "سخت"],
-            "tired": ["خسته", "کسل", "بی‌حال"],
-            "excited": ["هیجان", "جالب", "باحال", "کول"],
-            "frustrated": ["عصبانی", "کلافه", "اعصاب"],
-            "curious": ["جالب", "کنجکاو", "چطور", "چرا"]
-        }
-        
-        message_lower = message.lower()
-        
-        for emotion, indicators in emotions.items():
-            if any(indicator in message_lower for indicator in indicators):
-                return emotion
-        
-        return "neutral"
+        return MessageAnalysis.of(message).first_category(OWNER_EMOTIONS) or "neutral"
     
     def _determine_response_style(self, owner_emotion: str) -> Dict:
         """تعیین سبک پاسخ بر اساس حالت مالک"""
@@ -490,11 +482,12 @@ class PersonalAI:
     async def _generate_personal_response(self, 
                                         message: str, 
                                         insights: Dict, 
-                                        style: Dict) -> str:
+                                        style: Dict,
+                                        message_analysis: MessageAnalysis = None) -> str:
         """تولید پاسخ شخصی‌سازی شده"""
         
         # استفاده از حافظه شخصی
-        relevant_memories = self._get_relevant_memories(message)
+        relevant_memories = self._get_relevant_memories(message_analysis or message)
         
         # ساخت context شخصی
         personal_context = {
@@ -513,13 +506,23 @@ class PersonalAI:
         
         return response
     
-    def _get_relevant_memories(self, message: str, limit: int = 3) -> List[PersonalMemory]:
-        """دریافت حافظه‌های مرتبط"""
+    def _get_relevant_memories(self, message, limit: int = 3) -> List[PersonalMemory]:
+        """دریافت حافظه‌های مرتبط
+
+        شباهت معنایی از ایندکس برداری مشترک (همان embedding پیام) و شباهت کلمات هر دو بررسی می‌شوند
+        """
         relevant = []
         
-        for memory in self.personal_memories.values():
+        semantic_retrieval.sync_index(
+            "personal_memories",
+            {memory_id: memory.content for memory_id, memory in self.personal_memories.items()}
+        )
+        semantic_scores = semantic_retrieval.search_index("personal_memories", message)
+        message = str(message)
+        
+        for memory_id, memory in self.personal_memories.items():
             # محاسبه relevance بر اساس محتوا
-            relevance = self._calculate_memory_relevance(message, memory)
+            relevance = self._calculate_memory_relevance(message, memory, semantic_scores.get(memory_id, 0.0))
             
             if relevance > 0.3:
                 relevant.append((memory, relevance))
@@ -529,7 +532,7 @@ class PersonalAI:
         
         return [memory for memory, _ in relevant[:limit]]
     
-    def _calculate_memory_relevance(self, message: str, memory: PersonalMemory) -> float:
+    def _calculate_memory_relevance(self, message: str, memory: PersonalMemory, semantic_similarity: float = 0.0) -> float:
         """محاسبه ارتباط حافظه با پیام"""
         message_words = set(message.lower().split())
         memory_words = set(memory.content.lower().split())
@@ -541,6 +544,7 @@ class PersonalAI:
         intersection = len(message_words & memory_words)
         union = len(message_words | memory_words)
         jaccard = intersection / union if union > 0 else 0
+        similarity = max(jaccard, semantic_similarity)
         
         # ضریب اهمیت و اعتماد
         importance_factor = memory.importance
@@ -550,7 +554,7 @@ class PersonalAI:
         time_diff = datetime.now() - memory.last_used
         time_factor = max(0.1, 1 - (time_diff.days / 30))
         
-        return jaccard * importance_factor * confidence_factor * time_factor
+        return similarity * importance_factor * confidence_factor * time_factor
     
     async def _craft_personalized_response(self, 
                                          message: str, 
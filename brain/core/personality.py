@@ -6,8 +6,36 @@
 import json
 import os
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, List, Optional
+from collections import Counter
 import random
+from ..utils.log_store import log_store
+from ..utils.state_store import state_store
+from ..utils.keyword_matcher import KeywordMatcher
+from ..utils.message_analysis import MessageAnalysis, MessageLike
+
+# احساسات پیام (ترتیب دسته‌ها = اولویت)
+EMOTION_KEYWORDS = KeywordMatcher({
+    "مثبت": ["خوشحال", "عالی", "فوق‌العاده", "😊", "😄"],
+    "منفی": ["ناراحت", "غمگین", "بد", "😢", "😞"],
+    "کنجکاو": ["سؤال", "چطور", "چرا", "کجا", "؟"]
+})
+
+# موضوعات مورد علاقه
+TOPIC_KEYWORDS = KeywordMatcher({
+    "برنامه‌نویسی": ["کد", "برنامه", "پایتون", "جاوا", "وب"],
+    "علم": ["فیزیک", "شیمی", "ریاضی", "علم"],
+    "هنر": ["نقاشی", "موسیقی", "شعر", "هنر"],
+    "ورزش": ["فوتبال", "بسکتبال", "ورزش", "تمرین"],
+    "غذا": ["غذا", "آشپزی", "رستوران", "طبخ"],
+    "سفر": ["سفر", "مسافرت", "شهر", "کشور"]
+})
+
+# نشانه‌های ویژگی‌های مرتبط
+TRAIT_KEYWORDS = KeywordMatcher({
+    "question": ["سؤال", "؟"],
+    "polite": ["لطفاً", "ممنون", "متشکرم"]
+})
 
 class PersonalityEngine:
     def __init__(self):
@@ -73,24 +101,25 @@ class PersonalityEngine:
         self._save_personality(new_profile)
         return new_profile
     
-    def analyze_interaction(self, user_message: str) -> Dict:
+    def analyze_interaction(self, user_message: str, message_analysis: MessageAnalysis = None) -> Dict:
         """تحلیل تعامل کاربر و تنظیم شخصیت"""
+        message_analysis = MessageAnalysis.of(message_analysis or user_message)
         
         # تحلیل احساسات پیام
-        emotion = self._detect_emotion(user_message)
+        emotion = self._detect_emotion(message_analysis)
         
         # تنظیم حالت بر اساس پیام کاربر
-        self._adjust_mood(emotion, user_message)
+        self._adjust_mood(emotion, message_analysis)
         
         # شناسایی موضوعات مورد علاقه
-        topics = self._extract_topics(user_message)
+        topics = self._extract_topics(message_analysis)
         self._update_interests(topics)
         
         return {
             "level": self.development_level,
             "mood": self.current_mood,
             "detected_emotion": emotion,
-            "relevant_traits": self._get_relevant_traits(user_message),
+            "relevant_traits": self._get_relevant_traits(message_analysis),
             "topics": topics
         }
     
@@ -131,18 +160,9 @@ class PersonalityEngine:
 """
         return context
     
-    def _detect_emotion(self, message: str) -> str:
+    def _detect_emotion(self, message: MessageLike) -> str:
         """تشخیص احساسات پیام"""
-        message_lower = message.lower()
-        
-        if any(word in message_lower for word in ["خوشحال", "عالی", "فوق‌العاده", "😊", "😄"]):
-            return "مثبت"
-        elif any(word in message_lower for word in ["ناراحت", "غمگین", "بد", "😢", "😞"]):
-            return "منفی"
-        elif any(word in message_lower for word in ["سؤال", "چطور", "چرا", "کجا", "؟"]):
-            return "کنجکاو"
-        else:
-            return "خنثی"
+        return MessageAnalysis.of(message).first_category(EMOTION_KEYWORDS) or "خنثی"
     
     def _adjust_mood(self, emotion: str, message: str):
         """تنظیم حالت بر اساس احساسات"""
@@ -157,28 +177,12 @@ class PersonalityEngine:
         # تأثیر بر ویژگی‌های شخصیتی
         if emotion == "مثبت":
             self.traits["enthusiasm"] = min(1.0, self.traits["enthusiasm"] + 0.01)
-        elif "سؤال" in message.lower():
+        elif "سؤال" in MessageAnalysis.of(message).lower:
             self.traits["curiosity"] = min(1.0, self.traits["curiosity"] + 0.01)
     
-    def _extract_topics(self, message: str) -> List[str]:
+    def _extract_topics(self, message: MessageLike) -> List[str]:
         """استخراج موضوعات از پیام"""
-        topics = []
-        
-        topic_keywords = {
-            "برنامه‌نویسی": ["کد", "برنامه", "پایتون", "جاوا", "وب"],
-            "علم": ["فیزیک", "شیمی", "ریاضی", "علم"],
-            "هنر": ["نقاشی", "موسیقی", "شعر", "هنر"],
-            "ورزش": ["فوتبال", "بسکتبال", "ورزش", "تمرین"],
-            "غذا": ["غذا", "آشپزی", "رستوران", "طبخ"],
-            "سفر": ["سفر", "مسافرت", "شهر", "کشور"]
-        }
-        
-        message_lower = message.lower()
-        for topic, keywords in topic_keywords.items():
-            if any(keyword in message_lower for keyword in keywords):
-                topics.append(topic)
-        
-        return topics
+        return MessageAnalysis.of(message).matched_categories(TOPIC_KEYWORDS)
     
     def _update_interests(self, topics: List[str]):
         """به‌روزرسانی علایق"""
@@ -238,15 +242,16 @@ class PersonalityEngine:
         
         return ", ".join([trait_names.get(trait, trait) for trait in top_traits])
     
-    def _get_relevant_traits(self, message: str) -> Dict[str, float]:
+    def _get_relevant_traits(self, message: MessageLike) -> Dict[str, float]:
         """ویژگی‌های مرتبط با پیام"""
         relevant = {}
+        matched = MessageAnalysis.of(message).scan(TRAIT_KEYWORDS)
         
-        if "سؤال" in message.lower() or "؟" in message:
+        if "question" in matched:
             relevant["curiosity"] = self.traits["curiosity"]
             relevant["helpfulness"] = self.traits["helpfulness"]
         
-        if any(word in message.lower() for word in ["لطفاً", "ممنون", "متشکرم"]):
+        if "polite" in matched:
             relevant["friendliness"] = self.traits["friendliness"]
             relevant["formality"] = self.traits["formality"]
         
@@ -263,14 +268,22 @@ class PersonalityEngine:
             "experience_points": self.experience_points
         }
         
-        with open(self.interactions_file, "a", encoding="utf-8") as f:
-            f.write(json.dumps(interaction, ensure_ascii=False) + "\n")
+        log_store.append("personality_interactions", interaction)
+    
+    def get_interaction_count(self) -> int:
+        """تعداد کل تعاملات ثبت شده"""
+        return log_store.count("personality_interactions")
+    
+    def get_mood_trend(self, limit: int = 20) -> Optional[str]:
+        """حالت غالب در آخرین تعاملات"""
+        moods = [item.get("mood") for item in log_store.query("personality_interactions", limit=limit)]
+        moods = [mood for mood in moods if mood]
+        return Counter(moods).most_common(1)[0][0] if moods else None
     
     def _save_personality(self, profile: Dict):
-        """ذخیره شخصیت"""
+        """ذخیره شخصیت (با تأخیر، توسط state_store)"""
         profile["personality_traits"] = self.traits
         profile["experience_points"] = self.experience_points
         profile["last_updated"] = datetime.now().isoformat()
         
-        with open(self.personality_file, "w", encoding="utf-8") as f:
-            json.dump(profile, f, ensure_ascii=False, indent=2)
\ No newline at end of file
+        state_store.schedule_save(self.personality_file, lambda: profile, indent=2)
\ No newline at end of file
@@ -7,6 +7,7 @@ import json
 import os
 from datetime import datetime
 from typing import Dict, List, Optional
+from ..utils.state_store import state_store
 
 class UserMemory:
     def __init__(self):
@@ -42,12 +43,8 @@ class UserMemory:
         }
     
     def save_user_memory(self):
-        """ذخیره حافظه کاربر"""
-        try:
-            with open(self.memory_file, "w", encoding="utf-8") as f:
-                json.dump(self.user_data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"خطا در ذخیره حافظه: {e}")
+        """ذخیره حافظه کاربر (با تأخیر، توسط state_store)"""
+        state_store.schedule_save(self.memory_file, lambda: self.user_data, indent=2)
     
     def set_user_name(self, name: str):
         """تنظیم نام کاربر"""
@@ -119,7 +116,7 @@ class UserMemory:
         for conv in conversations:
             if (topic.lower() in conv.get("user_message", "").lower() or 
                 topic.lower() in conv.get("ai_response", "").lower() or
-                conv.get("topic", "").lower() == topic.lower()):
+                (conv.get("topic") or "").lower() == topic.lower()):
                 related.append(conv)
         
         return related[-count:] if related else []
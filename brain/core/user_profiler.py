@@ -9,6 +9,37 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import re
 from collections import defaultdict, Counter
+from ..utils.state_store import state_store
+from ..utils.log_store import log_store
+from ..utils.keyword_matcher import KeywordMatcher
+from ..utils.message_analysis import MessageAnalysis, MessageLike
+
+# موضوعات فنی و شخصی
+TOPIC_KEYWORDS = KeywordMatcher({
+    "برنامه‌نویسی": ["کد", "برنامه", "پایتون", "جاوا", "اسکریپت"],
+    "هوش مصنوعی": ["ai", "هوش مصنوعی", "یادگیری", "مدل"],
+    "وب": ["سایت", "وب", "html", "css", "react"],
+    "موبایل": ["اپ", "موبایل", "اندروید", "ios"],
+    "کار": ["کار", "شغل", "پروژه", "تیم"],
+    "تحصیل": ["دانشگاه", "درس", "امتحان", "مطالعه"],
+    "سرگرمی": ["فیلم", "بازی", "موزیک", "کتاب"],
+    "ورزش": ["ورزش", "فوتبال", "بسکتبال", "دویدن"]
+})
+
+# الگوهای احساسی
+EMOTION_PATTERNS = KeywordMatcher({
+    "خوشحالی": ["خوشحال", "عالی", "فوق‌العاده", "😊", "😄", "👍"],
+    "ناراحتی": ["ناراحت", "غمگین", "بد", "😢", "😞", "👎"],
+    "تعجب": ["واو", "عجیب", "باورنکردنی", "😮", "😲"],
+    "علاقه": ["جالب", "دوست دارم", "علاقه", "❤️", "💙"],
+    "سردرگمی": ["نمی‌فهمم", "گیج", "چطور", "❓", "🤔"]
+})
+
+# رسمی vs غیررسمی
+STYLE_INDICATORS = KeywordMatcher({
+    "formal": ["لطفاً", "متشکرم", "با احترام", "خواهشمند"],
+    "informal": ["سلام", "چطوری", "ممنون", "دمت گرم"]
+})
 
 class UserProfiler:
     def __init__(self):
@@ -35,16 +66,11 @@ class UserProfiler:
         print("👤 سیستم پروفایل کاربر راه‌اندازی شد")
     
     def _load_interaction_stats(self):
-        """بارگذاری آمار تعاملات از فایل"""
-        if os.path.exists(self.interactions_file):
-            try:
-                with open(self.interactions_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                    self.interaction_stats["total_messages"] = len(lines)
-                    print(f"📊 بارگذاری آمار: {len(lines)} تعامل")
-            except Exception as e:
-                print(f"⚠️ خطا در بارگذاری آمار تعاملات: {e}")
-                self.interaction_stats["total_messages"] = 0
+        """بارگذاری آمار تعاملات از log_store"""
+        total = log_store.count("user_interactions")
+        self.interaction_stats["total_messages"] = total
+        if total:
+            print(f"📊 بارگذاری آمار: {total} تعامل")
     
     def _load_or_create_profile(self) -> Dict:
         """بارگذاری یا ایجاد پروفایل کاربر"""
@@ -83,63 +109,26 @@ class UserProfiler:
         print("✨ پروفایل جدید کاربر ایجاد شد")
         return new_profile
     
-    def analyze_message(self, message: str) -> Dict:
+    def analyze_message(self, message: str, message_analysis: MessageAnalysis = None) -> Dict:
         """تحلیل پیام کاربر برای استخراج اطلاعات"""
+        message_analysis = MessageAnalysis.of(message_analysis or message)
         analysis = {
-            "topics": self._extract_topics(message),
-            "emotions": self._detect_emotions(message),
-            "personal_info": self._extract_personal_info(message),
-            "communication_style": self._analyze_style(message),
-            "complexity": self._measure_complexity(message)
+            "topics": self._extract_topics(message_analysis),
+            "emotions": self._detect_emotions(message_analysis),
+            "personal_info": self._extract_personal_info(message_analysis.text),
+            "communication_style": self._analyze_style(message_analysis),
+            "complexity": self._measure_complexity(message_analysis)
         }
         
         return analysis
     
-    def _extract_topics(self, message: str) -> List[str]:
+    def _extract_topics(self, message: MessageLike) -> List[str]:
         """استخراج موضوعات از پیام"""
-        topics = []
-        
-        # موضوعات فنی
-        tech_keywords = {
-            "برنامه‌نویسی": ["کد", "برنامه", "پایتون", "جاوا", "اسکریپت"],
-            "هوش مصنوعی": ["ai", "هوش مصنوعی", "یادگیری", "مدل"],
-            "وب": ["سایت", "وب", "html", "css", "react"],
-            "موبایل": ["اپ", "موبایل", "اندروید", "ios"]
-        }
-        
-        # موضوعات شخصی
-        personal_keywords = {
-            "کار": ["کار", "شغل", "پروژه", "تیم"],
-            "تحصیل": ["دانشگاه", "درس", "امتحان", "مطالعه"],
-            "سرگرمی": ["فیلم", "بازی", "موزیک", "کتاب"],
-            "ورزش": ["ورزش", "فوتبال", "بسکتبال", "دویدن"]
-        }
-        
-        message_lower = message.lower()
-        
-        for topic, keywords in {**tech_keywords, **personal_keywords}.items():
-            if any(keyword in message_lower for keyword in keywords):
-                topics.append(topic)
-        
-        return topics
+        return MessageAnalysis.of(message).matched_categories(TOPIC_KEYWORDS)
     
-    def _detect_emotions(self, message: str) -> List[str]:
+    def _detect_emotions(self, message: MessageLike) -> List[str]:
         """تشخیص احساسات از پیام"""
-        emotions = []
-        
-        emotion_patterns = {
-            "خوشحالی": ["خوشحال", "عالی", "فوق‌العاده", "😊", "😄", "👍"],
-            "ناراحتی": ["ناراحت", "غمگین", "بد", "😢", "😞", "👎"],
-            "تعجب": ["واو", "عجیب", "باورنکردنی", "😮", "😲"],
-            "علاقه": ["جالب", "دوست دارم", "علاقه", "❤️", "💙"],
-            "سردرگمی": ["نمی‌فهمم", "گیج", "چطور", "❓", "🤔"]
-        }
-        
-        message_lower = message.lower()
-        
-        for emotion, patterns in emotion_patterns.items():
-            if any(pattern in message_lower for pattern in patterns):
-                emotions.append(emotion)
+        emotions = MessageAnalysis.of(message).matched_categories(EMOTION_PATTERNS)
         
         return emotions if emotions else ["خنثی"]
     
@@ -176,16 +165,12 @@ class UserProfiler:
                 break
         
         return info
-    def _analyze_style(self, message: str) -> str:
+    def _analyze_style(self, message: MessageLike) -> str:
         """تحلیل سبک ارتباطی"""
-        message_lower = message.lower()
+        scores = MessageAnalysis.of(message).scores(STYLE_INDICATORS)
         
-        # رسمی vs غیررسمی
-        formal_indicators = ["لطفاً", "متشکرم", "با احترام", "خواهشمند"]
-        informal_indicators = ["سلام", "چطوری", "ممنون", "دمت گرم"]
-        
-        formal_count = sum(1 for indicator in formal_indicators if indicator in message_lower)
-        informal_count = sum(1 for indicator in informal_indicators if indicator in message_lower)
+        formal_count = scores.get("formal", 0)
+        informal_count = scores.get("informal", 0)
         
         if formal_count > informal_count:
             return "formal"
@@ -194,10 +179,9 @@ class UserProfiler:
         else:
             return "neutral"
     
-    def _measure_complexity(self, message: str) -> str:
+    def _measure_complexity(self, message: MessageLike) -> str:
         """اندازه‌گیری پیچیدگی پیام"""
-        words = len(message.split())
-        sentences = len([s for s in message.split('.') if s.strip()])
+        words = MessageAnalysis.of(message).word_count
         
         if words < 10:
             return "simple"
@@ -261,14 +245,11 @@ class UserProfiler:
             "complexity": analysis["complexity"]
         }
         
-        os.makedirs("data/personality", exist_ok=True)
-        with open(self.interactions_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(interaction, ensure_ascii=False) + '\n')
+        log_store.append("user_interactions", interaction)
     
     def _save_profile(self, profile: Dict):
-        """ذخیره پروفایل"""
-        with open(self.profile_file, 'w', encoding='utf-8') as f:
-            json.dump(profile, f, ensure_ascii=False, indent=2)
+        """ذخیره پروفایل (با تأخیر، توسط state_store)"""
+        state_store.schedule_save(self.profile_file, lambda: profile, indent=2)
     
     def get_personalized_context(self) -> str:
         """دریافت context شخصی‌سازی شده"""
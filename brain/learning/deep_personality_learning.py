@@ -13,6 +13,45 @@ from enum import Enum
 import numpy as np
 from collections import defaultdict, Counter
 import re
+from ..utils.state_store import state_store
+from ..utils.keyword_matcher import KeywordMatcher
+from ..utils.message_analysis import MessageAnalysis, MessageLike
+
+# همه نشانه‌های تحلیل عمیق در یک matcher - پیام فقط یک بار پیمایش می‌شود
+INDICATORS = KeywordMatcher({
+    # سبک ارتباط
+    "formal": ["لطفاً", "ممنون", "متشکرم", "احترام", "سپاس"],
+    "informal": ["سلام", "چطوری", "مرسی", "باشه", "اوکی"],
+    "direct": ["بگو", "انجام بده", "می‌خوام", "باید"],
+    "indirect": ["ممکنه", "اگه میشه", "بهتره", "چطور است"],
+    "tone_positive": ["خوب", "عالی", "فوق‌العاده", "خوشحال", "راضی"],
+    "tone_negative": ["بد", "ناراحت", "عصبانی", "مشکل", "سخت"],
+    "tone_neutral": ["معمولی", "متوسط", "نرمال"],
+    # تصمیم‌گیری
+    "decision": ["انتخاب", "تصمیم", "کدام", "بهتر", "پیشنهاد", "نظر"],
+    "urgency": ["سریع", "فوری", "الان", "زود"],
+    "deliberation": ["فکر", "بررسی", "مطالعه", "زمان"],
+    "info_request": ["جزئیات", "اطلاعات", "توضیح", "چطور", "چرا"],
+    # یادگیری
+    "learning": ["یاد بده", "توضیح", "چطور", "راه", "روش", "آموزش"],
+    "detail": ["جزئیات", "کامل", "دقیق", "همه چیز"],
+    "summary": ["خلاصه", "سریع", "مختصر", "کلی"],
+    "example": ["مثال", "نمونه", "عملی", "واقعی"],
+    "theory": ["تئوری", "نظری", "اصول", "مفهوم"],
+    # وضعیت عاطفی
+    "stress": [
+        "استرس", "فشار", "عجله", "مشکل", "سخت", "خسته",
+        "کلافه", "اعصاب", "نگران", "ضرب‌الاجل"
+    ],
+    "motivation_high": ["هیجان", "علاقه", "عاشق", "دوست دارم", "جالب"],
+    "motivation_low": ["مجبور", "باید", "ناچار", "کسل", "بی‌حوصله"],
+    "energy_high": ["پرانرژی", "فعال", "آماده", "بیا بریم"],
+    "energy_low": ["خسته", "کسل", "بی‌حال", "کم انرژی"],
+    # نوع پیام
+    "greeting": ["سلام", "درود", "صبح بخیر"],
+    "request": ["کمک", "انجام", "بکن"],
+    "gratitude": ["ممنون", "مرسی", "متشکر"]
+})
 
 class PersonalityDimension(Enum):
     COMMUNICATION_STYLE = "communication_style"
@@ -97,9 +136,11 @@ class DeepPersonalityLearning:
         self._load_state()
         print("🧬 سیستم یادگیری عمیق شخصیت راه‌اندازی شد")
     
-    async def analyze_interaction(self, message: str, context: Dict, response: str) -> Dict:
+    async def analyze_interaction(self, message: str, context: Dict, response: str, message_analysis: MessageAnalysis = None) -> Dict:
         """تحلیل عمیق تعامل"""
         
+        # تحلیل مشترک پیام - همه مراحل زیر از همین شیء استفاده می‌کنند
+        message = MessageAnalysis.of(message_analysis or message)
         analysis_results = {}
         
         # 1. تحلیل سبک ارتباط
@@ -129,22 +170,20 @@ class DeepPersonalityLearning:
         return analysis_results
     
     def _save_state(self):
-        """ذخیره وضعیت یادگیری عمیق"""
-        try:
-            os.makedirs("data/personality", exist_ok=True)
-            data = {
-                "owner_name": self.owner_name,
-                "personality_insights": self._serialize_insights(),
-                "behavior_patterns": self._serialize_patterns(),
-                "communication_analysis": self.communication_analysis,
-                "decision_patterns": self.decision_patterns,
-                "learning_patterns": self.learning_patterns,
-                "emotional_patterns": self.emotional_patterns
-            }
-            with open(self.state_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2, default=str)
-        except Exception as e:
-            print(f"⚠️ خطا در ذخیره وضعیت یادگیری عمیق: {e}")
+        """ذخیره وضعیت یادگیری عمیق (با تأخیر، توسط state_store)"""
+        state_store.schedule_save(self.state_file, self._state_snapshot, indent=2, default=str)
+    
+    def _state_snapshot(self) -> Dict:
+        """وضعیت فعلی برای ذخیره"""
+        return {
+            "owner_name": self.owner_name,
+            "personality_insights": self._serialize_insights(),
+            "behavior_patterns": self._serialize_patterns(),
+            "communication_analysis": self.communication_analysis,
+            "decision_patterns": self.decision_patterns,
+            "learning_patterns": self.learning_patterns,
+            "emotional_patterns": self.emotional_patterns
+        }
     
     def _load_state(self):
         """بارگذاری وضعیت یادگیری عمیق"""
@@ -220,21 +259,20 @@ class DeepPersonalityLearning:
             }
         return result
     
-    async def _analyze_communication_style(self, message: str, context: Dict) -> Dict:
+    async def _analyze_communication_style(self, message: MessageLike, context: Dict) -> Dict:
         """تحلیل سبک ارتباط"""
         
         analysis = {}
+        message_analysis = MessageAnalysis.of(message)
+        scores = message_analysis.scores(INDICATORS)
         
         # تحلیل طول پیام
-        word_count = len(message.split())
+        word_count = message_analysis.word_count
         analysis["message_length"] = "short" if word_count < 10 else "medium" if word_count < 30 else "long"
         
         # تحلیل رسمی بودن
-        formal_indicators = ["لطفاً", "ممنون", "متشکرم", "احترام", "سپاس"]
-        informal_indicators = ["سلام", "چطوری", "مرسی", "باشه", "اوکی"]
-        
-        formal_count = sum(1 for indicator in formal_indicators if indicator in message.lower())
-        informal_count = sum(1 for indicator in informal_indicators if indicator in message.lower())
+        formal_count = scores.get("formal", 0)
+        informal_count = scores.get("informal", 0)
         
         if formal_count > informal_count:
             analysis["formality"] = "formal"
@@ -244,23 +282,14 @@ class DeepPersonalityLearning:
             analysis["formality"] = "neutral"
         
         # تحلیل مستقیم بودن
-        direct_indicators = ["بگو", "انجام بده", "می‌خوام", "باید"]
-        indirect_indicators = ["ممکنه", "اگه میشه", "بهتره", "چطور است"]
-        
-        direct_count = sum(1 for indicator in direct_indicators if indicator in message.lower())
-        indirect_count = sum(1 for indicator in indirect_indicators if indicator in message.lower())
+        direct_count = scores.get("direct", 0)
+        indirect_count = scores.get("indirect", 0)
         
         analysis["directness"] = "direct" if direct_count > indirect_count else "indirect"
         
         # تحلیل احساسات در ارتباط
-        emotional_words = {
-            "positive": ["خوب", "عالی", "فوق‌العاده", "خوشحال", "راضی"],
-            "negative": ["بد", "ناراحت", "عصبانی", "مشکل", "سخت"],
-            "neutral": ["معمولی", "متوسط", "نرمال"]
-        }
-        
-        for emotion_type, words in emotional_words.items():
-            if any(word in message.lower() for word in words):
+        for emotion_type in ("positive", "negative", "neutral"):
+            if f"tone_{emotion_type}" in scores:
                 analysis["emotional_tone"] = emotion_type
                 break
         else:
@@ -271,32 +300,26 @@ class DeepPersonalityLearning:
         
         return analysis
     
-    async def _analyze_decision_patterns(self, message: str, context: Dict) -> Dict:
+    async def _analyze_decision_patterns(self, message: MessageLike, context: Dict) -> Dict:
         """تحلیل الگوهای تصمیم‌گیری"""
         
         analysis = {}
+        matched = MessageAnalysis.of(message).scan(INDICATORS)
         
         # تشخیص درخواست تصمیم‌گیری
-        decision_indicators = ["انتخاب", "تصمیم", "کدام", "بهتر", "پیشنهاد", "نظر"]
-        
-        if any(indicator in message.lower() for indicator in decision_indicators):
+        if "decision" in matched:
             analysis["involves_decision"] = True
             
             # تحلیل سرعت تصمیم‌گیری
-            urgency_indicators = ["سریع", "فوری", "الان", "زود"]
-            deliberation_indicators = ["فکر", "بررسی", "مطالعه", "زمان"]
-            
-            if any(indicator in message.lower() for indicator in urgency_indicators):
+            if "urgency" in matched:
                 analysis["decision_speed"] = "fast"
-            elif any(indicator in message.lower() for indicator in deliberation_indicators):
+            elif "deliberation" in matched:
                 analysis["decision_speed"] = "deliberate"
             else:
                 analysis["decision_speed"] = "normal"
             
             # تحلیل نیاز به اطلاعات
-            info_request_indicators = ["جزئیات", "اطلاعات", "توضیح", "چطور", "چرا"]
-            
-            if any(indicator in message.lower() for indicator in info_request_indicators):
+            if "info_request" in matched:
                 analysis["information_need"] = "high"
             else:
                 analysis["information_need"] = "low"
@@ -310,35 +333,28 @@ class DeepPersonalityLearning:
         
         return analysis
     
-    async def _analyze_learning_preferences(self, message: str, response: str) -> Dict:
+    async def _analyze_learning_preferences(self, message: MessageLike, response: str) -> Dict:
         """تحلیل ترجیحات یادگیری"""
         
         analysis = {}
+        matched = MessageAnalysis.of(message).scan(INDICATORS)
         
         # تشخیص درخواست یادگیری
-        learning_indicators = ["یاد بده", "توضیح", "چطور", "راه", "روش", "آموزش"]
-        
-        if any(indicator in message.lower() for indicator in learning_indicators):
+        if "learning" in matched:
             analysis["is_learning_request"] = True
             
             # تحلیل سطح جزئیات مورد نیاز
-            detail_indicators = ["جزئیات", "کامل", "دقیق", "همه چیز"]
-            summary_indicators = ["خلاصه", "سریع", "مختصر", "کلی"]
-            
-            if any(indicator in message.lower() for indicator in detail_indicators):
+            if "detail" in matched:
                 analysis["detail_preference"] = "detailed"
-            elif any(indicator in message.lower() for indicator in summary_indicators):
+            elif "summary" in matched:
                 analysis["detail_preference"] = "summary"
             else:
                 analysis["detail_preference"] = "medium"
             
             # تحلیل ترجیح مثال
-            example_indicators = ["مثال", "نمونه", "عملی", "واقعی"]
-            theory_indicators = ["تئوری", "نظری", "اصول", "مفهوم"]
-            
-            if any(indicator in message.lower() for indicator in example_indicators):
+            if "example" in matched:
                 analysis["example_preference"] = "practical"
-            elif any(indicator in message.lower() for indicator in theory_indicators):
+            elif "theory" in matched:
                 analysis["example_preference"] = "theoretical"
             else:
                 analysis["example_preference"] = "balanced"
@@ -352,41 +368,28 @@ class DeepPersonalityLearning:
         
         return analysis
     
-    async def _analyze_emotional_state(self, message: str, context: Dict) -> Dict:
+    async def _analyze_emotional_state(self, message: MessageLike, context: Dict) -> Dict:
         """تحلیل وضعیت عاطفی"""
         
         analysis = {}
+        message_analysis = MessageAnalysis.of(message)
+        scores = message_analysis.scores(INDICATORS)
         
         # تشخیص نشانه‌های استرس
-        stress_indicators = [
-            "استرس", "فشار", "عجله", "مشکل", "سخت", "خسته", 
-            "کلافه", "اعصاب", "نگران", "ضرب‌الاجل"
-        ]
-        
-        stress_score = sum(1 for indicator in stress_indicators if indicator in message.lower())
+        stress_score = scores.get("stress", 0)
         analysis["stress_level"] = min(1.0, stress_score / 3)
         
         # تشخیص انگیزه
-        motivation_indicators = {
-            "high": ["هیجان", "علاقه", "عاشق", "دوست دارم", "جالب"],
-            "low": ["مجبور", "باید", "ناچار", "کسل", "بی‌حوصله"]
-        }
-        
-        for level, indicators in motivation_indicators.items():
-            if any(indicator in message.lower() for indicator in indicators):
+        for level in ("high", "low"):
+            if f"motivation_{level}" in scores:
                 analysis["motivation_level"] = level
                 break
         else:
             analysis["motivation_level"] = "medium"
         
         # تشخیص سطح انرژی
-        energy_indicators = {
-            "high": ["پرانرژی", "فعال", "آماده", "بیا بریم"],
-            "low": ["خسته", "کسل", "بی‌حال", "کم انرژی"]
-        }
-        
-        for level, indicators in energy_indicators.items():
-            if any(indicator in message.lower() for indicator in indicators):
+        for level in ("high", "low"):
+            if f"energy_{level}" in scores:
                 analysis["energy_level"] = level
                 break
         else:
@@ -396,7 +399,7 @@ class DeepPersonalityLearning:
         if analysis["stress_level"] > 0.5:
             self.emotional_patterns["stress_indicators"].append({
                 "timestamp": datetime.now(),
-                "message": message[:50],
+                "message": message_analysis.text[:50],
                 "stress_level": analysis["stress_level"]
             })
         
@@ -434,18 +437,19 @@ class DeepPersonalityLearning:
         
         return new_patterns
     
-    def _classify_message_type(self, message: str) -> str:
+    def _classify_message_type(self, message: MessageLike) -> str:
         """طبقه‌بندی نوع پیام"""
         
-        message_lower = message.lower()
+        message_analysis = MessageAnalysis.of(message)
+        matched = message_analysis.scan(INDICATORS)
         
-        if any(word in message_lower for word in ["سلام", "درود", "صبح بخیر"]):
+        if "greeting" in matched:
             return "greeting"
-        elif "؟" in message:
+        elif "؟" in message_analysis.text:
             return "question"
-        elif any(word in message_lower for word in ["کمک", "انجام", "بکن"]):
+        elif "request" in matched:
             return "request"
-        elif any(word in message_lower for word in ["ممنون", "مرسی", "متشکر"]):
+        elif "gratitude" in matched:
             return "gratitude"
         else:
             return "general"
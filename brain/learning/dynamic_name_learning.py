@@ -9,6 +9,8 @@ import re
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass
+from ..utils.state_store import state_store
+from ..utils.prompt_fragments import prompt_fragments
 
 @dataclass
 class NameLearningEvent:
@@ -48,19 +50,19 @@ class DynamicNameLearning:
                 print(f"⚠️ خطا در بارگذاری تاریخچه نام: {e}")
     
     def _save_learning_history(self):
-        """ذخیره تاریخچه یادگیری"""
-        os.makedirs("data/personality", exist_ok=True)
-        
-        data = {
+        """ذخیره تاریخچه یادگیری (با تأخیر، توسط state_store)"""
+        prompt_fragments.bump("name")
+        state_store.schedule_save(self.learning_file, self._learning_snapshot, indent=2)
+    
+    def _learning_snapshot(self) -> Dict:
+        """تاریخچه یادگیری فعلی برای ذخیره"""
+        return {
             "current_name": self.current_name,
             "name_confidence": self.name_confidence,
             "learning_history": self.learning_history,
             "name_suggestions": self.name_suggestions,
             "last_updated": datetime.now().isoformat()
         }
-        
-        with open(self.learning_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
     
     def analyze_message_for_name(self, message: str) -> Optional[Dict]:
         """تحلیل پیام برای یادگیری نام"""
@@ -3,12 +3,15 @@
 یادگیری واژگان، قوانین، و ترجیحات از مکالمه
 """
 
+import hashlib
 import json
 import os
 import re
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass
+from ..utils.state_store import state_store
+from ..utils.prompt_fragments import prompt_fragments
 
 @dataclass
 class LearningEvent:
@@ -77,10 +80,13 @@ class PersonalLearningSystem:
                 print(f"⚠️ خطا در بارگذاری پروفایل: {e}")
     
     def _save_learning_data(self):
-        """ذخیره داده‌های یادگیری"""
-        os.makedirs("data/personality", exist_ok=True)
-        
-        data = {
+        """ذخیره داده‌های یادگیری (با تأخیر، توسط state_store)"""
+        prompt_fragments.bump("personal_learning")  # هر تغییر واژگان/قوانین/لحن با ذخیره همراه است
+        state_store.schedule_save(self.learning_file, self._learning_snapshot, indent=2)
+    
+    def _learning_snapshot(self) -> Dict:
+        """داده‌های یادگیری فعلی برای ذخیره"""
+        return {
             "vocabulary": self.vocabulary,
             "rules": self.rules,
             "tone_preferences": self.tone_preferences,
@@ -88,15 +94,11 @@ class PersonalLearningSystem:
             "passive_facts": self.passive_facts,  # ذخیره یادگیری غیرمستقیم
             "last_updated": datetime.now().isoformat()
         }
-        
-        with open(self.learning_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
     
     def _save_profile_data(self):
-        """ذخیره پروفایل شخصی"""
-        os.makedirs("data/personality", exist_ok=True)
-        with open(self.profile_file, 'w', encoding='utf-8') as f:
-            json.dump(self.profile, f, ensure_ascii=False, indent=2)
+        """ذخیره پروفایل شخصی (با تأخیر، توسط state_store)"""
+        prompt_fragments.bump("profile")
+        state_store.schedule_save(self.profile_file, lambda: self.profile, indent=2)
     
     def analyze_message_for_learning(self, message: str) -> Optional[Dict]:
         """تحلیل پیام برای یادگیری"""
@@ -558,13 +560,21 @@ class PersonalLearningSystem:
         """اعمال واژگان شخصی به پیام"""
         processed_message = message
         
-        for word, meaning in self.vocabulary.items():
-            # جایگزینی کلمات (با در نظر گیری مرزهای کلمه)
-            pattern = r'\b' + re.escape(word) + r'\b'
-            processed_message = re.sub(pattern, meaning, processed_message, flags=re.IGNORECASE)
+        for pattern, meaning in self._vocabulary_patterns():
+            processed_message = pattern.sub(meaning, processed_message)
         
         return processed_message
     
+    def _vocabulary_patterns(self) -> List[tuple]:
+        """الگوهای کامپایل شده واژگان - فقط با تغییر واژگان دوباره ساخته می‌شوند"""
+        def build():
+            # جایگزینی کلمات (با در نظر گیری مرزهای کلمه)
+            return [
+                (re.compile(r'\b' + re.escape(word) + r'\b', re.IGNORECASE), meaning)
+                for word, meaning in self.vocabulary.items()
+            ]
+        return prompt_fragments.get("vocabulary_patterns", ("personal_learning",), build)
+    
     def get_active_rules_for_context(self, context: str) -> List[Dict]:
         """دریافت قوانین فعال برای context مشخص"""
         relevant_rules = []
@@ -586,8 +596,22 @@ class PersonalLearningSystem:
         """دریافت ترجیحات لحن"""
         return self.tone_preferences
     
+    def get_personalization_fingerprint(self) -> str:
+        """اثر انگشت واژگان، قوانین و لحن فعال - با هر یادگیری جدید تغییر می‌کند"""
+        def build():
+            state = json.dumps(
+                {"vocabulary": self.vocabulary, "rules": self.rules, "tone": self.tone_preferences},
+                sort_keys=True, ensure_ascii=False, default=str
+            )
+            return hashlib.sha1(state.encode("utf-8")).hexdigest()[:12]
+        return prompt_fragments.get("personalization_fingerprint", ("personal_learning",), build)
+    
     def get_profile_summary(self, max_items: int = 6) -> str:
         """خلاصه کوتاه از پروفایل کاربر برای prompt"""
+        return prompt_fragments.get(f"profile_summary_{max_items}", ("profile",),
+                                    lambda: self._build_profile_summary(max_items))
+    
+    def _build_profile_summary(self, max_items: int) -> str:
         lines = []
         
         def _add_from_category(cat: str, title: str):
@@ -0,0 +1,276 @@
+"""
+🧱 لایه دوم (L2) cache پاسخ‌ها
+موتورها رابط یکسانی دارند: get(key) / set(key, value, ttl) / clear() / get_stats()
+- sqlite (پیش‌فرض): فایل محلی در حالت WAL، بدون وابستگی و بدون سرویس جدا
+- redis: اتصال تنبل با timeout کوتاه، health check و circuit breaker (نیاز به pip install redis)
+- none: بدون لایه دوم
+مقادیر به صورت JSON ذخیره می‌شوند (نه pickle) تا داده cache نتواند کد اجرا کند
+انتخاب موتور: ROBAH_CACHE_BACKEND=sqlite|redis|none و ROBAH_REDIS_URL
+"""
+
+import importlib.util
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+def encode_cache_value(value: Any) -> bytes:
+    """سریال‌سازی فشرده JSON"""
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+def decode_cache_value(data) -> Any:
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode("utf-8")
+    return json.loads(data)
+
+class NullCacheBackend:
+    """بدون لایه دوم"""
+    name = "none"
+
+    def get(self, key: str) -> Optional[Dict]:
+        return None
+
+    def set(self, key: str, value: Dict, ttl: int):
+        pass
+
+    def clear(self):
+        pass
+
+    def get_stats(self) -> Dict:
+        return {"backend": self.name}
+
+class SqliteCacheBackend:
+    """cache روی دیسک محلی - بعد از راه‌اندازی مجدد هم باقی می‌ماند
+
+    فایل پایگاه در اولین get/set ساخته می‌شود، نه هنگام import
+    """
+    name = "sqlite"
+
+    def __init__(self, db_path: str = "data/cache/response_cache.db", busy_timeout: float = 0.2,
+                 purge_every: int = 200):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self.purge_every = purge_every  # هر چند نوشتن یک بار آیتم‌های منقضی پاک شوند
+
+        # اتصال مشترک بین thread ها (تنبل)؛ قفل شدن پایگاه بیش از busy_timeout منتظر نمی‌ماند
+        self._lock = threading.Lock()
+        self.conn: Optional[sqlite3.Connection] = None
+
+        self._writes_since_purge = 0
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "purged": 0, "errors": 0}
+
+    def _connection(self) -> sqlite3.Connection:
+        """اتصال به پایگاه (ساخت در اولین استفاده) - زیر self._lock صدا زده می‌شود"""
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache(expires_at)")
+            self.conn = conn
+        return self.conn
+
+    def get(self, key: str) -> Optional[Dict]:
+        try:
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT value FROM cache WHERE key = ? AND expires_at > ?",
+                    (key, time.time())
+                ).fetchone()
+        except (sqlite3.Error, OSError) as e:
+            self.stats["errors"] += 1
+            print(f"⚠️ خطا در خواندن cache محلی: {e}")
+            return None
+
+        if row is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        return decode_cache_value(row[0])
+
+    def set(self, key: str, value: Dict, ttl: int):
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, encode_cache_value(value), time.time() + ttl)
+                )
+                self.stats["writes"] += 1
+                self._writes_since_purge += 1
+                if self._writes_since_purge >= self.purge_every:
+                    self._writes_since_purge = 0
+                    cursor = conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+                    self.stats["purged"] += cursor.rowcount
+        except (sqlite3.Error, OSError) as e:
+            self.stats["errors"] += 1
+            print(f"⚠️ خطا در ذخیره cache محلی: {e}")
+
+    def clear(self):
+        try:
+            with self._lock:
+                self._connection().execute("DELETE FROM cache")
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️ خطا در پاک کردن cache محلی: {e}")
+
+    def get_stats(self) -> Dict:
+        try:
+            with self._lock:
+                entries = self._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        except (sqlite3.Error, OSError):
+            entries = None
+        return {"backend": self.name, **self.stats, "entries": entries}
+
+class RedisCacheBackend:
+    """Redis با اتصال تنبل و circuit breaker
+
+    هر عملیات حداکثر socket_timeout طول می‌کشد؛ پس از failure_threshold خطای پیاپی،
+    مدار به مدت cooldown باز می‌شود و درخواست‌ها بدون تماس با شبکه رد می‌شوند.
+    client_factory: سازنده کلاینت (برای تست می‌توان یک جایگزین محلی مثل fakeredis داد)
+    """
+    name = "redis"
+
+    def __init__(self, url: str = "redis://localhost:6379/0", socket_timeout: float = 0.2,
+                 failure_threshold: int = 3, cooldown: float = 30.0,
+                 key_prefix: str = "robah:cache:", client_factory: Callable[[], Any] = None):
+        self.url = url
+        self.socket_timeout = socket_timeout
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.key_prefix = key_prefix
+        self.client_factory = client_factory or self._default_client
+
+        self._client = None
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "errors": 0,
+            "short_circuits": 0,
+            "circuit_opens": 0
+        }
+
+    def _default_client(self):
+        import redis  # وابستگی اختیاری - فقط در صورت استفاده بارگذاری می‌شود
+        return redis.Redis.from_url(
+            self.url,
+            socket_timeout=self.socket_timeout,
+            socket_connect_timeout=self.socket_timeout,
+            health_check_interval=30
+        )
+
+    # ---------- circuit breaker ----------
+
+    @property
+    def state(self) -> str:
+        if self._open_until > time.time():
+            return "open"
+        return "closed" if self._consecutive_failures < self.failure_threshold else "half_open"
+
+    def _acquire_client(self):
+        """کلاینت سالم یا None اگر مدار باز است"""
+        with self._lock:
+            if self._open_until > time.time():
+                self.stats["short_circuits"] += 1
+                return None
+            if self._client is None:
+                # اولین اتصال یا تلاش دوباره پس از cooldown - health check با ping
+                client = self.client_factory()
+                client.ping()
+                self._client = client
+                print("🔴 Redis cache متصل شد")
+            return self._client
+
+    def _record_success(self):
+        self._consecutive_failures = 0
+
+    def _record_failure(self, error: Exception):
+        with self._lock:
+            self.stats["errors"] += 1
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self.failure_threshold:
+                self._open_until = time.time() + self.cooldown
+                self._client = None
+                self.stats["circuit_opens"] += 1
+                print(f"⚠️ Redis در دسترس نیست، تا {self.cooldown:.0f} ثانیه استفاده نمی‌شود: {error}")
+
+    # ---------- عملیات ----------
+
+    def get(self, key: str) -> Optional[Dict]:
+        try:
+            client = self._acquire_client()
+            if client is None:
+                return None
+            data = client.get(self.key_prefix + key)
+        except Exception as e:
+            self._record_failure(e)
+            return None
+
+        self._record_success()
+        if data is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        try:
+            return decode_cache_value(data)
+        except ValueError:
+            return None
+
+    def set(self, key: str, value: Dict, ttl: int):
+        try:
+            client = self._acquire_client()
+            if client is None:
+                return
+            client.setex(self.key_prefix + key, int(ttl), encode_cache_value(value))
+        except Exception as e:
+            self._record_failure(e)
+            return
+
+        self._record_success()
+        self.stats["writes"] += 1
+
+    def clear(self):
+        """فقط کلیدهای cache روباه پاک می‌شوند (نه کل پایگاه)"""
+        try:
+            client = self._acquire_client()
+            if client is None:
+                return
+            keys = list(client.scan_iter(match=self.key_prefix + "*"))
+            if keys:
+                client.delete(*keys)
+            self._record_success()
+        except Exception as e:
+            self._record_failure(e)
+
+    def get_stats(self) -> Dict:
+        return {"backend": self.name, "state": self.state, **self.stats}
+
+def create_cache_backend(name: str = None):
+    """ساخت موتور L2 بر اساس تنظیمات محیطی"""
+    name = (name or os.getenv("ROBAH_CACHE_BACKEND", "sqlite")).lower()
+
+    if name == "none":
+        return NullCacheBackend()
+
+    if name == "redis":
+        if importlib.util.find_spec("redis") is not None:
+            print("🔴 Redis cache (اتصال تنبل) فعال شد")
+            return RedisCacheBackend(os.getenv("ROBAH_REDIS_URL", "redis://localhost:6379/0"))
+        print("⚠️ کتابخانه redis نصب نیست، استفاده از cache محلی SQLite")
+
+    print("💾 استفاده از cache محلی (SQLite)")
+    return SqliteCacheBackend(os.getenv("ROBAH_CACHE_DB_PATH", "data/cache/response_cache.db"))
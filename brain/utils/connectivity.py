@@ -0,0 +1,115 @@
+"""
+📶 پایش اتصال به اینترنت
+وضعیت آنلاین/آفلاین در حافظه نگه داشته می‌شود و مسیر تولید پاسخ فقط همین پرچم را می‌خواند؛
+نتیجه درخواست‌های واقعی (مثل جستجوی وب) وضعیت را به‌روز می‌کند و بررسی فعال فقط در پس‌زمینه،
+با فاصله‌ای که در حالت آفلاین به صورت نمایی زیاد می‌شود، انجام می‌شود
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import aiohttp
+
+class ConnectivityMonitor:
+    def __init__(self, get_session: Callable[[], Awaitable[aiohttp.ClientSession]],
+                 probe_url: str = "https://www.google.com/generate_204", probe_timeout: float = 3.0,
+                 online_interval: float = 120.0, min_backoff: float = 5.0, max_backoff: float = 300.0):
+        self.get_session = get_session
+        self.probe_url = probe_url
+        self.probe_timeout = probe_timeout
+        self.online_interval = online_interval  # فاصله بررسی وقتی آنلاین است و ترافیک واقعی نیست
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self.online: Optional[bool] = None  # None = هنوز نامشخص
+        self.last_change: Optional[float] = None
+        self.last_update: Optional[float] = None
+        self._backoff = min_backoff
+        self._next_probe_at = 0.0
+        self._probe_task: Optional[asyncio.Task] = None
+
+        # آمار
+        self.stats = {
+            "probes": 0,
+            "probe_failures": 0,
+            "passive_updates": 0,
+            "transitions": 0
+        }
+
+    # ---------- خواندن وضعیت ----------
+
+    def is_online(self) -> bool:
+        """خواندن پرچم - هرگز منتظر شبکه نمی‌ماند
+
+        وضعیت نامشخص خوش‌بینانه آنلاین فرض می‌شود؛ اولین درخواست واقعی آن را مشخص می‌کند
+        """
+        self._schedule_probe_if_due()
+        return self.online is not False
+
+    # ---------- به‌روزرسانی ----------
+
+    def report_success(self):
+        """یک درخواست واقعی به اینترنت موفق بود"""
+        self.stats["passive_updates"] += 1
+        self._set_state(True)
+
+    def report_failure(self):
+        """یک درخواست واقعی به خاطر شبکه ناموفق بود"""
+        self.stats["passive_updates"] += 1
+        self._set_state(False)
+
+    def _set_state(self, online: bool):
+        now = time.time()
+        if online != self.online:
+            if self.online is not None:
+                self.stats["transitions"] += 1
+                print("📶 اتصال اینترنت برقرار شد" if online else "📵 اتصال اینترنت قطع است")
+            self.online = online
+            self.last_change = now
+            self._backoff = self.min_backoff
+        elif not online:
+            # شکست پیاپی - فاصله بررسی بعدی دو برابر می‌شود
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+
+        self.last_update = now
+        self._next_probe_at = now + (self.online_interval if online else self._backoff)
+
+    # ---------- بررسی فعال (پس‌زمینه) ----------
+
+    def _schedule_probe_if_due(self):
+        if time.time() < self._next_probe_at:
+            return
+        if self._probe_task is not None and not self._probe_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # خارج از event loop - بررسی در فراخوانی بعدی
+        self._probe_task = loop.create_task(self.probe())
+
+    async def probe(self) -> bool:
+        """بررسی اتصال با یک درخواست سبک"""
+        self.stats["probes"] += 1
+        try:
+            session = await self.get_session()
+            async with session.head(self.probe_url, allow_redirects=True,
+                                    timeout=aiohttp.ClientTimeout(total=self.probe_timeout)) as response:
+                online = response.status < 500
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+            online = False
+
+        if not online:
+            self.stats["probe_failures"] += 1
+        self._set_state(online)
+        return online
+
+    def get_stats(self) -> Dict:
+        """وضعیت و آمار اتصال"""
+        return {
+            **self.stats,
+            "online": self.online,
+            "backoff_seconds": self._backoff,
+            "next_probe_in": max(0.0, round(self._next_probe_at - time.time(), 1)),
+            "last_change": self.last_change
+        }
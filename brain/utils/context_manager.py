@@ -8,8 +8,8 @@ from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from dataclasses import dataclass
 from enum import Enum
-import re
 from collections import defaultdict
+from .keyword_matcher import KeywordMatcher
 
 class ContextType(Enum):
     CONVERSATION = "conversation"
@@ -49,11 +49,12 @@ class ContextManager:
         
         # الگوهای تشخیص context
         self.context_patterns = {
-            "question": [r"\?", r"چی", r"کی", r"کجا", r"چطور", r"چرا"],
-            "request": [r"لطفا", r"می‌تونی", r"کمک", r"بگو", r"توضیح"],
-            "emotion": [r"خوشحال", r"ناراحت", r"عصبانی", r"خسته", r"هیجان"],
-            "reference": [r"این", r"آن", r"همون", r"قبلی", r"گفتی"]
+            "question": ["?", "چی", "کی", "کجا", "چطور", "چرا"],
+            "request": ["لطفا", "می‌تونی", "کمک", "بگو", "توضیح"],
+            "emotion": ["خوشحال", "ناراحت", "عصبانی", "خسته", "هیجان"],
+            "reference": ["این", "آن", "همون", "قبلی", "گفتی"]
         }
+        self.context_matcher = KeywordMatcher(self.context_patterns)
         
         print("🎯 Context Manager راه‌اندازی شد")
     
@@ -136,19 +137,15 @@ class ContextManager:
     def _analyze_message_context_needs(self, message: str) -> List[ContextType]:
         """تحلیل پیام برای تشخیص نیاز به انواع context"""
         needed_types = []
-        message_lower = message.lower()
         
-        # بررسی الگوها
-        for pattern_type, patterns in self.context_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, message_lower):
-                    if pattern_type == "reference":
-                        needed_types.append(ContextType.REFERENCE)
-                    elif pattern_type == "emotion":
-                        needed_types.append(ContextType.EMOTION)
-                    elif pattern_type in ["question", "request"]:
-                        needed_types.append(ContextType.CONVERSATION)
-                    break
+        # بررسی الگوها - همه دسته‌ها در یک پیمایش
+        for pattern_type in self.context_matcher.matched_categories(message):
+            if pattern_type == "reference":
+                needed_types.append(ContextType.REFERENCE)
+            elif pattern_type == "emotion":
+                needed_types.append(ContextType.EMOTION)
+            elif pattern_type in ["question", "request"] and ContextType.CONVERSATION not in needed_types:
+                needed_types.append(ContextType.CONVERSATION)
         
         # همیشه conversation context نیاز است
         if ContextType.CONVERSATION not in needed_types:
@@ -8,6 +8,16 @@ import os
 from datetime import datetime
 from typing import Dict, List, Optional
 import random
+from .log_store import log_store
+from .keyword_matcher import KeywordMatcher
+from .message_analysis import MessageAnalysis, MessageLike
+
+# نشانه‌های هدف پیام (بررسی «؟» بین how_to و help انجام می‌شود)
+INTENT_KEYWORDS = KeywordMatcher({
+    "definition": ["چیست", "چیه", "تعریف", "یعنی چی"],
+    "how_to": ["چطور", "چگونه", "راه"],
+    "help": ["کمک", "راهنمایی", "یاد بده"]
+})
 
 class DatasetManager:
     def __init__(self):
@@ -24,6 +34,14 @@ class DatasetManager:
         self.topic_knowledge = self._load_topic_knowledge()
         self.prompt_templates = self._load_prompt_templates()
         
+        # matcher های ساخته شده یک بار از روی دیتاست‌ها
+        self.emotion_matcher = KeywordMatcher({
+            emotion: data.get("indicators", []) for emotion, data in self.emotion_responses.items()
+        })
+        self.topic_matcher = KeywordMatcher({
+            topic: data.get("keywords", []) for topic, data in self.topic_knowledge.items()
+        })
+        
         print("📊 مدیر دیتاست راه‌اندازی شد")
     
     def _load_conversation_patterns(self) -> List[Dict]:
@@ -153,58 +171,56 @@ class DatasetManager:
         self._save_json(prompts_file, default_templates)
         return default_templates
     
-    def analyze_user_message(self, message: str, context: List[Dict] = None) -> Dict:
-        """تحلیل پیام کاربر و استخراج اطلاعات"""
-        analysis = {
-            "emotion": self._detect_emotion(message),
-            "topic": self._detect_topic(message),
-            "intent": self._detect_intent(message),
-            "complexity": self._assess_complexity(message),
-            "patterns": self._find_patterns(message, context)
-        }
+    def analyze_user_message(self, message: str, context: List[Dict] = None, message_analysis: MessageAnalysis = None) -> Dict:
+        """تحلیل پیام کاربر و استخراج اطلاعات
+
+        طبقه‌بندی‌های مستقل از context روی خود تحلیل پیام memo می‌شوند؛ الگوها که به context
+        بستگی دارند در هر فراخوانی محاسبه می‌شوند
+        """
+        message_analysis = MessageAnalysis.of(message_analysis or message)
         
-        return analysis
+        return {
+            "emotion": self._detect_emotion(message_analysis),
+            "topic": self._detect_topic(message_analysis),
+            "intent": self._detect_intent(message_analysis),
+            "complexity": self._assess_complexity(message_analysis),
+            "patterns": self._find_patterns(message_analysis, context)
+        }
     
-    def _detect_emotion(self, message: str) -> str:
+    def _detect_emotion(self, message: MessageLike) -> str:
         """تشخیص احساسات پیام"""
-        message_lower = message.lower()
-        
-        for emotion, data in self.emotion_responses.items():
-            for indicator in data["indicators"]:
-                if indicator in message_lower:
-                    return emotion
-        
-        return "neutral"
+        message_analysis = MessageAnalysis.of(message)
+        return message_analysis.memo(
+            "emotion", lambda: message_analysis.first_category(self.emotion_matcher) or "neutral"
+        )
     
-    def _detect_topic(self, message: str) -> Optional[str]:
+    def _detect_topic(self, message: MessageLike) -> Optional[str]:
         """تشخیص موضوع پیام"""
-        message_lower = message.lower()
-        
-        for topic, data in self.topic_knowledge.items():
-            for keyword in data["keywords"]:
-                if keyword in message_lower:
-                    return topic
-        
-        return None
+        message_analysis = MessageAnalysis.of(message)
+        return message_analysis.memo("topic", lambda: message_analysis.first_category(self.topic_matcher))
     
-    def _detect_intent(self, message: str) -> str:
+    def _detect_intent(self, message: MessageLike) -> str:
         """تشخیص هدف پیام"""
-        message_lower = message.lower()
+        message_analysis = MessageAnalysis.of(message)
+        return message_analysis.memo("intent", lambda: self._classify_intent(message_analysis))
+    
+    def _classify_intent(self, message_analysis: MessageAnalysis) -> str:
+        matched = message_analysis.scan(INTENT_KEYWORDS)
         
-        if any(word in message_lower for word in ["چیست", "چیه", "تعریف", "یعنی چی"]):
+        if "definition" in matched:
             return "definition"
-        elif any(word in message_lower for word in ["چطور", "چگونه", "راه"]):
+        elif "how_to" in matched:
             return "how_to"
-        elif "؟" in message:
+        elif "؟" in message_analysis.text:
             return "question"
-        elif any(word in message_lower for word in ["کمک", "راهنمایی", "یاد بده"]):
+        elif "help" in matched:
             return "help"
         else:
             return "conversation"
     
-    def _assess_complexity(self, message: str) -> str:
+    def _assess_complexity(self, message: MessageLike) -> str:
         """ارزیابی پیچیدگی پیام"""
-        word_count = len(message.split())
+        word_count = MessageAnalysis.of(message).word_count
         
         if word_count <= 3:
             return "simple"
@@ -213,13 +229,14 @@ class DatasetManager:
         else:
             return "complex"
     
-    def _find_patterns(self, message: str, context: List[Dict] = None) -> List[str]:
+    def _find_patterns(self, message: MessageLike, context: List[Dict] = None) -> List[str]:
         """یافتن الگوهای مکالمه"""
         patterns = []
+        message_lower = MessageAnalysis.of(message).lower
         
         for pattern in self.conversation_patterns:
             for example in pattern["user_examples"]:
-                if example.lower() in message.lower():
+                if example.lower() in message_lower:
                     patterns.append(pattern["pattern"])
                     break
         
@@ -332,25 +349,26 @@ class DatasetManager:
         
         return None
     
-    def learn_from_interaction(self, user_message: str, ai_response: str, feedback: Optional[int] = None):
-        """یادگیری از تعامل"""
+    def learn_from_interaction(self, user_message: str, ai_response: str, feedback: Optional[int] = None,
+                               message_analysis: MessageAnalysis = None):
+        """یادگیری از تعامل - تحلیل پیام از مرحله پاسخ دوباره استفاده می‌شود"""
         
         # تحلیل کیفیت پاسخ
         quality_score = feedback if feedback else self._assess_response_quality(user_message, ai_response)
         
         # ذخیره در دیتاست یادگیری
+        analysis = self.analyze_user_message(user_message, message_analysis=message_analysis)
         learning_entry = {
             "timestamp": datetime.now().isoformat(),
             "user_message": user_message,
             "ai_response": ai_response,
             "quality_score": quality_score,
-            "analysis": self.analyze_user_message(user_message)
+            "topic": analysis.get("topic"),  # فیلتر موضوع در هر دو موتور log_store از رکورد خوانده می‌شود
+            "analysis": analysis
         }
         
-        # ذخیره در فایل
-        learning_file = f"{self.datasets_dir}/learning_data.jsonl"
-        with open(learning_file, "a", encoding="utf-8") as f:
-            f.write(json.dumps(learning_entry, ensure_ascii=False) + "\n")
+        # ذخیره در log_store
+        log_store.append("dataset_learning", learning_entry, topic=learning_entry["topic"])
         
         # اگر پاسخ خوب بود، به الگوها اضافه کن
         if quality_score >= 4:
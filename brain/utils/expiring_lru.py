@@ -0,0 +1,168 @@
+"""
+⏳ کش LRU با انقضای زمانی (timer wheel) و حساب حجم
+ترتیب استفاده با OrderedDict نگه داشته می‌شود و بیرون انداختن قدیمی‌ترین آیتم O(1) است؛
+زمان انقضای هر آیتم در یک چرخ زمان‌سنج ثبت می‌شود و در هر دسترسی فقط خانه‌های
+سررسید شده بررسی می‌شوند، پس آیتم‌های منقضی بدون مرتب‌سازی کل کش و به تدریج پاک می‌شوند
+"""
+
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Set
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "tick", "size")
+
+    def __init__(self, value: Any, expires_at: float, tick: int, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.tick = tick
+        self.size = size
+
+class ExpiringLRU:
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 0,
+                 tick_seconds: float = 1.0, wheel_slots: int = 512,
+                 on_remove: Callable[[Hashable, str], None] = None):
+        """max_bytes: سقف حجم کل (0 = بدون سقف)
+
+        on_remove: callback(key, reason) با reason یکی از "evicted"، "expired"، "replaced"، "removed"
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.tick_seconds = tick_seconds
+        self.on_remove = on_remove
+
+        self._items: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._bytes = 0
+
+        # چرخ زمان‌سنج: هر خانه کلیدهایی که در آن tick (یا دورهای بعدی) منقضی می‌شوند
+        self._wheel: List[Set[Hashable]] = [set() for _ in range(wheel_slots)]
+        self._current_tick = self._tick_of(time.time())
+
+        # آمار
+        self.stats = {
+            "admissions": 0,
+            "rejections": 0,
+            "evictions": 0,
+            "expirations": 0
+        }
+
+    def _tick_of(self, timestamp: float) -> int:
+        return math.floor(timestamp / self.tick_seconds)
+
+    # ---------- انقضا ----------
+
+    def expire(self, now: float = None):
+        """پیشبرد چرخ تا زمان فعلی و حذف آیتم‌های سررسید شده"""
+        now = time.time() if now is None else now
+        target_tick = self._tick_of(now)
+        if target_tick <= self._current_tick:
+            return
+
+        # اگر بیش از یک دور کامل گذشته، هر خانه فقط یک بار بررسی می‌شود
+        start_tick = max(self._current_tick + 1, target_tick - len(self._wheel) + 1)
+        for tick in range(start_tick, target_tick + 1):
+            slot = self._wheel[tick % len(self._wheel)]
+            if not slot:
+                continue
+            due = [key for key in slot if self._items[key].tick <= target_tick]
+            for key in due:
+                self._remove(key, "expired")
+                self.stats["expirations"] += 1
+
+        self._current_tick = target_tick
+
+    # ---------- دسترسی ----------
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """مقدار تازه (و علامت استفاده اخیر) یا default"""
+        self.expire()
+        entry = self._items.get(key)
+        if entry is None:
+            return default
+        if time.time() >= entry.expires_at:
+            self._remove(key, "expired")
+            self.stats["expirations"] += 1
+            return default
+        self._items.move_to_end(key)
+        return entry.value
+
+    def peek(self, key: Hashable, now: float = None) -> Any:
+        """مقدار تازه بدون تغییر ترتیب LRU"""
+        entry = self._items.get(key)
+        if entry is None:
+            return None
+        now = time.time() if now is None else now
+        return entry.value if now < entry.expires_at else None
+
+    def set(self, key: Hashable, value: Any, ttl: float, size: int = 0) -> bool:
+        """افزودن/جایگزینی - آیتم بزرگ‌تر از کل سقف حجم پذیرفته نمی‌شود"""
+        if self.max_bytes and size > self.max_bytes:
+            self.stats["rejections"] += 1
+            return False
+
+        now = time.time()
+        self.expire(now)
+
+        if key in self._items:
+            self._remove(key, "replaced")
+
+        expires_at = now + ttl
+        tick = self._tick_of(expires_at)
+        if expires_at > tick * self.tick_seconds:
+            tick += 1  # خانه‌ای که پس از expires_at بررسی می‌شود
+        tick = max(tick, self._current_tick + 1)
+
+        self._items[key] = _Entry(value, expires_at, tick, size)
+        self._wheel[tick % len(self._wheel)].add(key)
+        self._bytes += size
+        self.stats["admissions"] += 1
+
+        # بیرون انداختن کم‌استفاده‌ترین آیتم‌ها - هر مورد O(1)
+        while self._items and (len(self._items) > self.max_entries or
+                               (self.max_bytes and self._bytes > self.max_bytes)):
+            oldest_key = next(iter(self._items))
+            self._remove(oldest_key, "evicted")
+            self.stats["evictions"] += 1
+
+        return True
+
+    def pop(self, key: Hashable):
+        if key in self._items:
+            self._remove(key, "removed")
+
+    def _remove(self, key: Hashable, reason: str):
+        entry = self._items.pop(key)
+        self._wheel[entry.tick % len(self._wheel)].discard(key)
+        self._bytes -= entry.size
+        if self.on_remove:
+            self.on_remove(key, reason)
+
+    def clear(self):
+        self._items.clear()
+        for slot in self._wheel:
+            slot.clear()
+        self._bytes = 0
+
+    # ---------- اطلاعات ----------
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._items)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._bytes
+
+    def get_stats(self) -> Dict:
+        """آمار کش"""
+        return {
+            **self.stats,
+            "entries": len(self._items),
+            "bytes": self._bytes
+        }
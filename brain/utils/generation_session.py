@@ -0,0 +1,144 @@
+"""
+🔁 جلسه‌های تولید چندنوبتی با استفاده مجدد از context مدل
+Ollama در پاسخ /api/generate آرایه context (توکن‌های prompt و پاسخ) را برمی‌گرداند؛
+اگر بخش ثابت prompt (شخصیت، لحن، پروفایل) عوض نشده باشد، نوبت بعدی فقط بخش جدید
+(پیام و اطلاعات همین نوبت) را همراه همان context می‌فرستد و مدل پیشوند را دوباره
+پردازش نمی‌کند؛ keep_alive مدل را در حافظه نگه می‌دارد تا cache آن از دست نرود.
+هر مکالمه (اتصال WebSocket، conversation_id درخواست HTTP یا CLI) جلسه و context خودش را
+دارد و نوبت‌های یک مکالمه با قفل همان جلسه پشت سر هم اجرا می‌شوند
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+class GenerationSession:
+    def __init__(self, model: str, fingerprint: str):
+        self.model = model
+        self.fingerprint = fingerprint  # hash بخش ثابت prompt
+        self.context: Optional[List[int]] = None
+        self.turns = 0
+        self.last_used = time.time()
+
+class GenerationSessionManager:
+    def __init__(self, keep_alive: str = None, max_context_tokens: int = None, idle_timeout: float = 1800):
+        self.keep_alive = keep_alive or os.getenv("ROBAH_KEEP_ALIVE", "30m")
+        # بیش از این تعداد توکن، جلسه از نو با prompt کامل (و تاریخچه خلاصه) شروع می‌شود
+        self.max_context_tokens = max_context_tokens or int(os.getenv("ROBAH_SESSION_MAX_TOKENS", "3072"))
+        self.idle_timeout = idle_timeout  # جلسه بعد از این مدت سکوت مکالمه جدید حساب می‌شود
+        self.enabled = os.getenv("ROBAH_SESSIONS", "1") != "0"
+
+        self.sessions: Dict[str, GenerationSession] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+        # آمار
+        self.stats = {
+            "full_prompts": 0,
+            "delta_prompts": 0,
+            "resets": 0,
+            "full_prompt_eval_tokens": 0,
+            "delta_prompt_eval_tokens": 0,
+            "full_prompt_eval_ms": 0.0,
+            "delta_prompt_eval_ms": 0.0
+        }
+
+    @staticmethod
+    def fingerprint(stable_prompt: str) -> str:
+        return hashlib.sha1(stable_prompt.encode("utf-8")).hexdigest()[:12]
+
+    def lock(self, session_id: str) -> asyncio.Lock:
+        """قفل نوبت‌های یک مکالمه - از prepare تا update نگه داشته می‌شود"""
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        return lock
+
+    def _prune(self):
+        """حذف جلسه‌های بیکار (مکالمه‌های بسته شده) تا context آن‌ها در حافظه نماند"""
+        cutoff = time.time() - self.idle_timeout
+        for session_id in [sid for sid, session in self.sessions.items() if session.last_used < cutoff]:
+            self.reset(session_id)
+
+    def prepare(self, session_id: str, model: str, stable_prompt: str,
+                full_prompt: str, delta_prompt: str) -> Tuple[str, Optional[List[int]]]:
+        """انتخاب prompt این نوبت: (delta، context قبلی) یا (prompt کامل، None)"""
+        if not self.enabled:
+            return full_prompt, None
+
+        self._prune()
+        fingerprint = self.fingerprint(stable_prompt)
+        session = self.sessions.get(session_id)
+
+        reason = None
+        if session is None or session.context is None:
+            reason = None if session is None else "no_context"
+        elif session.model != model:
+            reason = "model_changed"
+        elif session.fingerprint != fingerprint:
+            reason = "prompt_changed"
+        elif len(session.context) > self.max_context_tokens:
+            reason = "context_full"
+        else:
+            session.last_used = time.time()
+            return delta_prompt, session.context
+
+        if reason:
+            self.stats["resets"] += 1
+            print(f"🔁 جلسه {session_id} از نو شروع شد ({reason})")
+        self.sessions[session_id] = GenerationSession(model, fingerprint)
+        return full_prompt, None
+
+    def update(self, session_id: str, result: Dict, used_context: bool):
+        """ذخیره context برگشتی مدل و آمار پردازش prompt"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return
+
+        kind = "delta" if used_context else "full"
+        self.stats[f"{kind}_prompts"] += 1
+        self.stats[f"{kind}_prompt_eval_tokens"] += result.get("prompt_eval_count", 0) or 0
+        self.stats[f"{kind}_prompt_eval_ms"] += (result.get("prompt_eval_duration", 0) or 0) / 1e6
+
+        context = result.get("context")
+        if context:
+            session.context = context
+            session.turns += 1
+            session.last_used = time.time()
+        else:
+            # پاسخ بدون context (مثلاً stream نیمه‌کاره) - نوبت بعد prompt کامل
+            session.context = None
+
+    def reset(self, session_id: str = None):
+        if session_id is None:
+            self.sessions.clear()
+            self._locks = {sid: lock for sid, lock in self._locks.items() if lock.locked()}
+        else:
+            self.sessions.pop(session_id, None)
+            lock = self._locks.get(session_id)
+            if lock is not None and not lock.locked():
+                del self._locks[session_id]
+
+    def get_stats(self) -> Dict:
+        """آمار جلسه‌ها - میانگین زمان پردازش prompt کامل در برابر delta"""
+        def average(kind: str) -> float:
+            count = self.stats[f"{kind}_prompts"]
+            return round(self.stats[f"{kind}_prompt_eval_ms"] / count, 1) if count else 0.0
+
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "keep_alive": self.keep_alive,
+            "active_sessions": len(self.sessions),
+            "avg_full_prompt_eval_ms": average("full"),
+            "avg_delta_prompt_eval_ms": average("delta"),
+            "sessions": {
+                session_id: {
+                    "model": session.model,
+                    "turns": session.turns,
+                    "context_tokens": len(session.context or [])
+                }
+                for session_id, session in self.sessions.items()
+            }
+        }
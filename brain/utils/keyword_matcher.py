@@ -0,0 +1,147 @@
+"""
+🔎 تطبیق چندالگویی کلمات کلیدی (Aho–Corasick)
+هر مجموعه کلمه کلیدی یک بار به automaton تبدیل می‌شود و پیام فقط یک بار پیمایش می‌شود؛
+هزینه طبقه‌بندی به طول پیام بستگی دارد نه به تعداد کل کلمات کلیدی
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# یکسان‌سازی نویسه‌های عربی/فارسی و نیم‌فاصله
+_PERSIAN_TRANSLATION = str.maketrans({
+    "ي": "ی",
+    "ى": "ی",
+    "ك": "ک",
+    "‌": " ",   # ZWNJ (نیم‌فاصله)
+    "‏": None,  # RLM
+    "‎": None,  # LRM
+})
+
+def normalize_persian(text: str) -> str:
+    """یکسان‌سازی متن برای تطبیق: حروف کوچک، ی/ي، ک/ك و نیم‌فاصله"""
+    return text.lower().translate(_PERSIAN_TRANSLATION)
+
+class KeywordMatcher:
+    def __init__(self, groups: Dict[str, Iterable[str]], whole_words: bool = False):
+        """groups: دسته -> کلمات کلیدی (ترتیب دسته‌ها اولویت first_category است)
+
+        whole_words: فقط تطبیق کامل کلمه (نه بخشی از یک کلمه دیگر)
+        """
+        self.whole_words = whole_words
+        self.categories: List[str] = list(groups)
+
+        # الگو -> دسته‌ها (یک کلمه ممکن است در چند دسته باشد)
+        self.patterns: List[str] = []
+        self.pattern_categories: List[List[str]] = []
+        pattern_ids: Dict[str, int] = {}
+
+        for category, keywords in groups.items():
+            for keyword in keywords:
+                pattern = normalize_persian(keyword)
+                if not pattern:
+                    continue
+                if pattern not in pattern_ids:
+                    pattern_ids[pattern] = len(self.patterns)
+                    self.patterns.append(pattern)
+                    self.pattern_categories.append([])
+                categories = self.pattern_categories[pattern_ids[pattern]]
+                if category not in categories:
+                    categories.append(category)
+
+        self._build()
+
+    def _build(self):
+        """ساخت trie و پیوندهای شکست"""
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+
+        for pattern_id, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(pattern_id)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    # ---------- پیمایش ----------
+
+    def _hits(self, text: str, normalized: bool) -> List[Tuple[int, int]]:
+        """یک پیمایش روی متن: [(شروع، شناسه الگو)] به ترتیب موقعیت"""
+        if not normalized:
+            text = normalize_persian(text)
+
+        hits = []
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern_id in output[state]:
+                start = index - len(self.patterns[pattern_id]) + 1
+                if self.whole_words and not self._is_whole_word(text, start, index + 1):
+                    continue
+                hits.append((start, pattern_id))
+
+        hits.sort()
+        return hits
+
+    def find_all(self, text: str, normalized: bool = False) -> List[Tuple[int, str]]:
+        """همه تطبیق‌ها به ترتیب موقعیت: [(شروع، کلمه کلیدی)]"""
+        return [(start, self.patterns[pattern_id]) for start, pattern_id in self._hits(text, normalized)]
+
+    @staticmethod
+    def _is_whole_word(text: str, start: int, end: int) -> bool:
+        before = text[start - 1] if start > 0 else " "
+        after = text[end] if end < len(text) else " "
+        return not before.isalnum() and not after.isalnum()
+
+    def scan(self, text: str, normalized: bool = False) -> Dict[str, List[str]]:
+        """دسته -> کلمات کلیدی یافت شده (بدون تکرار، به ترتیب ظاهر شدن)"""
+        result: Dict[str, List[str]] = {}
+        seen: Set[int] = set()
+        for _, pattern_id in self._hits(text, normalized):
+            if pattern_id in seen:
+                continue
+            seen.add(pattern_id)
+            for category in self.pattern_categories[pattern_id]:
+                result.setdefault(category, []).append(self.patterns[pattern_id])
+        return result
+
+    # ---------- توابع کمکی طبقه‌بندی ----------
+
+    def matched_categories(self, text: str, normalized: bool = False) -> List[str]:
+        """دسته‌های یافت شده به ترتیب تعریف"""
+        found = self.scan(text, normalized)
+        return [category for category in self.categories if category in found]
+
+    def first_category(self, text: str, normalized: bool = False) -> Optional[str]:
+        """اولین دسته (به ترتیب تعریف) که حداقل یک کلمه آن در متن هست - معادل زنجیره if/elif"""
+        categories = self.matched_categories(text, normalized)
+        return categories[0] if categories else None
+
+    def scores(self, text: str, normalized: bool = False) -> Dict[str, int]:
+        """تعداد کلمات کلیدی متمایز یافت شده از هر دسته"""
+        return {category: len(keywords) for category, keywords in self.scan(text, normalized).items()}
+
+    def contains(self, text: str, category: str = None, normalized: bool = False) -> bool:
+        """آیا متن کلمه‌ای از دسته داده شده (یا هر دسته‌ای) دارد؟"""
+        found = self.scan(text, normalized)
+        return bool(found) if category is None else category in found
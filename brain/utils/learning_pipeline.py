@@ -0,0 +1,332 @@
+"""
+📚 صف یادگیری پس‌زمینه
+کارهای یادگیری بعد از پاسخ فقط در صف قرار می‌گیرند و به صورت دسته‌ای
+در پس‌زمینه (روی AsyncTaskQueue) اجرا می‌شوند تا پاسخ کاربر منتظر آن‌ها نماند
+"""
+
+import asyncio
+import functools
+import json
+import os
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .task_queue import AsyncTaskQueue, TaskPriority
+
+class LearningPipeline:
+    def __init__(self,
+                 max_pending: int = 500,
+                 batch_size: int = 20,
+                 batch_interval: float = 0.5,
+                 journal_path: str = "data/learning/pending_learning.jsonl"):
+        self.max_pending = max_pending        # سقف صف - بیشتر از این یعنی back-pressure
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval  # حداکثر انتظار برای پر شدن یک دسته (ثانیه)
+        self.max_wait = 1.0                   # حداکثر انتظار تولیدکننده وقتی صف پر است
+        self.batch_timeout = 300.0
+        self.journal_path = journal_path      # ژورنال کارهای انجام نشده برای بازیابی پس از خاموشی ناگهانی
+
+        # یک worker تا کارهای یادگیری به ترتیب و بدون رقابت روی فایل‌ها اجرا شوند
+        self.queue = AsyncTaskQueue(max_workers=1)
+        self.handlers: Dict[str, Callable] = {}
+        self.transient: Dict[str, set] = {}   # نام -> kwargs فقط-حافظه که ژورنال نمی‌شوند
+
+        # کارهای ژورنال شده‌ای که هنوز اجرا نشده‌اند (برای فشرده‌سازی ژورنال)
+        self._journaled: "OrderedDict[str, Dict]" = OrderedDict()
+        # رکوردهای ژورنال در انتظار نوشتن - I/O فایل فقط در thread pool و یکی در هر لحظه
+        self._journal_buffer: List[Dict] = []
+        self._journal_lock: Optional[asyncio.Lock] = None
+
+        self._pending: Optional[asyncio.Queue] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._in_flight = 0
+        self._accepting = True
+
+        # آمار
+        self.stats = {
+            "submitted": 0,
+            "processed": 0,
+            "failed": 0,
+            "dropped": 0,
+            "batches": 0,
+            "replayed": 0,
+            "unjournaled": 0,
+            "backpressure_waits": 0
+        }
+
+    def register(self, name: str, handler: Callable, transient: Iterable[str] = ()):
+        """ثبت تابع یادگیری با نام - فقط نام و آرگومان‌ها در ژورنال ذخیره می‌شوند
+
+        transient: kwargs اختیاری که JSON نیستند (مثل MessageAnalysis)؛ فقط در اجرای زنده
+        داده می‌شوند و handler باید بدون آن‌ها هم کار کند
+        """
+        self.handlers[name] = handler
+        self.transient[name] = set(transient)
+
+    # ---------- چرخه حیات ----------
+
+    async def start(self):
+        """شروع dispatcher و بازیابی کارهای ژورنال شده"""
+        if self._dispatcher is not None and not self._dispatcher.done():
+            return
+
+        self._accepting = True
+        if self._pending is None:
+            self._pending = asyncio.Queue(maxsize=self.max_pending)
+            self._idle = asyncio.Event()
+            self._idle.set()
+            self._journal_lock = asyncio.Lock()
+        await self.queue.start()
+        await self._replay_journal()
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        print("📚 صف یادگیری پس‌زمینه شروع به کار کرد")
+
+    async def flush(self, timeout: float = 30.0) -> bool:
+        """انتظار برای اجرای همه کارهای در صف"""
+        if self._pending is None:
+            return True
+
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ flush صف یادگیری ناقص ماند ({self._pending.qsize()} کار باقی‌مانده)")
+            return False
+        return True
+
+    async def stop(self, timeout: float = 30.0):
+        """توقف با اجرای کارهای باقی‌مانده (هنگام خاموشی)"""
+        self._accepting = False
+        await self.flush(timeout)
+
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+        await self._flush_journal()  # کارهای اجرا نشده برای راه‌اندازی بعدی
+        await self.queue.stop()
+        print("⏹️ صف یادگیری متوقف شد")
+
+    # ---------- افزودن کار ----------
+
+    async def submit(self, name: str, *args, **kwargs) -> bool:
+        """قرار دادن کار یادگیری در صف - مسیر پاسخ فقط همین را صدا می‌زند"""
+        if name not in self.handlers:
+            raise ValueError(f"کار یادگیری ثبت نشده: {name}")
+        if not self._accepting:
+            return False
+        if self._dispatcher is None or self._dispatcher.done():
+            await self.start()
+
+        entry = {"id": uuid.uuid4().hex[:12], "name": name, "args": args, "kwargs": kwargs}
+
+        self._idle.clear()
+        try:
+            self._pending.put_nowait(entry)
+        except asyncio.QueueFull:
+            # back-pressure: تولیدکننده کمی صبر می‌کند، بعد کار کنار گذاشته می‌شود
+            self.stats["backpressure_waits"] += 1
+            try:
+                await asyncio.wait_for(self._pending.put(entry), timeout=self.max_wait)
+            except asyncio.TimeoutError:
+                self.stats["dropped"] += 1
+                print(f"⚠️ صف یادگیری پر است، کار {name} کنار گذاشته شد")
+                self._mark_idle()
+                return False
+
+        self.stats["submitted"] += 1
+        self._journal(entry)
+        return True
+
+    # ---------- اجرای دسته‌ای ----------
+
+    async def _dispatch_loop(self):
+        while True:
+            batch = [await self._pending.get()]
+            self._in_flight += 1
+
+            # جمع کردن کارهای بیشتر تا پر شدن دسته یا پایان مهلت
+            deadline = time.time() + self.batch_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._pending.get(), timeout=remaining))
+                    self._in_flight += 1
+                except asyncio.TimeoutError:
+                    break
+
+            # ژورنال کارهای رسیده از آخرین دسته با یک append
+            await self._flush_journal()
+
+            try:
+                task_id = self.queue.add_task(
+                    f"learning-batch ({len(batch)})",
+                    self._run_batch,
+                    batch,
+                    priority=TaskPriority.LOW
+                )
+                await self.queue.wait_for_task(task_id, timeout=self.batch_timeout)
+            except Exception as e:
+                print(f"⚠️ خطا در اجرای دسته یادگیری: {e}")
+            finally:
+                self._in_flight -= len(batch)
+                self.stats["batches"] += 1
+                await self._compact_journal()
+                self._mark_idle()
+
+    def _mark_idle(self):
+        if self._pending.qsize() == 0 and self._in_flight == 0:
+            self._idle.set()
+
+    async def _run_batch(self, batch: List[Dict]) -> int:
+        """اجرای یک دسته به ترتیب ورود"""
+        processed = 0
+        for entry in batch:
+            handler = self.handlers.get(entry["name"])
+            if handler is None:
+                continue
+            try:
+                if asyncio.iscoroutinefunction(handler):
+                    await handler(*entry["args"], **entry["kwargs"])
+                else:
+                    # یادگیرنده‌های sync فایل می‌نویسند - خارج از event loop
+                    loop = asyncio.get_running_loop()
+                    await loop.run_in_executor(None, functools.partial(handler, *entry["args"], **entry["kwargs"]))
+                processed += 1
+                self.stats["processed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"⚠️ خطا در یادگیری {entry['name']}: {e}")
+            # هر کار اجرا شده (موفق یا ناموفق) دیگر بازیابی نمی‌شود
+            await self._journal_done(entry["id"])
+        return processed
+
+    # ---------- ژورنال ----------
+
+    def _append_journal(self, records: List[Dict]):
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+
+    async def _journal_io(self, func: Callable, *args) -> Any:
+        """اجرای I/O ژورنال در thread pool - نوشتن‌ها به ترتیب و پشت سر هم"""
+        async with self._journal_lock:
+            try:
+                return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+            except Exception as e:
+                print(f"⚠️ خطا در ژورنال یادگیری: {e}")
+                return None
+
+    async def _flush_journal(self):
+        """نوشتن رکوردهای بافر شده ژورنال"""
+        if not self._journal_buffer or self._journal_lock is None:
+            return
+        records, self._journal_buffer = self._journal_buffer, []
+        await self._journal_io(self._append_journal, records)
+
+    def _journal(self, entry: Dict):
+        """ثبت کار در بافر ژورنال (بدون I/O)
+
+        فقط آرگومان‌های JSON تا پس از بازیابی همان امضای handler را داشته باشند
+        """
+        transient = self.transient.get(entry["name"], ())
+        record = {
+            "id": entry["id"],
+            "name": entry["name"],
+            "args": list(entry["args"]),
+            "kwargs": {key: value for key, value in entry["kwargs"].items() if key not in transient}
+        }
+        if not _is_json_native(record):
+            self.stats["unjournaled"] += 1
+            print(f"⚠️ آرگومان‌های {entry['name']} قابل ذخیره در ژورنال نیستند - بدون ژورنال اجرا می‌شود")
+            return
+        self._journaled[record["id"]] = record
+        self._journal_buffer.append(record)
+
+    async def _journal_done(self, entry_id: str):
+        """ثبت اجرای یک کار - crash وسط دسته کارهای انجام شده را دوباره اجرا نمی‌کند"""
+        if self._journaled.pop(entry_id, None) is None:
+            return
+        self._journal_buffer.append({"done": entry_id})
+        await self._flush_journal()
+
+    async def _compact_journal(self):
+        """بازنویسی اتمی ژورنال فقط با کارهای اجرا نشده (پس از هر دسته)
+
+        بازنویسی همه کارهای اجرا نشده را دارد، پس رکوردهای بافر شده دیگر لازم نیستند
+        """
+        self._journal_buffer = []
+        await self._journal_io(self._rewrite_journal, list(self._journaled.values()))
+
+    def _rewrite_journal(self, records: List[Dict]):
+        if not records:
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            return
+        directory = os.path.dirname(self.journal_path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.journal_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _read_journal(self) -> List[Dict]:
+        if not os.path.exists(self.journal_path):
+            return []
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    async def _replay_journal(self):
+        """بازگرداندن کارهایی که پیش از خاموشی قبلی اجرا نشده بودند"""
+        records = await self._journal_io(self._read_journal)
+        if not records:
+            return
+
+        done = {record["done"] for record in records if "done" in record}
+        for record in records:
+            if ("done" in record or record["id"] in done or record["id"] in self._journaled
+                    or record.get("name") not in self.handlers):
+                continue
+            # کارهایی که در صف جا نشوند در ژورنال می‌مانند برای راه‌اندازی بعدی
+            self._journaled[record["id"]] = record
+            try:
+                self._pending.put_nowait(record)
+                self.stats["replayed"] += 1
+            except asyncio.QueueFull:
+                pass
+        if self._pending.qsize():
+            self._idle.clear()
+        await self._compact_journal()
+        if self.stats["replayed"]:
+            print(f"♻️ {self.stats['replayed']} کار یادگیری از ژورنال بازیابی شد")
+
+    def get_stats(self) -> Dict:
+        """آمار صف یادگیری"""
+        return {
+            **self.stats,
+            "pending": self._pending.qsize() if self._pending else 0,
+            "in_flight": self._in_flight,
+            "running": self._dispatcher is not None and not self._dispatcher.done()
+        }
+
+def _is_json_native(value: Any) -> bool:
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(_is_json_native(item) for item in value)
+    if isinstance(value, dict):
+        return all(isinstance(key, str) and _is_json_native(item) for key, item in value.items())
+    return False
+
+# Instance سراسری
+learning_pipeline = LearningPipeline()
@@ -0,0 +1,243 @@
+"""
+🚦 زمان‌بند درخواست‌های تولید (جلوی کلاینت Ollama)
+هر مدل صف و سقف همزمانی خودش را دارد و تعداد مدل‌های سنگینی که همزمان کار می‌کنند
+محدود است تا Ollama مدل‌ها را مدام در RAM جابه‌جا نکند؛ درخواست‌های مدل بارگذاری شده
+اول سرویس می‌گیرند (دسته‌ای)، مگر اینکه درخواست مدل دیگری بیش از حد منتظر مانده باشد.
+درخواستی که تا پایان مهلت صف نوبت نگیرد (یا صف پر باشد) فوراً رد می‌شود
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, Optional
+
+from .model_registry import ModelRegistry
+from .ollama_client import OllamaClient
+
+class AdmissionRejected(Exception):
+    """درخواست تولید در صف زمان‌بند پذیرفته نشد (صف پر یا پایان مهلت)"""
+    def __init__(self, model: str, reason: str):
+        super().__init__(f"{model}: {reason}")
+        self.model = model
+        self.reason = reason
+
+class _Waiter:
+    __slots__ = ("future", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+class GenerationScheduler:
+    def __init__(self, client: OllamaClient, registry: ModelRegistry = None,
+                 per_model_concurrency: int = None, max_concurrency: int = None,
+                 max_active_models: int = None, queue_deadline: float = None,
+                 max_queue: int = None, fairness_window: float = 5.0,
+                 co_resident: Iterable[str] = ()):
+        self.client = client
+        self.registry = registry
+        self.per_model_concurrency = per_model_concurrency or int(os.getenv("ROBAH_LLM_PER_MODEL", "2"))
+        self.max_concurrency = max_concurrency or int(os.getenv("ROBAH_LLM_MAX_CONCURRENCY", "3"))
+        # چند مدل (غیر سبک) همزمان اجرا شوند - 1 یعنی بدون جابه‌جایی همزمان وزن‌ها
+        self.max_active_models = max_active_models or int(os.getenv("ROBAH_LLM_MAX_MODELS", "1"))
+        self.queue_deadline = queue_deadline or float(os.getenv("ROBAH_LLM_QUEUE_DEADLINE", "20"))
+        self.max_queue = max_queue or int(os.getenv("ROBAH_LLM_MAX_QUEUE", "16"))
+        self.fairness_window = fairness_window  # بیش از این انتظار، مدل دیگر نوبت می‌گیرد
+        self.co_resident = set(co_resident)     # مدل‌های کوچکی که کنار مدل اصلی در RAM جا می‌شوند
+
+        self.queues: Dict[str, deque] = {}
+        self.active: Dict[str, int] = {}
+        self.total_active = 0
+        self.last_model: Optional[str] = None
+
+        # آمار
+        self.stats = {
+            "admitted": 0,
+            "immediate": 0,
+            "queued": 0,
+            "rejected_full": 0,
+            "rejected_deadline": 0,
+            "cancelled": 0,
+            "model_switches": 0,
+            "resident_first": 0,
+            "fairness_switches": 0
+        }
+        self._waits: Dict[str, deque] = {}  # مدل -> آخرین زمان‌های انتظار (ms)
+
+    # ---------- پذیرش ----------
+
+    @asynccontextmanager
+    async def slot(self, model: str, deadline: float = None):
+        """گرفتن نوبت اجرای مدل برای کل مدت تولید (از جمله stream)"""
+        await self.acquire(model, deadline)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    async def acquire(self, model: str, deadline: float = None):
+        """انتظار برای نوبت - در صورت پر بودن صف یا پایان مهلت AdmissionRejected"""
+        if not self.queue_depth() and self._can_start(model):
+            self._start(model)
+            self.stats["immediate"] += 1
+            self._record_wait(model, 0.0)
+            return
+
+        if self.queue_depth() >= self.max_queue:
+            self.stats["rejected_full"] += 1
+            raise AdmissionRejected(model, "queue_full")
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future())
+        self.queues.setdefault(model, deque()).append(waiter)
+        self.stats["queued"] += 1
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), deadline or self.queue_deadline)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # نوبت همزمان با پایان مهلت رسید - آزاد شود تا نفر بعد استفاده کند
+                self.release(model)
+            else:
+                waiter.future.cancel()
+                self._dispatch()
+            if isinstance(e, asyncio.CancelledError):
+                self.stats["cancelled"] += 1
+                raise
+            self.stats["rejected_deadline"] += 1
+            raise AdmissionRejected(model, "deadline") from None
+
+        self._record_wait(model, (time.monotonic() - waiter.enqueued_at) * 1000)
+
+    def release(self, model: str):
+        self.active[model] -= 1
+        if not self.active[model]:
+            del self.active[model]
+        self.total_active -= 1
+        self._dispatch()
+
+    # ---------- انتخاب نوبت بعد ----------
+
+    def _counted_active(self) -> set:
+        return {name for name in self.active if name not in self.co_resident}
+
+    def _can_start(self, model: str) -> bool:
+        if self.total_active >= self.max_concurrency:
+            return False
+        if self.active.get(model, 0) >= self.per_model_concurrency:
+            return False
+        if model in self.co_resident or model in self.active:
+            return True
+        return len(self._counted_active()) < self.max_active_models
+
+    def _start(self, model: str):
+        self.active[model] = self.active.get(model, 0) + 1
+        self.total_active += 1
+        self.stats["admitted"] += 1
+        if model != self.last_model and model not in self.co_resident:
+            if self.last_model is not None:
+                self.stats["model_switches"] += 1
+            self.last_model = model
+
+    def _head(self, model: str) -> Optional[_Waiter]:
+        """اولین درخواست زنده صف مدل (درخواست‌های لغو شده حذف می‌شوند)"""
+        queue = self.queues.get(model)
+        while queue and queue[0].future.done():
+            queue.popleft()
+        if not queue:
+            self.queues.pop(model, None)
+            return None
+        return queue[0]
+
+    def is_warm(self, model: str) -> bool:
+        """مدل در حال اجرا، آخرین مدل اجرا شده یا بارگذاری شده در حافظه"""
+        if model in self.active or model == self.last_model:
+            return True
+        return self.registry is not None and self.registry.is_resident(model)
+
+    def _pick_model(self) -> Optional[str]:
+        heads = {model: self._head(model) for model in list(self.queues)}
+        heads = {model: head for model, head in heads.items() if head is not None}
+        if not heads:
+            return None
+
+        draining = False
+        oldest = min(heads, key=lambda model: heads[model].enqueued_at)
+        if time.monotonic() - heads[oldest].enqueued_at > self.fairness_window and not self.is_warm(oldest):
+            # درخواست مدل سرد زیاد منتظر مانده - مدل‌های فعال خالی شوند تا نوبت او برسد
+            if self._can_start(oldest):
+                self.stats["fairness_switches"] += 1
+                return oldest
+            draining = oldest not in self.co_resident
+
+        startable = [model for model in heads
+                     if self._can_start(model) and (not draining or model in self.co_resident)]
+        if not startable:
+            return None
+        warm = [model for model in startable if self.is_warm(model)]
+        if warm and oldest not in warm:
+            self.stats["resident_first"] += 1
+        return min(warm or startable, key=lambda model: heads[model].enqueued_at)
+
+    def _dispatch(self):
+        while self.total_active < self.max_concurrency:
+            model = self._pick_model()
+            if model is None:
+                return
+            waiter = self.queues[model].popleft()
+            self._start(model)
+            waiter.future.set_result(None)
+
+    # ---------- فراخوانی ----------
+
+    async def generate(self, model: str, prompt: str, options: Dict = None, timeout: float = None,
+                       queue_deadline: float = None, **extra) -> Dict:
+        """/api/generate بدون stream پس از گرفتن نوبت"""
+        async with self.slot(model, queue_deadline):
+            return await self.client.generate(model=model, prompt=prompt, options=options,
+                                              timeout=timeout, **extra)
+
+    # ---------- آمار ----------
+
+    def queue_depth(self, model: str = None) -> int:
+        if model is not None:
+            return sum(1 for waiter in self.queues.get(model, ()) if not waiter.future.done())
+        return sum(self.queue_depth(name) for name in self.queues)
+
+    def _record_wait(self, model: str, wait_ms: float):
+        self._waits.setdefault(model, deque(maxlen=200)).append(wait_ms)
+
+    def get_stats(self) -> Dict:
+        """عمق صف، اجراهای فعال و زمان انتظار هر مدل"""
+        def summary(values) -> Dict:
+            ordered = sorted(values)
+            return {
+                "count": len(ordered),
+                "avg_wait_ms": round(sum(ordered) / len(ordered), 1),
+                "p95_wait_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1)
+            }
+
+        models = set(self.queues) | set(self.active) | set(self._waits)
+        return {
+            **self.stats,
+            "queue_depth": self.queue_depth(),
+            "active": self.total_active,
+            "last_model": self.last_model,
+            "limits": {
+                "per_model": self.per_model_concurrency,
+                "total": self.max_concurrency,
+                "active_models": self.max_active_models,
+                "queue_deadline": self.queue_deadline,
+                "max_queue": self.max_queue
+            },
+            "models": {
+                model: {
+                    "queued": self.queue_depth(model),
+                    "active": self.active.get(model, 0),
+                    **(summary(self._waits[model]) if self._waits.get(model) else {})
+                }
+                for model in sorted(models)
+            }
+        }
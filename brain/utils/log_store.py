@@ -0,0 +1,388 @@
+"""
+🗄️ ذخیره‌سازی لاگ‌های مکالمه و یادگیری
+دو موتور: فایل‌های JSONL فعلی (پیش‌فرض) یا SQLite در حالت WAL با ایندکس روی زمان، موضوع و نقش
+انتخاب موتور: متغیر محیطی ROBAH_STORAGE=sqlite
+"""
+
+import glob
+import json
+import os
+import sqlite3
+import threading
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+# جریان‌های لاگ و فایل JSONL متناظر ({date} = تاریخ رکورد)
+STREAMS = {
+    "learning_conversations": "data/learning/conversations.jsonl",
+    "learning_prompts": "data/learning/learning_prompts.md",
+    "dataset_learning": "data/datasets/learning_data.jsonl",
+    "personality_interactions": "data/personality/interactions.jsonl",
+    "user_interactions": "data/personality/user_interactions.jsonl",
+    "long_term_memory": "data/memory/long_term/{date}.jsonl",
+    "routing_decisions": "data/logs/routing/{date}.jsonl",
+}
+
+def record_topics(record: Dict, topic: str = None) -> List[str]:
+    """موضوعات یک رکورد - فهرست topics (مثل تعاملات پروفایل) یا موضوع تکی؛ تعریف مشترک هر دو موتور"""
+    if isinstance(record.get("topics"), list):
+        return [str(t) for t in record["topics"]]
+    topic = topic or record.get("topic")
+    return [str(topic)] if topic else []
+
+class JsonlLogBackend:
+    """موتور فایل - رفتار قبلی
+
+    شمارش، موضوعات، آمار روزانه و آخرین رکوردها (پرس‌وجوهای /analytics) به صورت افزایشی
+    نگه داشته می‌شوند: هر بار فقط خطوط اضافه شده از آخرین خواندن هر فایل پردازش می‌شوند.
+    پرس‌وجوهای فیلتردار هنوز کل فایل را می‌خوانند.
+    """
+    name = "jsonl"
+    recent_size = 100
+
+    def __init__(self):
+        self._tails: Dict[str, Dict] = {}  # مسیر -> آمار افزایشی
+        self._lock = threading.Lock()
+
+    def _path(self, stream: str, timestamp: str) -> str:
+        return STREAMS[stream].format(date=timestamp[:10])
+
+    def _paths(self, stream: str) -> List[str]:
+        pattern = STREAMS[stream]
+        if "{date}" in pattern:
+            return sorted(glob.glob(pattern.format(date="*")))
+        return [pattern] if os.path.exists(pattern) else []
+
+    def append(self, stream: str, record: Dict, timestamp: str, role: str = None, topic: str = None):
+        path = self._path(stream, timestamp)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            if path.endswith(".md"):
+                f.write(f"\n\n---\n\n{record.get('text', '')}")
+            else:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _iter(self, stream: str):
+        for path in self._paths(stream):
+            if path.endswith(".md"):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+    def _tail(self, path: str) -> Dict:
+        """به‌روزرسانی آمار یک فایل فقط با خطوط کامل اضافه شده از آخرین خواندن"""
+        with self._lock:
+            size = os.path.getsize(path)
+            tail = self._tails.get(path)
+            if tail is None or size < tail["offset"]:
+                # فایل جدید یا کوتاه‌تر شده (جایگزین شده) - از ابتدا
+                tail = {"offset": 0, "count": 0, "topics": Counter(), "days": Counter(),
+                        "recent": deque(maxlen=self.recent_size)}
+                self._tails[path] = tail
+            if size == tail["offset"]:
+                return tail
+
+            with open(path, "rb") as f:
+                f.seek(tail["offset"])
+                data = f.read(size - tail["offset"])
+            complete = data.rfind(b"\n") + 1
+            for line in data[:complete].splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                tail["count"] += 1
+                tail["topics"].update(record_topics(record))
+                tail["days"][record.get("timestamp", "")[:10]] += 1
+                tail["recent"].append(record)
+            tail["offset"] += complete
+            return tail
+
+    def _tails_of(self, stream: str) -> List[Dict]:
+        return [self._tail(path) for path in self._paths(stream) if not path.endswith(".md")]
+
+    def count(self, stream: str, since: str = None) -> int:
+        if since is None:
+            total = sum(tail["count"] for tail in self._tails_of(stream))
+            for path in self._paths(stream):
+                if path.endswith(".md"):
+                    with open(path, "r", encoding="utf-8") as f:
+                        total += sum(1 for chunk in f.read().split("\n---\n") if chunk.strip())
+            return total
+        return sum(1 for record in self._iter(stream) if record.get("timestamp", "") >= since)
+
+    def query(self, stream: str, topic: str = None, role: str = None, text: str = None,
+              since: str = None, limit: int = 50) -> List[Dict]:
+        if not (topic or role or text or since) and limit <= self.recent_size:
+            # بدون فیلتر: آخرین رکوردهای نگه داشته شده کافی است
+            recent = [record for tail in self._tails_of(stream) for record in tail["recent"]]
+            recent.sort(key=lambda r: r.get("timestamp", ""), reverse=True)
+            return recent[:limit]
+
+        matches = []
+        for record in self._iter(stream):
+            if since and record.get("timestamp", "") < since:
+                continue
+            if role and record.get("role") != role:
+                continue
+            if topic and topic not in record_topics(record):
+                continue
+            if text and text.lower() not in json.dumps(record, ensure_ascii=False).lower():
+                continue
+            matches.append(record)
+        matches.sort(key=lambda r: r.get("timestamp", ""), reverse=True)
+        return matches[:limit]
+
+    def topic_counts(self, stream: str, limit: int = 10, since: str = None) -> List[tuple]:
+        counter = Counter()
+        if since is None:
+            for tail in self._tails_of(stream):
+                counter.update(tail["topics"])
+            return counter.most_common(limit)
+
+        for record in self._iter(stream):
+            if since and record.get("timestamp", "") < since:
+                continue
+            counter.update(record_topics(record))
+        return counter.most_common(limit)
+
+    def daily_counts(self, stream: str, days: int = 7) -> List[tuple]:
+        since = (datetime.now() - timedelta(days=days)).date().isoformat()
+        counter = Counter()
+        for tail in self._tails_of(stream):
+            counter.update({day: count for day, count in tail["days"].items() if day >= since})
+        return sorted(counter.items())
+
+class SqliteLogBackend:
+    """موتور SQLite در حالت WAL - پرس‌وجوها از ایندکس استفاده می‌کنند"""
+    name = "sqlite"
+
+    def __init__(self, db_path: str = "data/fox.db"):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        # اتصال مشترک بین thread ها؛ نوشتن‌ها با قفل سریالی می‌شوند
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self):
+        with self._lock:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    stream TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    role TEXT,
+                    topic TEXT,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_logs_stream_time ON logs(stream, timestamp);
+                CREATE INDEX IF NOT EXISTS idx_logs_stream_topic ON logs(stream, topic);
+                CREATE INDEX IF NOT EXISTS idx_logs_stream_role ON logs(stream, role);
+                CREATE TABLE IF NOT EXISTS log_topics (
+                    log_id INTEGER NOT NULL,
+                    stream TEXT NOT NULL,
+                    topic TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_log_topics ON log_topics(stream, topic);
+                CREATE TABLE IF NOT EXISTS migrations (
+                    path TEXT PRIMARY KEY,
+                    migrated_at TEXT NOT NULL,
+                    records INTEGER NOT NULL
+                );
+            """)
+
+    def _insert(self, stream: str, record: Dict, timestamp: str, role: str = None, topic: str = None):
+        cursor = self.conn.execute(
+            "INSERT INTO logs (stream, timestamp, role, topic, data) VALUES (?, ?, ?, ?, ?)",
+            (stream, timestamp, role, topic, json.dumps(record, ensure_ascii=False))
+        )
+        # موضوعات چندگانه (مثل topics در تعاملات پروفایل) در جدول جدا ایندکس می‌شوند
+        topics = record_topics(record, topic)
+        if topics:
+            self.conn.executemany(
+                "INSERT INTO log_topics (log_id, stream, topic) VALUES (?, ?, ?)",
+                [(cursor.lastrowid, stream, str(t)) for t in topics]
+            )
+
+    def append(self, stream: str, record: Dict, timestamp: str, role: str = None, topic: str = None):
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self._insert(stream, record, timestamp, role, topic)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def _fetch(self, sql: str, params) -> List[sqlite3.Row]:
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def count(self, stream: str, since: str = None) -> int:
+        if since:
+            rows = self._fetch("SELECT COUNT(*) FROM logs WHERE stream = ? AND timestamp >= ?", (stream, since))
+        else:
+            rows = self._fetch("SELECT COUNT(*) FROM logs WHERE stream = ?", (stream,))
+        return rows[0][0]
+
+    def query(self, stream: str, topic: str = None, role: str = None, text: str = None,
+              since: str = None, limit: int = 50) -> List[Dict]:
+        sql = "SELECT data FROM logs WHERE stream = ?"
+        params: list = [stream]
+        if topic:
+            sql += " AND id IN (SELECT log_id FROM log_topics WHERE stream = ? AND topic = ?)"
+            params += [stream, topic]
+        if role:
+            sql += " AND role = ?"
+            params.append(role)
+        if since:
+            sql += " AND timestamp >= ?"
+            params.append(since)
+        if text:
+            # % و _ در متن کاربر wildcard نیستند
+            escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            sql += " AND data LIKE ? ESCAPE '\\'"
+            params.append(f"%{escaped}%")
+        sql += " ORDER BY timestamp DESC LIMIT ?"
+        params.append(limit)
+        return [json.loads(row["data"]) for row in self._fetch(sql, params)]
+
+    def topic_counts(self, stream: str, limit: int = 10, since: str = None) -> List[tuple]:
+        if since:
+            rows = self._fetch(
+                """SELECT t.topic, COUNT(*) AS c FROM log_topics t JOIN logs l ON l.id = t.log_id
+                   WHERE t.stream = ? AND l.timestamp >= ? GROUP BY t.topic ORDER BY c DESC LIMIT ?""",
+                (stream, since, limit)
+            )
+        else:
+            rows = self._fetch(
+                "SELECT topic, COUNT(*) AS c FROM log_topics WHERE stream = ? GROUP BY topic ORDER BY c DESC LIMIT ?",
+                (stream, limit)
+            )
+        return [(row[0], row[1]) for row in rows]
+
+    def daily_counts(self, stream: str, days: int = 7) -> List[tuple]:
+        since = (datetime.now() - timedelta(days=days)).date().isoformat()
+        rows = self._fetch(
+            """SELECT substr(timestamp, 1, 10) AS day, COUNT(*) FROM logs
+               WHERE stream = ? AND timestamp >= ? GROUP BY day ORDER BY day""",
+            (stream, since)
+        )
+        return [(row[0], row[1]) for row in rows]
+
+    def migrate_from_files(self) -> int:
+        """انتقال یکباره فایل‌های JSONL موجود به پایگاه داده (فایل‌ها دست نمی‌خورند)"""
+        files_backend = JsonlLogBackend()
+        total = 0
+        for stream in STREAMS:
+            for path in files_backend._paths(stream):
+                if self._fetch("SELECT 1 FROM migrations WHERE path = ?", (path,)):
+                    continue
+                records = self._read_file(path)
+                with self._lock:
+                    self.conn.execute("BEGIN")
+                    try:
+                        for record in records:
+                            timestamp = record.get("timestamp") or datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+                            self._insert(stream, record, timestamp, record.get("role"), record.get("topic"))
+                        self.conn.execute(
+                            "INSERT INTO migrations (path, migrated_at, records) VALUES (?, ?, ?)",
+                            (path, datetime.now().isoformat(), len(records))
+                        )
+                        self.conn.execute("COMMIT")
+                    except Exception as e:
+                        self.conn.execute("ROLLBACK")
+                        print(f"⚠️ خطا در انتقال {path}: {e}")
+                        continue
+                total += len(records)
+                print(f"📦 انتقال {path}: {len(records)} رکورد")
+        return total
+
+    def _read_file(self, path: str) -> List[Dict]:
+        with open(path, "r", encoding="utf-8") as f:
+            if path.endswith(".md"):
+                return [{"text": chunk.strip()} for chunk in f.read().split("\n---\n") if chunk.strip()]
+            records = []
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+            return records
+
+class LogStore:
+    def __init__(self, backend: str = None):
+        backend = backend or os.getenv("ROBAH_STORAGE", "jsonl")
+        self.backend = JsonlLogBackend()
+
+        if backend == "sqlite":
+            try:
+                self.backend = SqliteLogBackend(os.getenv("ROBAH_DB_PATH", "data/fox.db"))
+                migrated = self.backend.migrate_from_files()
+                if migrated:
+                    print(f"🗄️ {migrated} رکورد از فایل‌های JSONL به SQLite منتقل شد")
+                print("🗄️ ذخیره‌سازی لاگ‌ها: SQLite (WAL)")
+            except sqlite3.Error as e:
+                print(f"⚠️ SQLite در دسترس نیست، استفاده از فایل‌های JSONL: {e}")
+                self.backend = JsonlLogBackend()
+
+    def append(self, stream: str, record: Dict, role: str = None, topic: str = None):
+        """افزودن رکورد به یک جریان لاگ"""
+        timestamp = record.get("timestamp") or datetime.now().isoformat()
+        try:
+            self.backend.append(stream, record, timestamp, role=role, topic=topic)
+        except Exception as e:
+            print(f"⚠️ خطا در ثبت لاگ {stream}: {e}")
+
+    def count(self, stream: str, since: str = None) -> int:
+        try:
+            return self.backend.count(stream, since)
+        except Exception as e:
+            print(f"⚠️ خطا در شمارش {stream}: {e}")
+            return 0
+
+    def query(self, stream: str, topic: str = None, role: str = None, text: str = None,
+              since: str = None, limit: int = 50) -> List[Dict]:
+        """جدیدترین رکوردها با فیلتر"""
+        try:
+            return self.backend.query(stream, topic=topic, role=role, text=text, since=since, limit=limit)
+        except Exception as e:
+            print(f"⚠️ خطا در جستجوی {stream}: {e}")
+            return []
+
+    def topic_counts(self, stream: str, limit: int = 10, since: str = None) -> List[tuple]:
+        try:
+            return self.backend.topic_counts(stream, limit, since)
+        except Exception as e:
+            print(f"⚠️ خطا در آمار موضوعات {stream}: {e}")
+            return []
+
+    def daily_counts(self, stream: str, days: int = 7) -> List[tuple]:
+        try:
+            return self.backend.daily_counts(stream, days)
+        except Exception as e:
+            print(f"⚠️ خطا در آمار روزانه {stream}: {e}")
+            return []
+
+    @property
+    def is_indexed(self) -> bool:
+        return self.backend.name == "sqlite"
+
+# Instance سراسری
+log_store = LogStore()
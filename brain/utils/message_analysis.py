@@ -0,0 +1,151 @@
+"""
+🧾 تحلیل یک‌باره پیام
+متن هر پیام فقط یک بار یکسان‌سازی و توکن‌بندی می‌شود و نتیجه طبقه‌بندی‌ها روی همین شیء
+نگه داشته می‌شود؛ همه زیرسیستم‌ها (مغز، دیتاست، پروفایل، شخصیت) همین شیء را می‌گیرند
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from .keyword_matcher import KeywordMatcher, normalize_persian
+
+TOKEN_PATTERN = re.compile(r'\w+')
+PERSIAN_WORD_PATTERN = re.compile(r'[آ-ی]+')
+PERSIAN_CHAR_PATTERN = re.compile(r'[آ-ی]')
+LATIN_CHAR_PATTERN = re.compile(r'[a-zA-Z]')
+
+class MessageAnalysis:
+    def __init__(self, text: str):
+        self.text = text
+        self.lower = text.lower()
+        self.normalized = normalize_persian(text)
+
+        # نتایج محاسبه شده - به صورت تنبل با memo اضافه می‌شوند
+        self._memo: Dict[str, Any] = {}
+        self._scans: Dict[int, Dict[str, List[str]]] = {}  # id(matcher) -> نتیجه پیمایش
+
+    @classmethod
+    def of(cls, message) -> "MessageAnalysis":
+        """شیء تحلیل موجود را برمی‌گرداند یا برای متن یک شیء جدید می‌سازد"""
+        if isinstance(message, MessageAnalysis):
+            return message
+        return cls(message or "")
+
+    def __str__(self) -> str:
+        return self.text
+
+    # ---------- نتایج تنبل ----------
+
+    def memo(self, key: str, compute: Callable[[], Any]) -> Any:
+        """محاسبه یک بار و نگه‌داری نتیجه برای مصرف‌کننده‌های بعدی"""
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    def set(self, key: str, value: Any):
+        self._memo[key] = value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self._memo.get(key, default)
+
+    # ---------- توکن‌ها ----------
+
+    @property
+    def words(self) -> List[str]:
+        """کلمات جدا شده با فاصله (معادل message.split())"""
+        return self.memo("words", self.text.split)
+
+    @property
+    def word_count(self) -> int:
+        return len(self.words)
+
+    @property
+    def tokens(self) -> List[str]:
+        """توکن‌های متن یکسان‌سازی شده"""
+        return self.memo("tokens", lambda: TOKEN_PATTERN.findall(self.normalized))
+
+    @property
+    def persian_words(self) -> List[str]:
+        """کلمات فارسی (معادل re.findall(r'[آ-ی]+', message.lower()))"""
+        return self.memo("persian_words", lambda: PERSIAN_WORD_PATTERN.findall(self.lower))
+
+    @property
+    def persian_ratio(self) -> float:
+        """نسبت حروف فارسی به کل حروف"""
+        return self._script_ratios()[0]
+
+    @property
+    def latin_ratio(self) -> float:
+        """نسبت حروف لاتین به کل حروف"""
+        return self._script_ratios()[1]
+
+    def _script_ratios(self):
+        def compute():
+            persian = len(PERSIAN_CHAR_PATTERN.findall(self.text))
+            latin = len(LATIN_CHAR_PATTERN.findall(self.text))
+            total = persian + latin
+            if total == 0:
+                return (0.0, 0.0)
+            return (persian / total, latin / total)
+        return self.memo("script_ratios", compute)
+
+    @property
+    def has_question(self) -> bool:
+        return "؟" in self.text or "?" in self.text
+
+    # ---------- طبقه‌بندی با کلمات کلیدی ----------
+
+    def scan(self, matcher: KeywordMatcher) -> Dict[str, List[str]]:
+        """پیمایش متن با matcher - هر matcher فقط یک بار برای هر پیام اجرا می‌شود"""
+        key = id(matcher)
+        if key not in self._scans:
+            self._scans[key] = matcher.scan(self.normalized, normalized=True)
+        return self._scans[key]
+
+    def contains(self, matcher: KeywordMatcher, category: str = None) -> bool:
+        found = self.scan(matcher)
+        return bool(found) if category is None else category in found
+
+    def matched_categories(self, matcher: KeywordMatcher) -> List[str]:
+        found = self.scan(matcher)
+        return [category for category in matcher.categories if category in found]
+
+    def first_category(self, matcher: KeywordMatcher) -> Optional[str]:
+        categories = self.matched_categories(matcher)
+        return categories[0] if categories else None
+
+    def scores(self, matcher: KeywordMatcher) -> Dict[str, int]:
+        return {category: len(keywords) for category, keywords in self.scan(matcher).items()}
+
+    # ---------- نتایج مشترک ----------
+
+    @property
+    def emotion(self) -> Optional[str]:
+        return self._memo.get("emotion")
+
+    @property
+    def intent(self) -> Optional[str]:
+        return self._memo.get("intent")
+
+    @property
+    def topic(self) -> Optional[str]:
+        return self._memo.get("topic")
+
+    @property
+    def has_code(self) -> Optional[bool]:
+        return self._memo.get("has_code")
+
+    def to_dict(self) -> Dict:
+        """خلاصه تحلیل برای لاگ و دیباگ"""
+        return {
+            "word_count": self.word_count,
+            "persian_ratio": round(self.persian_ratio, 2),
+            "latin_ratio": round(self.latin_ratio, 2),
+            "emotion": self.emotion,
+            "intent": self.intent,
+            "topic": self.topic,
+            "has_code": self.has_code
+        }
+
+# متن خام یا تحلیل آماده - توابعی که MessageAnalysis.of می‌زنند هر دو را می‌پذیرند
+MessageLike = Union[str, MessageAnalysis]
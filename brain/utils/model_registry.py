@@ -0,0 +1,200 @@
+"""
+📋 رجیستری مدل‌های Ollama
+نگه‌داری وضعیت مدل‌ها (دانلود شده / بارگذاری شده در حافظه) با TTL
+و باطل‌سازی فوری هنگام خطا - به جای پرسیدن /api/tags در هر درخواست
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional, Set
+
+from .ollama_client import OllamaClient, OllamaError
+
+class ModelRegistry:
+    def __init__(self, client: OllamaClient, models: Dict[str, str], ttl: float = 30):
+        self.client = client
+        self.models = models
+
+        # تنظیمات زمان‌بندی (ثانیه)
+        self.ttl = ttl                  # اعتبار وضعیت کش شده
+        self.offline_retry = 5          # فاصله بررسی مجدد وقتی سرور در دسترس نیست
+        self.failure_cooldown = 60      # مدت کنار گذاشتن مدلی که خطا داده
+
+        # وضعیت کش شده
+        self.server_online = False
+        self.pulled: Set[str] = set()     # مدل‌های دانلود شده (/api/tags)
+        self.resident: Set[str] = set()   # مدل‌های بارگذاری شده در حافظه (/api/ps)
+        self.failed: Dict[str, float] = {}  # مدل -> زمان آخرین خطا
+        self.last_refresh = 0.0
+
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._monitor_task: Optional[asyncio.Task] = None
+
+        # آمار
+        self.stats = {
+            "refreshes": 0,
+            "refresh_failures": 0,
+            "invalidations": 0,
+            "cache_reads": 0
+        }
+
+    # ---------- به‌روزرسانی وضعیت ----------
+
+    async def refresh(self) -> bool:
+        """دریافت وضعیت مدل‌ها از سرور و به‌روزرسانی کش"""
+        self.stats["refreshes"] += 1
+        try:
+            pulled = await self.client.list_models()
+        except (OllamaError, asyncio.TimeoutError):
+            self.stats["refresh_failures"] += 1
+            self.server_online = False
+            self.resident.clear()
+            self.last_refresh = time.time()
+            return False
+
+        try:
+            resident = await self.client.list_running()
+        except (OllamaError, asyncio.TimeoutError):
+            # نسخه‌های قدیمی Ollama از /api/ps پشتیبانی نمی‌کنند
+            resident = [name for name in self.resident if name in pulled]
+
+        self.pulled = set(pulled)
+        self.resident = set(resident)
+        self.server_online = True
+        self.last_refresh = time.time()
+        return True
+
+    def is_stale(self) -> bool:
+        """آیا وضعیت کش شده منقضی شده است؟"""
+        interval = self.ttl if self.server_online else self.offline_retry
+        return time.time() - self.last_refresh > interval
+
+    async def ensure_fresh(self):
+        """اطمینان از تازه بودن وضعیت
+
+        فقط بار اول یا وقتی سرور آفلاین بوده منتظر می‌ماند؛
+        در غیر این صورت وضعیت قبلی استفاده شده و به‌روزرسانی در پس‌زمینه انجام می‌شود.
+        """
+        self.stats["cache_reads"] += 1
+        if not self.is_stale():
+            return
+
+        if self.last_refresh == 0 or not self.server_online:
+            await self._refresh_once()
+        else:
+            self._schedule_refresh()
+
+    async def _refresh_once(self):
+        """جلوگیری از چند درخواست همزمان برای به‌روزرسانی"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.refresh())
+        await asyncio.shield(self._refresh_task)
+
+    def _schedule_refresh(self):
+        """به‌روزرسانی در پس‌زمینه بدون منتظر ماندن"""
+        if self._refresh_task is None or self._refresh_task.done():
+            try:
+                self._refresh_task = asyncio.get_running_loop().create_task(self.refresh())
+            except RuntimeError:
+                pass  # خارج از event loop
+
+    def invalidate(self, model_name: str = None):
+        """باطل‌سازی فوری وضعیت پس از خطا در فراخوانی مدل"""
+        self.stats["invalidations"] += 1
+        if model_name:
+            self.failed[model_name] = time.time()
+            self.resident.discard(model_name)
+        self._schedule_refresh()
+
+    def mark_success(self, model_name: str):
+        """پاسخ موفق یعنی مدل در حافظه است و سالم"""
+        self.failed.pop(model_name, None)
+        self.resident.add(model_name)
+        self.server_online = True
+
+    # ---------- سرویس پس‌زمینه ----------
+
+    def start(self):
+        """شروع به‌روزرسانی دوره‌ای در پس‌زمینه"""
+        if self._monitor_task is None or self._monitor_task.done():
+            self._monitor_task = asyncio.create_task(self._monitor_loop())
+
+    async def _monitor_loop(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.ttl if self.server_online else self.offline_retry)
+
+    async def stop(self):
+        """توقف سرویس پس‌زمینه"""
+        for task in (self._monitor_task, self._refresh_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._monitor_task = None
+        self._refresh_task = None
+
+    # ---------- خواندن وضعیت کش شده ----------
+
+    def _match(self, model_name: str, names: Set[str]) -> bool:
+        return any(model_name in available for available in names)
+
+    def is_pulled(self, model_name: str) -> bool:
+        return self._match(model_name, self.pulled)
+
+    def is_resident(self, model_name: str) -> bool:
+        return self._match(model_name, self.resident)
+
+    def is_healthy(self, model_name: str) -> bool:
+        """مدلی که اخیراً خطا داده تا پایان cooldown ناسالم است"""
+        failed_at = self.failed.get(model_name)
+        if failed_at is None:
+            return True
+        if time.time() - failed_at > self.failure_cooldown:
+            del self.failed[model_name]
+            return True
+        return False
+
+    def is_ready(self) -> bool:
+        """آیا سرور در دسترس است و حداقل یکی از مدل‌ها دانلود شده؟"""
+        return self.server_online and any(self.is_pulled(name) for name in self.models.values())
+
+    def available_models(self) -> List[str]:
+        return sorted(self.pulled)
+
+    def resolve(self, model_name: str) -> str:
+        """انتخاب مدل قابل استفاده - اگر مدل درخواستی موجود نیست، نزدیک‌ترین جایگزین
+
+        اولویت با مدل‌های بارگذاری شده در حافظه است تا زمان load صرف نشود.
+        """
+        # بدون اطلاعات از سرور، انتخاب اولیه را تغییر نده
+        if not self.server_online or not self.pulled:
+            return model_name
+
+        if self.is_pulled(model_name) and self.is_healthy(model_name):
+            return model_name
+
+        candidates = [self.models.get("persian"), self.models.get("fast")]
+        candidates += [name for name in self.models.values() if name not in candidates]
+        usable = [name for name in candidates
+                  if name and self.is_pulled(name) and self.is_healthy(name)]
+        if not usable:
+            return model_name
+
+        resident = [name for name in usable if self.is_resident(name)]
+        replacement = (resident or usable)[0]
+        print(f"🔁 مدل {model_name} در دسترس نیست، استفاده از {replacement}")
+        return replacement
+
+    def get_status(self) -> Dict:
+        """وضعیت رجیستری"""
+        return {
+            "server_online": self.server_online,
+            "pulled": {key: self.is_pulled(name) for key, name in self.models.items()},
+            "resident": sorted(self.resident),
+            "unhealthy": sorted(name for name in list(self.failed) if not self.is_healthy(name)),
+            "age_seconds": round(time.time() - self.last_refresh, 1) if self.last_refresh else None,
+            "stats": self.stats
+        }
@@ -0,0 +1,244 @@
+"""
+🏠 مدیریت حضور مدل‌ها در حافظه (گرم‌سازی و خارج کردن)
+از هر استفاده، ساعت روز و موضوعات پیام (از user_profiler) برای هر مدل ثبت می‌شود؛
+مدل‌هایی که برای ساعت فعلی و علایق کاربر بیشترین احتمال استفاده را دارند از قبل
+بارگذاری می‌شوند و keep_alive طولانی می‌گیرند، و مدل‌های سنگین بیکار وقتی مجموع
+حافظه از بودجه RAM بیشتر شود خارج می‌شوند. رویدادها در /status دیده می‌شوند
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .llm_scheduler import AdmissionRejected, GenerationScheduler
+from .model_registry import ModelRegistry
+from .ollama_client import OllamaClient, OllamaError
+from .state_store import state_store
+
+GB = 1024 ** 3
+
+class ModelResidencyManager:
+    def __init__(self, client: OllamaClient, registry: ModelRegistry, scheduler: GenerationScheduler,
+                 default_models: Iterable[str], is_allowed: Callable[[str], bool] = None,
+                 ram_budget_gb: float = None, warm_count: int = None, interval: float = 300,
+                 idle_timeout: float = 600, usage_file: str = "data/models/residency_usage.json"):
+        self.client = client
+        self.registry = registry
+        self.scheduler = scheduler
+        self.default_models = list(default_models)  # پیش‌بینی پیش‌فرض وقتی هنوز تاریخچه‌ای نیست
+        self.is_allowed = is_allowed or (lambda model: True)
+        self.ram_budget = (ram_budget_gb or float(os.getenv("ROBAH_MODEL_RAM_GB", "24"))) * GB
+        self.warm_count = warm_count or int(os.getenv("ROBAH_WARM_MODELS", "2"))
+        self.interval = interval          # فاصله دور پیش‌بینی/گرم‌سازی
+        self.idle_timeout = idle_timeout  # مدل بیکارتر از این مقدار قابل خارج شدن است
+        self.usage_file = usage_file
+
+        # مدل -> ساعت -> وزن استفاده، و موضوع -> مدل -> تعداد
+        self.hourly_usage: Dict[str, Dict[str, float]] = {}
+        self.topic_models: Dict[str, Dict[str, int]] = {}
+        self._load_usage()
+
+        self.last_used: Dict[str, float] = {}
+        self.sizes: Dict[str, int] = {}       # حجم مدل در حافظه (از /api/ps یا /api/tags)
+        self.resident_sizes: Dict[str, int] = {}
+        self.predicted: List[str] = []
+        self.events = deque(maxlen=50)
+
+        self._task: Optional[asyncio.Task] = None
+
+        # آمار
+        self.stats = {
+            "cycles": 0,
+            "warmups": 0,
+            "warmup_failures": 0,
+            "evictions": 0,
+            "skipped_budget": 0
+        }
+
+    # ---------- ثبت استفاده ----------
+
+    def _load_usage(self):
+        if not os.path.exists(self.usage_file):
+            return
+        try:
+            with open(self.usage_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.hourly_usage = data.get("hourly_usage", {})
+            self.topic_models = data.get("topic_models", {})
+        except (OSError, ValueError) as e:
+            print(f"⚠️ خطا در بارگذاری الگوی استفاده مدل‌ها: {e}")
+
+    def _usage_snapshot(self) -> Dict:
+        return {
+            "hourly_usage": {model: dict(hours) for model, hours in self.hourly_usage.items()},
+            "topic_models": {topic: dict(models) for topic, models in self.topic_models.items()}
+        }
+
+    def record_use(self, model: str, topics: Iterable[str] = ()):
+        """ثبت نیاز به مدل در این ساعت و برای این موضوعات"""
+        self.last_used[model] = time.time()
+        hours = self.hourly_usage.setdefault(model, {})
+        hour = str(datetime.now().hour)
+        hours[hour] = hours.get(hour, 0) + 1
+        for topic in topics:
+            models = self.topic_models.setdefault(topic, {})
+            models[model] = models.get(model, 0) + 1
+        state_store.schedule_save(self.usage_file, self._usage_snapshot, indent=2)
+
+    # ---------- پیش‌بینی ----------
+
+    def predict(self, topics_of_interest: Iterable[str] = (), hour: int = None) -> List[str]:
+        """مدل‌ها به ترتیب احتمال استفاده در ساعت فعلی (و ساعت بعد) با توجه به علایق کاربر"""
+        hour = datetime.now().hour if hour is None else hour
+        window = [str(hour), str((hour + 1) % 24)]
+
+        hour_total = sum(hours.get(h, 0) for hours in self.hourly_usage.values() for h in window)
+        scores: Dict[str, float] = {}
+        if hour_total:
+            for model, hours in self.hourly_usage.items():
+                scores[model] = 0.7 * sum(hours.get(h, 0) for h in window) / hour_total
+
+        topics = [topic for topic in topics_of_interest if topic in self.topic_models][:5]
+        for topic in topics:
+            topic_total = sum(self.topic_models[topic].values())
+            for model, count in self.topic_models[topic].items():
+                scores[model] = scores.get(model, 0.0) + 0.3 * count / topic_total / len(topics)
+
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        ranked += [model for model in self.default_models if model not in ranked]
+        return [model for model in ranked if self.is_allowed(model)]
+
+    def keep_alive_for(self, model: str) -> str:
+        """مدل‌های پیش‌بینی شده در حافظه می‌مانند؛ بقیه زود آزاد می‌شوند"""
+        if model in self.predicted[:self.warm_count] or model in self.default_models:
+            return os.getenv("ROBAH_KEEP_ALIVE", "30m")
+        return os.getenv("ROBAH_COLD_KEEP_ALIVE", "5m")
+
+    # ---------- گرم‌سازی و خارج کردن ----------
+
+    def _event(self, event: str, model: str, reason: str):
+        self.events.append({
+            "timestamp": datetime.now().isoformat(),
+            "event": event,
+            "model": model,
+            "reason": reason
+        })
+        print(f"🏠 {event}: {model} ({reason})")
+
+    async def _refresh_sizes(self):
+        try:
+            for model in await self.client.model_details():
+                self.sizes.setdefault(model["name"], model.get("size", 0))
+            running = await self.client.running_details()
+        except (OllamaError, asyncio.TimeoutError):
+            return False
+        self.resident_sizes = {model["name"]: model.get("size", 0) for model in running}
+        self.sizes.update(self.resident_sizes)
+        return True
+
+    def _size_of(self, model: str) -> int:
+        for name, size in self.sizes.items():
+            if model in name:
+                return size
+        return 0
+
+    def _is_idle(self, model: str) -> bool:
+        if self.scheduler.active.get(model) or self.scheduler.queue_depth(model):
+            return False
+        return time.time() - self.last_used.get(model, 0) > self.idle_timeout
+
+    async def warm(self, model: str, reason: str = "predicted") -> bool:
+        """بارگذاری مدل با نوبت زمان‌بند تا با تولیدهای جاری رقابت نکند"""
+        try:
+            async with self.scheduler.slot(model, deadline=5):
+                await self.client.load(model, keep_alive=self.keep_alive_for(model), timeout=120)
+        except (AdmissionRejected, OllamaError, asyncio.TimeoutError) as e:
+            self.stats["warmup_failures"] += 1
+            self._event("warm_failed", model, str(e)[:80])
+            return False
+        self.stats["warmups"] += 1
+        self.registry.mark_success(model)
+        self.resident_sizes[model] = self._size_of(model)
+        self._event("warm", model, reason)
+        return True
+
+    async def evict(self, model: str, reason: str = "idle") -> bool:
+        try:
+            await self.client.unload(model)
+        except (OllamaError, asyncio.TimeoutError) as e:
+            print(f"⚠️ خطا در خارج کردن مدل {model}: {e}")
+            return False
+        self.stats["evictions"] += 1
+        self.registry.resident.discard(model)
+        self.resident_sizes.pop(model, None)
+        self._event("evict", model, reason)
+        return True
+
+    async def run_cycle(self, topics_of_interest: Iterable[str] = ()):
+        """یک دور: پیش‌بینی، خارج کردن مدل‌های بیکار سنگین، گرم کردن مدل‌های لازم"""
+        self.stats["cycles"] += 1
+        if not await self._refresh_sizes():
+            return
+
+        self.predicted = self.predict(topics_of_interest)
+        wanted = self.predicted[:self.warm_count]
+
+        # مدل‌های بیکاری که پیش‌بینی نشده‌اند، از بزرگ‌ترین، تا رسیدن به بودجه
+        used = sum(self.resident_sizes.values())
+        wanted_missing = sum(self._size_of(model) for model in wanted if model not in self.resident_sizes)
+        for name in sorted(self.resident_sizes, key=self.resident_sizes.get, reverse=True):
+            if used + wanted_missing <= self.ram_budget:
+                break
+            if any(model in name for model in wanted) or not self._is_idle(name):
+                continue
+            size = self.resident_sizes[name]
+            if await self.evict(name, "ram_budget"):
+                used -= size
+
+        for model in wanted:
+            if self.registry.is_resident(model) or not self.registry.is_pulled(model):
+                continue
+            if used + self._size_of(model) > self.ram_budget:
+                self.stats["skipped_budget"] += 1
+                continue
+            if await self.warm(model):
+                used += self._size_of(model)
+
+    # ---------- سرویس پس‌زمینه ----------
+
+    def start(self, topics_source: Callable[[], Iterable[str]] = None):
+        """اجرای دوره‌ای در پس‌زمینه - topics_source علایق فعلی کاربر را می‌دهد"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop(topics_source or (lambda: ())))
+
+    async def _loop(self, topics_source: Callable[[], Iterable[str]]):
+        while True:
+            try:
+                await self.run_cycle(topics_source())
+            except Exception as e:
+                print(f"⚠️ خطا در مدیریت حضور مدل‌ها: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._task = None
+
+    def get_status(self) -> Dict:
+        """پیش‌بینی فعلی، مصرف حافظه و رویدادهای گرم‌سازی/خارج کردن"""
+        return {
+            **self.stats,
+            "predicted": self.predicted[:self.warm_count],
+            "ram_budget_gb": round(self.ram_budget / GB, 1),
+            "resident_gb": round(sum(self.resident_sizes.values()) / GB, 2),
+            "resident": {name: round(size / GB, 2) for name, size in self.resident_sizes.items()},
+            "events": list(self.events)
+        }
@@ -0,0 +1,194 @@
+"""
+🧭 مسیریاب مدل بر اساس تأخیر اندازه‌گیری شده
+برای هر مدل آمار متحرک از پاسخ‌های خود Ollama نگه داشته می‌شود (سرعت پردازش prompt و
+تولید توکن، زمان بارگذاری و نرخ خطا)؛ مدلی که انتخاب ایستا پیشنهاد داده اگر طبق این آمار
+(با احتساب سرد بودن و صف زمان‌بند) از SLO تأخیر بیشتر طول بکشد با مدل سریع جایگزین می‌شود.
+همه تصمیم‌ها برای بررسی بعدی در log_store ثبت می‌شوند
+"""
+
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional
+
+from .llm_scheduler import GenerationScheduler
+from .log_store import log_store
+
+class ModelProfile:
+    """آمار متحرک یک مدل روی همین سخت‌افزار"""
+    def __init__(self, window: int = 50):
+        self.prompt_tps = deque(maxlen=window)    # توکن prompt در ثانیه
+        self.eval_tps = deque(maxlen=window)      # توکن تولیدی در ثانیه
+        self.prompt_ms = deque(maxlen=window)     # زمان پردازش prompt هر درخواست
+        self.load_ms = deque(maxlen=window)       # زمان بارگذاری سرد
+        self.total_ms = deque(maxlen=window)      # کل زمان سمت سرور
+        self.outcomes = deque(maxlen=window)      # True = موفق
+        self.last_failure_at = 0.0
+
+    @staticmethod
+    def _mean(values) -> Optional[float]:
+        return sum(values) / len(values) if values else None
+
+    @property
+    def samples(self) -> int:
+        return len(self.total_ms)
+
+    @property
+    def avg_total_ms(self) -> Optional[float]:
+        return self._mean(self.total_ms)
+
+    @property
+    def failure_rate(self) -> float:
+        return (self.outcomes.count(False) / len(self.outcomes)) if self.outcomes else 0.0
+
+    def observe(self, result: Dict):
+        """خواندن فیلدهای زمان (نانوثانیه) از پاسخ نهایی Ollama"""
+        prompt_count, prompt_ns = result.get("prompt_eval_count") or 0, result.get("prompt_eval_duration") or 0
+        eval_count, eval_ns = result.get("eval_count") or 0, result.get("eval_duration") or 0
+        load_ns, total_ns = result.get("load_duration") or 0, result.get("total_duration") or 0
+
+        if prompt_count and prompt_ns:
+            self.prompt_tps.append(prompt_count / (prompt_ns / 1e9))
+        if prompt_ns:
+            self.prompt_ms.append(prompt_ns / 1e6)
+        if eval_count and eval_ns:
+            self.eval_tps.append(eval_count / (eval_ns / 1e9))
+        # زمان بارگذاری کوتاه یعنی مدل از قبل در حافظه بوده
+        if load_ns > 5e8:
+            self.load_ms.append(load_ns / 1e6)
+        if total_ns:
+            self.total_ms.append(total_ns / 1e6)
+        self.outcomes.append(True)
+
+    def record_failure(self):
+        self.outcomes.append(False)
+        self.last_failure_at = time.time()
+
+    def estimate_ms(self, max_tokens: int, cold: bool) -> Optional[float]:
+        """تخمین زمان یک درخواست؛ None اگر هنوز اندازه‌گیری نشده"""
+        eval_tps = self._mean(self.eval_tps)
+        if eval_tps is None:
+            return None
+        estimate = (self._mean(self.prompt_ms) or 0.0) + max_tokens / eval_tps * 1000
+        if cold:
+            estimate += self._mean(self.load_ms) or 0.0
+        return estimate
+
+    def summary(self) -> Dict:
+        def rounded(values):
+            mean = self._mean(values)
+            return round(mean, 1) if mean is not None else None
+
+        return {
+            "samples": self.samples,
+            "prompt_tokens_per_s": rounded(self.prompt_tps),
+            "eval_tokens_per_s": rounded(self.eval_tps),
+            "avg_prompt_ms": rounded(self.prompt_ms),
+            "avg_load_ms": rounded(self.load_ms),
+            "avg_total_ms": rounded(self.total_ms),
+            "failure_rate": round(self.failure_rate, 3)
+        }
+
+class ModelRouter:
+    def __init__(self, scheduler: GenerationScheduler, fallback_model: str,
+                 slo_ms: float = None, max_failure_rate: float = 0.5, failure_cooldown: float = 120.0,
+                 log_decisions: bool = True):
+        self.scheduler = scheduler
+        self.fallback_model = fallback_model
+        self.slo_ms = slo_ms or float(os.getenv("ROBAH_LATENCY_SLO_MS", "12000"))
+        self.max_failure_rate = max_failure_rate
+        self.failure_cooldown = failure_cooldown  # پس از این مدت بدون خطا، مدل دوباره امتحان می‌شود
+        self.log_decisions = log_decisions
+
+        self.profiles: Dict[str, ModelProfile] = {}
+
+        # آمار
+        self.stats = {
+            "decisions": 0,
+            "kept": 0,
+            "fallbacks": 0,
+            "unmeasured": 0
+        }
+        self.fallback_reasons: Dict[str, int] = {}
+
+    # ---------- اندازه‌گیری ----------
+
+    def profile(self, model: str) -> ModelProfile:
+        return self.profiles.setdefault(model, ModelProfile())
+
+    def observe(self, model: str, result: Dict):
+        """ثبت پاسخ موفق (پاسخ کامل یا chunk پایانی stream)"""
+        if result:
+            self.profile(model).observe(result)
+
+    def record_failure(self, model: str):
+        self.profile(model).record_failure()
+
+    # ---------- مسیریابی ----------
+
+    def estimate_ms(self, model: str, max_tokens: int = 150) -> Optional[float]:
+        """تخمین تأخیر: انتظار در صف + بارگذاری (اگر سرد است) + پردازش prompt + تولید"""
+        profile = self.profile(model)
+        service = profile.estimate_ms(max_tokens, cold=not self.scheduler.is_warm(model))
+        if service is None:
+            return None
+        # هر درخواست جلوتر در صف همین مدل، سهمی از یک اجرای کامل را اضافه می‌کند
+        queued = self.scheduler.queue_depth(model)
+        return service + queued * (profile.avg_total_ms or service) / self.scheduler.per_model_concurrency
+
+    def route(self, model: str, max_tokens: int = 150, reason: str = "") -> str:
+        """مدل نهایی برای پیشنهاد انتخاب ایستا - در صورت نقض SLO مدل سریع"""
+        self.stats["decisions"] += 1
+        chosen, why = model, "within_slo"
+        estimate = self.estimate_ms(model, max_tokens)
+        profile = self.profile(model)
+
+        if model == self.fallback_model:
+            why = "fast_model"
+        elif (profile.failure_rate > self.max_failure_rate and len(profile.outcomes) >= 3
+              and time.time() - profile.last_failure_at < self.failure_cooldown):
+            chosen, why = self.fallback_model, "failing"
+        elif estimate is None:
+            why = "unmeasured"  # اولین استفاده‌ها آمار مدل را می‌سازند
+            self.stats["unmeasured"] += 1
+        elif estimate > self.slo_ms:
+            fallback_estimate = self.estimate_ms(self.fallback_model, max_tokens)
+            if fallback_estimate is None or fallback_estimate < estimate:
+                chosen = self.fallback_model
+                why = "cold" if not self.scheduler.is_warm(model) else (
+                    "overloaded" if self.scheduler.queue_depth(model) else "slow")
+
+        if chosen != model:
+            self.stats["fallbacks"] += 1
+            self.fallback_reasons[why] = self.fallback_reasons.get(why, 0) + 1
+            if why == "failing":
+                print(f"🧭 {model} → {chosen} (failing، نرخ خطا {profile.failure_rate:.0%} > {self.max_failure_rate:.0%})")
+            else:
+                print(f"🧭 {model} → {chosen} ({why}، تخمین {estimate:.0f}ms > SLO {self.slo_ms:.0f}ms)")
+        else:
+            self.stats["kept"] += 1
+
+        if self.log_decisions:
+            log_store.append("routing_decisions", {
+                "timestamp": datetime.now().isoformat(),
+                "requested": model,
+                "chosen": chosen,
+                "decision": why,
+                "reason": reason,
+                "estimate_ms": round(estimate, 1) if estimate is not None else None,
+                "slo_ms": self.slo_ms,
+                "warm": self.scheduler.is_warm(model),
+                "queued": self.scheduler.queue_depth(model)
+            })
+        return chosen
+
+    def get_stats(self) -> Dict:
+        """آمار مسیریابی و پروفایل هزینه هر مدل"""
+        return {
+            **self.stats,
+            "slo_ms": self.slo_ms,
+            "fallback_model": self.fallback_model,
+            "fallback_reasons": dict(self.fallback_reasons),
+            "models": {model: profile.summary() for model, profile in self.profiles.items()}
+        }
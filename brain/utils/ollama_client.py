@@ -0,0 +1,237 @@
+"""
+🔌 کلاینت غیرهمزمان Ollama
+اتصال‌های keep-alive مشترک، timeout برای هر فراخوانی و قابلیت لغو
+"""
+
+import asyncio
+import json
+from typing import AsyncIterator, Dict, List, Optional, Callable
+
+import aiohttp
+
+class OllamaError(Exception):
+    """خطای ارتباط با سرور Ollama"""
+    pass
+
+class OllamaClient:
+    def __init__(self, base_url: str = "http://localhost:11434", max_connections: int = 20):
+        self.base_url = base_url.rstrip("/")
+        self.max_connections = max_connections
+
+        # تنظیمات timeout (ثانیه)
+        self.connect_timeout = 5
+        self.default_timeout = 60
+        self.tags_timeout = 5
+
+        # session مشترک - به صورت تنبل ساخته می‌شود چون نیاز به event loop دارد
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        # آمار
+        self.stats = {
+            "requests": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "cancelled": 0
+        }
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """دریافت session مشترک با connection pool"""
+        # ساخت session بدون await انجام می‌شود، پس بین coroutine ها race ندارد
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                keepalive_timeout=60
+            )
+            # trust_env=False: عدم استفاده از proxy برای localhost
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                trust_env=False,
+                json_serialize=lambda data: json.dumps(data, ensure_ascii=False)
+            )
+        return self._session
+
+    def _timeout(self, total: Optional[float]) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(
+            total=total if total is not None else self.default_timeout,
+            sock_connect=self.connect_timeout
+        )
+
+    async def _request_json(self, method: str, path: str, payload: Dict = None,
+                            timeout: float = None) -> Dict:
+        """ارسال درخواست و دریافت پاسخ JSON"""
+        session = await self._get_session()
+        self.stats["requests"] += 1
+
+        try:
+            async with session.request(
+                method,
+                f"{self.base_url}{path}",
+                json=payload,
+                timeout=self._timeout(timeout)
+            ) as response:
+                if response.status != 200:
+                    text = await response.text()
+                    raise OllamaError(f"HTTP {response.status}: {text[:200]}")
+                return await response.json(content_type=None)
+        except asyncio.CancelledError:
+            self.stats["cancelled"] += 1
+            raise
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise
+        except aiohttp.ClientError as e:
+            self.stats["failures"] += 1
+            raise OllamaError(str(e)) from e
+        except OllamaError:
+            self.stats["failures"] += 1
+            raise
+
+    async def generate(self, model: str, prompt: str, options: Dict = None,
+                       timeout: float = None, **extra) -> Dict:
+        """فراخوانی /api/generate بدون stream - کل پاسخ JSON برگردانده می‌شود"""
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": False,
+            "options": options or {}
+        }
+        payload.update(extra)
+        return await self._request_json("POST", "/api/generate", payload, timeout)
+
+    async def generate_stream(self, model: str, prompt: str, options: Dict = None,
+                              timeout: float = None, **extra) -> AsyncIterator[Dict]:
+        """فراخوانی /api/generate با stream - هر خط NDJSON به صورت یک chunk برگردانده می‌شود"""
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": True,
+            "options": options or {}
+        }
+        payload.update(extra)
+
+        session = await self._get_session()
+        self.stats["requests"] += 1
+
+        try:
+            async with session.post(
+                f"{self.base_url}/api/generate",
+                json=payload,
+                timeout=self._timeout(timeout)
+            ) as response:
+                if response.status != 200:
+                    text = await response.text()
+                    raise OllamaError(f"HTTP {response.status}: {text[:200]}")
+
+                async for line in response.content:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise OllamaError(chunk["error"])
+                    yield chunk
+                    if chunk.get("done"):
+                        break
+        except asyncio.CancelledError:
+            self.stats["cancelled"] += 1
+            raise
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise
+        except aiohttp.ClientError as e:
+            self.stats["failures"] += 1
+            raise OllamaError(str(e)) from e
+        except OllamaError:
+            self.stats["failures"] += 1
+            raise
+
+    async def list_models(self, timeout: float = None) -> List[str]:
+        """لیست مدل‌های دانلود شده"""
+        data = await self._request_json(
+            "GET", "/api/tags",
+            timeout=timeout if timeout is not None else self.tags_timeout
+        )
+        return [model["name"] for model in data.get("models", [])]
+
+    async def list_running(self, timeout: float = None) -> List[str]:
+        """لیست مدل‌هایی که الان در حافظه بارگذاری شده‌اند (/api/ps)"""
+        return [model["name"] for model in await self.running_details(timeout)]
+
+    async def running_details(self, timeout: float = None) -> List[Dict]:
+        """جزئیات مدل‌های بارگذاری شده (نام، size در حافظه، expires_at)"""
+        data = await self._request_json(
+            "GET", "/api/ps",
+            timeout=timeout if timeout is not None else self.tags_timeout
+        )
+        return data.get("models", [])
+
+    async def model_details(self, timeout: float = None) -> List[Dict]:
+        """جزئیات مدل‌های دانلود شده (نام، size روی دیسک)"""
+        data = await self._request_json(
+            "GET", "/api/tags",
+            timeout=timeout if timeout is not None else self.tags_timeout
+        )
+        return data.get("models", [])
+
+    async def load(self, model: str, keep_alive="30m", timeout: float = None) -> Dict:
+        """بارگذاری مدل در حافظه بدون تولید (prompt خالی) - keep_alive=0 مدل را خارج می‌کند"""
+        return await self._request_json(
+            "POST", "/api/generate",
+            {"model": model, "keep_alive": keep_alive},
+            timeout
+        )
+
+    async def unload(self, model: str, timeout: float = None) -> Dict:
+        """خارج کردن فوری مدل از حافظه"""
+        return await self.load(model, keep_alive=0, timeout=timeout if timeout is not None else self.tags_timeout)
+
+    async def is_available(self) -> bool:
+        """بررسی در دسترس بودن سرور Ollama"""
+        try:
+            await self.list_models()
+            return True
+        except (OllamaError, asyncio.TimeoutError):
+            return False
+
+    async def pull(self, model_name: str, progress_callback: Callable = None,
+                   timeout: float = None):
+        """دانلود مدل - وضعیت‌ها به صورت NDJSON خوانده می‌شوند"""
+        session = await self._get_session()
+        self.stats["requests"] += 1
+
+        try:
+            async with session.post(
+                f"{self.base_url}/api/pull",
+                json={"name": model_name},
+                # دانلود ممکن است طولانی باشد؛ پیش‌فرض بدون سقف کلی
+                timeout=aiohttp.ClientTimeout(total=timeout, sock_connect=self.connect_timeout)
+            ) as response:
+                if response.status != 200:
+                    raise OllamaError(f"HTTP {response.status}")
+
+                async for line in response.content:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if progress_callback and "status" in data:
+                        result = progress_callback(data)
+                        if asyncio.iscoroutine(result):
+                            await result
+        except aiohttp.ClientError as e:
+            self.stats["failures"] += 1
+            raise OllamaError(str(e)) from e
+
+    async def close(self):
+        """بستن session و آزادسازی اتصال‌ها"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def get_stats(self) -> Dict:
+        """آمار کلاینت"""
+        return {
+            **self.stats,
+            "base_url": self.base_url,
+            "session_open": self._session is not None and not self._session.closed
+        }
@@ -0,0 +1,67 @@
+"""
+🧩 cache نسخه‌دار بخش‌های prompt
+هر ماژول یادگیری هنگام تغییر داده‌اش شمارنده نسل خود را bump می‌کند؛
+هر بخش prompt با نسخه منابعی که به آن‌ها وابسته است ذخیره می‌شود و
+فقط وقتی یکی از این نسخه‌ها عوض شده باشد دوباره ساخته می‌شود
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, Tuple
+
+class PromptFragmentCache:
+    def __init__(self):
+        self._generations: Dict[str, int] = {}               # منبع -> نسل
+        self._fragments: Dict[str, Tuple[Hashable, Any]] = {}  # نام بخش -> (کلید نسخه، مقدار)
+        self._lock = threading.Lock()
+
+        # آمار
+        self.stats = {
+            "hits": 0,
+            "rebuilds": 0,
+            "bumps": 0
+        }
+
+    def bump(self, source: str):
+        """اعلام تغییر داده‌های یک منبع (مثلاً personal_learning، profile، name)"""
+        with self._lock:
+            self._generations[source] = self._generations.get(source, 0) + 1
+            self.stats["bumps"] += 1
+
+    def generation(self, source: str) -> int:
+        return self._generations.get(source, 0)
+
+    def version(self, sources: Iterable[str], extra: Hashable = None) -> Tuple:
+        return tuple(self._generations.get(source, 0) for source in sources) + (extra,)
+
+    def get(self, name: str, sources: Iterable[str], build: Callable[[], Any], extra: Hashable = None) -> Any:
+        """مقدار بخش - فقط با تغییر نسل منابع (یا extra) دوباره ساخته می‌شود
+
+        extra: مقادیر ارزانی که شمارنده ندارند (مثلاً سطح رابطه)
+        """
+        key = self.version(sources, extra)
+        cached = self._fragments.get(name)
+        if cached is not None and cached[0] == key:
+            self.stats["hits"] += 1
+            return cached[1]
+
+        value = build()
+        self._fragments[name] = (key, value)
+        self.stats["rebuilds"] += 1
+        return value
+
+    def invalidate(self, name: str = None):
+        if name is None:
+            self._fragments.clear()
+        else:
+            self._fragments.pop(name, None)
+
+    def get_stats(self) -> Dict:
+        """آمار cache بخش‌های prompt"""
+        return {
+            **self.stats,
+            "fragments": len(self._fragments),
+            "generations": dict(self._generations)
+        }
+
+# Instance سراسری
+prompt_fragments = PromptFragmentCache()
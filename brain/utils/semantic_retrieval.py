@@ -0,0 +1,354 @@
+"""
+🧭 سرویس یکپارچه بازیابی معنایی
+هر متن فقط یک بار embed می‌شود: بردارها با hash متن در یک cache ماندگار (SQLite) نگه داشته
+می‌شوند و همان بردار پیام برای حافظه مکالمات، دانش و حافظه‌های شخصی استفاده می‌شود؛
+مجموعه‌های ChromaDB با query_embeddings پرس‌وجو می‌شوند (بدون embed دوباره در Chroma)
+و حافظه‌های شخصی در یک ایندکس برداری درون حافظه با upsert دسته‌ای نگه داشته می‌شوند
+(پس از راه‌اندازی دوباره از همان cache ماندگار بازسازی می‌شود، بدون embed دوباره).
+زمان بازیابی هر ایندکس و recall@k ایندکس ANN در برابر جستجوی کامل گزارش می‌شود
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # محاسبه شباهت بدون numpy (کندتر)
+    np = None
+
+from .expiring_lru import ExpiringLRU
+from .message_analysis import MessageAnalysis
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """cache بردارها با کلید hash متن - LRU در حافظه و SQLite روی دیسک (ساخت در اولین استفاده)"""
+
+    def __init__(self, db_path: str = "data/memory/embedding_cache.db", max_entries: int = 5000):
+        self.db_path = db_path
+        self.memory = ExpiringLRU(max_entries=max_entries)
+        self.ttl = 7 * 24 * 3600  # بردار یک متن تغییر نمی‌کند؛ TTL فقط برای پاکسازی حافظه
+
+        # یک قفل برای LRU درون حافظه و اتصال SQLite - thread صف نوشتن برداری هم embed می‌کند
+        self._lock = threading.Lock()
+        self.conn: Optional[sqlite3.Connection] = None
+        self._unavailable = False
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """اتصال SQLite (زیر self._lock) - None اگر cache ماندگار در دسترس نیست"""
+        if self.conn is None and not self._unavailable:
+            try:
+                os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+                conn = sqlite3.connect(self.db_path, timeout=0.2, check_same_thread=False, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+                self.conn = conn
+            except (sqlite3.Error, OSError) as e:
+                print(f"⚠️ cache ماندگار embedding در دسترس نیست: {e}")
+                self._unavailable = True
+        return self.conn
+
+    def get_many(self, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        found = {}
+        missing = []
+        with self._lock:
+            for key in hashes:
+                vector = self.memory.get(key)
+                if vector is not None:
+                    found[key] = vector
+                else:
+                    missing.append(key)
+
+            conn = self._connection() if missing else None
+            if conn is not None:
+                try:
+                    rows = conn.execute(
+                        f"SELECT hash, vector FROM embeddings WHERE hash IN ({','.join('?' * len(missing))})",
+                        missing
+                    ).fetchall()
+                except sqlite3.Error:
+                    rows = []
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+                    self.memory.set(key, found[key], self.ttl)
+
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        with self._lock:
+            for key, vector in items.items():
+                self.memory.set(key, vector, self.ttl)
+
+            conn = self._connection() if items else None
+            if conn is not None:
+                try:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO embeddings (hash, vector) VALUES (?, ?)",
+                        [(key, array("f", vector).tobytes()) for key, vector in items.items()]
+                    )
+                except sqlite3.Error as e:
+                    print(f"⚠️ خطا در ذخیره embedding: {e}")
+
+class VectorIndex:
+    """ایندکس برداری کوچک درون حافظه (مثلاً حافظه‌های شخصی) - شباهت کسینوسی با جستجوی کامل"""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.vectors: List[List[float]] = []
+        self._positions: Dict[str, int] = {}
+        self._hashes: Dict[str, str] = {}  # id -> hash متن ایندکس شده
+        self._matrix = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def stale_ids(self, items: Dict[str, str]) -> List[str]:
+        """شناسه‌هایی که جدیدند یا متنشان عوض شده"""
+        return [item_id for item_id, text in items.items() if self._hashes.get(item_id) != text_hash(text)]
+
+    def upsert(self, item_id: str, text: str, vector: List[float]):
+        vector = _normalize(vector)
+        if item_id in self._positions:
+            self.vectors[self._positions[item_id]] = vector
+        else:
+            self._positions[item_id] = len(self.ids)
+            self.ids.append(item_id)
+            self.vectors.append(vector)
+        self._hashes[item_id] = text_hash(text)
+        self._matrix = None
+
+    def remove_missing(self, keep_ids: Iterable[str]):
+        keep = set(keep_ids)
+        if all(item_id in keep for item_id in self.ids):
+            return
+        pairs = [(item_id, vector) for item_id, vector in zip(self.ids, self.vectors) if item_id in keep]
+        self.ids = [item_id for item_id, _ in pairs]
+        self.vectors = [vector for _, vector in pairs]
+        self._positions = {item_id: i for i, item_id in enumerate(self.ids)}
+        self._hashes = {item_id: h for item_id, h in self._hashes.items() if item_id in keep}
+        self._matrix = None
+
+    def similarities(self, query_vector: List[float]) -> Dict[str, float]:
+        """شباهت کسینوسی بردار پرس‌وجو با همه آیتم‌ها"""
+        if not self.ids:
+            return {}
+        query_vector = _normalize(query_vector)
+        if np is not None:
+            if self._matrix is None:
+                self._matrix = np.asarray(self.vectors, dtype=np.float32)
+            scores = self._matrix @ np.asarray(query_vector, dtype=np.float32)
+            return dict(zip(self.ids, scores.tolist()))
+        return {item_id: sum(a * b for a, b in zip(vector, query_vector))
+                for item_id, vector in zip(self.ids, self.vectors)}
+
+    def search(self, query_vector: List[float], k: int) -> List[tuple]:
+        scores = self.similarities(query_vector)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+def _normalize(vector: Sequence[float]) -> List[float]:
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+class SemanticRetrieval:
+    def __init__(self, cache_path: str = "data/memory/embedding_cache.db"):
+        self.cache = EmbeddingCache(cache_path)
+        self._embedding_function = None
+        self._embedding_checked = False
+
+        self.collections: Dict[str, object] = {}     # نام -> مجموعه ChromaDB
+        self.indexes: Dict[str, VectorIndex] = {}    # نام -> ایندکس درون حافظه
+
+        # آمار
+        self.stats = {
+            "embed_calls": 0,
+            "texts_embedded": 0,
+            "cache_hits": 0,
+            "queries": 0
+        }
+        self._latencies: Dict[str, deque] = {}  # نام ایندکس -> آخرین زمان‌ها (ms)
+        self._lock = threading.Lock()  # آمار از event loop و thread صف نوشتن برداری به‌روز می‌شود
+        self._recent_queries: deque = deque(maxlen=50)  # بردار آخرین پیام‌ها برای ارزیابی recall
+        self.recall: Dict[str, Dict] = {}
+
+    # ---------- embedding ----------
+
+    @property
+    def embedding_function(self):
+        """همان مدل پیش‌فرض ChromaDB (MiniLM) - بردارها با مجموعه‌های موجود سازگارند"""
+        if not self._embedding_checked:
+            self._embedding_checked = True
+            try:
+                from chromadb.utils import embedding_functions
+                self._embedding_function = embedding_functions.DefaultEmbeddingFunction()
+            except Exception as e:
+                print(f"⚠️ مدل embedding در دسترس نیست، بازیابی معنایی غیرفعال: {e}")
+                self._embedding_function = None
+        return self._embedding_function
+
+    @property
+    def available(self) -> bool:
+        return self.embedding_function is not None
+
+    def embed_texts(self, texts: Sequence[str]) -> Optional[List[List[float]]]:
+        """بردار متن‌ها - فقط متن‌های جدید (یکجا) embed می‌شوند"""
+        if not texts or not self.available:
+            return None
+
+        hashes = [text_hash(text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(hashes)))
+        with self._lock:
+            self.stats["cache_hits"] += sum(1 for key in hashes if key in found)
+
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        if missing:
+            try:
+                vectors = self.embedding_function(list(missing.values()))
+            except Exception as e:
+                print(f"⚠️ خطا در محاسبه embedding: {e}")
+                return None
+            computed = {key: [float(value) for value in vector] for key, vector in zip(missing, vectors)}
+            self.cache.put_many(computed)
+            found.update(computed)
+            with self._lock:
+                self.stats["embed_calls"] += 1
+                self.stats["texts_embedded"] += len(computed)
+
+        return [found[key] for key in hashes]
+
+    def embed_message(self, message) -> Optional[List[float]]:
+        """بردار پیام - روی MessageAnalysis هم نگه داشته می‌شود تا همه مصرف‌کننده‌ها همان را بگیرند"""
+        if isinstance(message, MessageAnalysis):
+            return message.memo("embedding", lambda: self._embed_one(message.text))
+        return self._embed_one(message or "")
+
+    def _embed_one(self, text: str) -> Optional[List[float]]:
+        vectors = self.embed_texts([text]) if text.strip() else None
+        if not vectors:
+            return None
+        with self._lock:
+            self._recent_queries.append(vectors[0])
+        return vectors[0]
+
+    # ---------- ایندکس‌ها ----------
+
+    def register_collection(self, name: str, collection):
+        """ثبت مجموعه ChromaDB برای گزارش زمان و recall"""
+        self.collections[name] = collection
+
+    def query_collection(self, name: str, collection, message, n_results: int) -> Optional[Dict]:
+        """پرس‌وجوی مجموعه Chroma با بردار مشترک پیام (None اگر embedding در دسترس نیست)"""
+        vector = self.embed_message(message)
+        if vector is None:
+            return None
+        started = time.perf_counter()
+        try:
+            return collection.query(query_embeddings=[vector], n_results=n_results)
+        finally:
+            self._record_latency(name, started)
+
+    def sync_index(self, name: str, items: Dict[str, str]) -> VectorIndex:
+        """همگام‌سازی ایندکس درون حافظه با آیتم‌ها (id -> متن) - upsert دسته‌ای فقط برای تغییرات"""
+        index = self.indexes.setdefault(name, VectorIndex())
+        index.remove_missing(items.keys())
+
+        stale = index.stale_ids(items)
+        if stale and self.available:
+            vectors = self.embed_texts([items[item_id] for item_id in stale])
+            if vectors:
+                for item_id, vector in zip(stale, vectors):
+                    index.upsert(item_id, items[item_id], vector)
+        return index
+
+    def search_index(self, name: str, message) -> Dict[str, float]:
+        """شباهت پیام با همه آیتم‌های ایندکس (خالی اگر embedding در دسترس نیست)"""
+        index = self.indexes.get(name)
+        vector = self.embed_message(message)
+        if index is None or vector is None:
+            return {}
+        started = time.perf_counter()
+        try:
+            return index.similarities(vector)
+        finally:
+            self._record_latency(name, started)
+
+    def _record_latency(self, name: str, started: float):
+        with self._lock:
+            self.stats["queries"] += 1
+            self._latencies.setdefault(name, deque(maxlen=200)).append((time.perf_counter() - started) * 1000)
+
+    # ---------- ارزیابی ----------
+
+    def evaluate_recall(self, k: int = 5, sample: int = 20, max_docs: int = 5000) -> Dict[str, Dict]:
+        """recall@k ایندکس ANN هر مجموعه Chroma: سهم top-k دقیق (جستجوی کامل) که در k نتیجه ANN آمده
+
+        پرس‌وجوها بردار آخرین پیام‌های واقعی‌اند (در نبود آن‌ها نمونه‌ای از خود اسناد)؛
+        مجموعه‌های بزرگ‌تر از max_docs ارزیابی نمی‌شوند و ایندکس‌های درون حافظه خودشان جستجوی کامل‌اند
+        """
+        for name, collection in self.collections.items():
+            try:
+                total = collection.count()
+                if not total or total > max_docs:
+                    continue
+                data = collection.get(include=["embeddings"])
+                ids, embeddings = data.get("ids") or [], data.get("embeddings")
+                if not ids or embeddings is None:
+                    continue
+
+                exact = VectorIndex()
+                for doc_id, vector in zip(ids, embeddings):
+                    exact.upsert(doc_id, "", list(vector))
+
+                with self._lock:
+                    recent = list(self._recent_queries)[-sample:]
+                queries = recent or [list(vector) for vector in embeddings[:sample]]
+                top_k = min(k, len(ids))
+                results = collection.query(query_embeddings=queries, n_results=top_k)
+                found = 0
+                for query, result_ids in zip(queries, results["ids"]):
+                    expected = {doc_id for doc_id, _ in exact.search(query, top_k)}
+                    found += len(expected & set(result_ids))
+                self.recall[name] = {"k": top_k, "recall": round(found / (top_k * len(queries)), 3),
+                                     "sample": len(queries)}
+            except Exception as e:
+                print(f"⚠️ خطا در ارزیابی recall برای {name}: {e}")
+
+        return self.recall
+
+    def get_stats(self) -> Dict:
+        """آمار بازیابی: زمان هر ایندکس، cache embedding و recall@k"""
+        with self._lock:
+            stats = dict(self.stats)
+            latencies = {name: list(values) for name, values in self._latencies.items()}
+
+        latency = {}
+        for name, values in latencies.items():
+            ordered = sorted(values)
+            latency[name] = {
+                "count": len(ordered),
+                "avg_ms": round(sum(ordered) / len(ordered), 2),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2)
+            }
+        return {
+            **stats,
+            "available": self._embedding_function is not None,
+            "latency": latency,
+            "recall_at_k": self.recall,
+            "indexes": {name: len(index) for name, index in self.indexes.items()}
+        }
+
+# Instance سراسری
+semantic_retrieval = SemanticRetrieval()
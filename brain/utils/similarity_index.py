@@ -0,0 +1,141 @@
+"""
+🔍 ایندکس پیام‌های تقریباً تکراری (Jaccard با prefix filtering)
+به جای مقایسه پیام با همه آیتم‌های cache، هر آیتم فقط زیر چند کلمه «پیشوند» و
+اندازه مجموعه کلماتش ایندکس می‌شود؛ هر دو پیام با شباهت ≥ آستانه حداقل یک کلمه
+پیشوند مشترک دارند، پس جستجو بدون از دست دادن نتیجه فقط چند نامزد را بررسی می‌کند
+"""
+
+import math
+from typing import Dict, FrozenSet, Hashable, Optional, Set, Tuple
+
+class NearDuplicateIndex:
+    def __init__(self, threshold: float = 0.85):
+        self.threshold = threshold
+
+        # (scope، کلمه پیشوند، اندازه مجموعه) -> کلیدها
+        self._postings: Dict[Tuple[str, str, int], Set[Hashable]] = {}
+        # کلید -> (scope، کلمات، کلمات پیشوند)
+        self._entries: Dict[Hashable, Tuple[str, FrozenSet[str], Tuple[str, ...]]] = {}
+
+        # آمار
+        self.stats = {
+            "lookups": 0,
+            "candidates": 0,
+            "matches": 0
+        }
+
+    @staticmethod
+    def tokenize(message: str) -> FrozenSet[str]:
+        """کلمات پیام - همان تعریف قبلی شباهت (lower + split)"""
+        return frozenset(message.lower().split())
+
+    def _prefix(self, tokens: FrozenSet[str]) -> Tuple[str, ...]:
+        """کلمات پیشوند طبق یک ترتیب سراسری ثابت (hash)
+
+        اگر J(a, b) ≥ t باشد، پیشوند به طول |a| - ⌈t·|a|⌉ + 1 از هر دو مجموعه اشتراک دارد
+        """
+        size = len(tokens)
+        prefix_length = size - math.ceil(self.threshold * size - 1e-9) + 1
+        return tuple(sorted(tokens, key=hash)[:max(1, prefix_length)])
+
+    def _size_range(self, size: int) -> range:
+        """اندازه‌های ممکن برای مجموعه‌ای که با شباهت ≥ آستانه با این اندازه جور شود"""
+        low = max(1, math.ceil(self.threshold * size - 1e-9))
+        high = math.floor(size / self.threshold + 1e-9) if self.threshold > 0 else size
+        return range(low, high + 1)
+
+    # ---------- به‌روزرسانی ----------
+
+    def add(self, key: Hashable, message: str, scope: str = ""):
+        self.remove(key)
+
+        tokens = self.tokenize(message)
+        if not tokens:
+            return
+
+        prefix = self._prefix(tokens)
+        self._entries[key] = (scope, tokens, prefix)
+        for token in prefix:
+            self._postings.setdefault((scope, token, len(tokens)), set()).add(key)
+
+    def remove(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        scope, tokens, prefix = entry
+        for token in prefix:
+            posting_key = (scope, token, len(tokens))
+            keys = self._postings.get(posting_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[posting_key]
+
+    def set_threshold(self, threshold: float):
+        """تغییر آستانه - طول پیشوندها وابسته به آستانه است، پس ایندکس دوباره ساخته می‌شود"""
+        if threshold == self.threshold:
+            return
+        self.threshold = threshold
+        entries = self._entries
+        self._postings = {}
+        self._entries = {}
+        for key, (scope, tokens, _) in entries.items():
+            prefix = self._prefix(tokens)
+            self._entries[key] = (scope, tokens, prefix)
+            for token in prefix:
+                self._postings.setdefault((scope, token, len(tokens)), set()).add(key)
+
+    def clear(self):
+        self._postings.clear()
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---------- جستجو ----------
+
+    def find(self, message: str, scope: str = "", is_valid=None) -> Optional[Tuple[Hashable, float]]:
+        """بهترین کلید با شباهت Jaccard ≥ آستانه در همان scope
+
+        is_valid: تابع اختیاری برای رد نامزدها (مثلاً منقضی شده‌ها)
+        """
+        self.stats["lookups"] += 1
+
+        tokens = self.tokenize(message)
+        if not tokens:
+            return None
+
+        candidates: Set[Hashable] = set()
+        for token in self._prefix(tokens):
+            for size in self._size_range(len(tokens)):
+                candidates.update(self._postings.get((scope, token, size), ()))
+
+        self.stats["candidates"] += len(candidates)
+
+        best_key = None
+        best_similarity = 0.0
+        for key in candidates:
+            cached_tokens = self._entries[key][1]
+            intersection = len(tokens & cached_tokens)
+            similarity = intersection / (len(tokens) + len(cached_tokens) - intersection)
+
+            if similarity > best_similarity and similarity >= self.threshold:
+                if is_valid is not None and not is_valid(key):
+                    continue
+                best_similarity = similarity
+                best_key = key
+
+        if best_key is None:
+            return None
+
+        self.stats["matches"] += 1
+        return best_key, best_similarity
+
+    def get_stats(self) -> Dict:
+        """آمار ایندکس"""
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "postings": len(self._postings)
+        }
@@ -1,42 +1,72 @@
 """
 🧠 سیستم Cache هوشمند روباه
 کش کردن پاسخ‌ها و بهینه‌سازی عملکرد
+L1: حافظه (LRU) - L2: موتور قابل تعویض (SQLite محلی یا Redis) از cache_backends
 """
 
 import hashlib
 import json
 import time
 from typing import Dict, Optional, List
-from datetime import datetime, timedelta
-import redis
-import pickle
+from datetime import datetime
+
+from .similarity_index import NearDuplicateIndex
+from .expiring_lru import ExpiringLRU
+from .cache_backends import create_cache_backend, encode_cache_value
 
 class SmartCache:
-    def __init__(self):
-        # Redis برای cache سریع (اختیاری)
-        try:
-            self.redis_client = redis.Redis(host='localhost', port=6379, db=0)
-            self.use_redis = True
-            print("🔴 Redis cache فعال شد")
-        except:
-            self.use_redis = False
-            print("💾 استفاده از cache محلی")
+    def __init__(self, l2_backend=None):
+        # لایه دوم (SQLite محلی به صورت پیش‌فرض، Redis اختیاری) - خطاهایش زمان محدودی می‌گیرند
+        self.l2 = l2_backend if l2_backend is not None else create_cache_backend()
         
-        # Cache محلی
-        self.local_cache = {}
+        # ایندکس پیام‌های مشابه - جستجوی شباهت بدون پیمایش کل cache
+        self.similarity_index = NearDuplicateIndex(threshold=0.85)
+
+        # Cache محلی: LRU با انقضای تدریجی و سقف حجم
+        self.local_cache = ExpiringLRU(
+            max_entries=1000,
+            max_bytes=64 * 1024 * 1024,  # 64MB
+            on_remove=self._on_local_remove
+        )
         self.cache_stats = {
             "hits": 0,
             "misses": 0,
-            "total_requests": 0
+            "total_requests": 0,
+            "l2_hits": 0
         }
         
         # تنظیمات cache
-        self.max_cache_size = 1000
         self.default_ttl = 3600  # 1 ساعت
-        self.similarity_threshold = 0.85
+
+    @property
+    def max_cache_size(self) -> int:
+        return self.local_cache.max_entries
+
+    @max_cache_size.setter
+    def max_cache_size(self, value: int):
+        self.local_cache.max_entries = value
+
+    @property
+    def max_cache_bytes(self) -> int:
+        return self.local_cache.max_bytes
+
+    @max_cache_bytes.setter
+    def max_cache_bytes(self, value: int):
+        self.local_cache.max_bytes = value
+
+    @property
+    def similarity_threshold(self) -> float:
+        return self.similarity_index.threshold
+
+    @similarity_threshold.setter
+    def similarity_threshold(self, value: float):
+        self.similarity_index.set_threshold(value)
         
-    def _generate_cache_key(self, message: str, context: List[Dict] = None) -> str:
-        """تولید کلید منحصر به فرد برای cache"""
+    def _generate_cache_key(self, message: str, context: List[Dict] = None, scope: str = "") -> str:
+        """تولید کلید منحصر به فرد برای cache
+
+        scope: هر چیزی جز متن پیام که پاسخ را تغییر می‌دهد (مدل، نام، قوانین، نسخه قالب)
+        """
         # نرمال‌سازی پیام
         normalized = message.lower().strip()
         
@@ -47,42 +77,35 @@ class SmartCache:
             context_hash = hashlib.md5(context_str.encode()).hexdigest()[:8]
         
         # تولید hash
-        full_key = f"{normalized}_{context_hash}"
+        full_key = f"{scope}_{normalized}_{context_hash}"
         return hashlib.sha256(full_key.encode()).hexdigest()[:16]
     
-    def get_cached_response(self, message: str, context: List[Dict] = None) -> Optional[Dict]:
+    def get_cached_response(self, message: str, context: List[Dict] = None, scope: str = "") -> Optional[Dict]:
         """دریافت پاسخ از cache"""
         self.cache_stats["total_requests"] += 1
         
-        cache_key = self._generate_cache_key(message, context)
+        cache_key = self._generate_cache_key(message, context, scope)
         
-        # جستجو در Redis
-        if self.use_redis:
-            try:
-                cached_data = self.redis_client.get(cache_key)
-                if cached_data:
-                    result = pickle.loads(cached_data)
-                    self.cache_stats["hits"] += 1
-                    print(f"🎯 Cache hit: {message[:30]}...")
-                    return result
-            except Exception as e:
-                print(f"خطا در Redis: {e}")
+        # جستجو در cache حافظه (آیتم‌های منقضی همین‌جا به تدریج پاک می‌شوند)
+        cached_data = self.local_cache.get(cache_key)
+        if cached_data is not None:
+            self.cache_stats["hits"] += 1
+            print(f"🎯 Local cache hit: {message[:30]}...")
+            return cached_data
         
-        # جستجو در cache محلی
-        if cache_key in self.local_cache:
-            cached_item = self.local_cache[cache_key]
-            
-            # بررسی انقضا
-            if datetime.now() < cached_item["expires_at"]:
-                self.cache_stats["hits"] += 1
-                print(f"🎯 Local cache hit: {message[:30]}...")
-                return cached_item["data"]
-            else:
-                # حذف آیتم منقضی شده
-                del self.local_cache[cache_key]
+        # جستجو در لایه دوم و انتقال به حافظه
+        cached_data = self.l2.get(cache_key)
+        if cached_data is not None:
+            self.cache_stats["hits"] += 1
+            self.cache_stats["l2_hits"] += 1
+            print(f"🎯 Cache hit ({self.l2.name}): {message[:30]}...")
+            remaining_ttl = cached_data.get("expires_at", 0) - time.time()
+            if remaining_ttl > 0:
+                self._store_local(cache_key, cached_data, remaining_ttl)
+            return cached_data
         
         # جستجوی similarity-based
-        similar_response = self._find_similar_cached_response(message)
+        similar_response = self._find_similar_cached_response(message, scope)
         if similar_response:
             self.cache_stats["hits"] += 1
             print(f"🔍 Similar cache hit: {message[:30]}...")
@@ -91,82 +114,57 @@ class SmartCache:
         self.cache_stats["misses"] += 1
         return None
     
-    def cache_response(self, message: str, response: Dict, context: List[Dict] = None, ttl: int = None):
+    def cache_response(self, message: str, response: Dict, context: List[Dict] = None, ttl: int = None, scope: str = ""):
         """ذخیره پاسخ در cache"""
-        cache_key = self._generate_cache_key(message, context)
+        cache_key = self._generate_cache_key(message, context, scope)
         ttl = ttl or self.default_ttl
         
         cache_data = {
             "response": response,
             "timestamp": datetime.now().isoformat(),
             "message": message,
-            "context_size": len(context) if context else 0
-        }
-        
-        # ذخیره در Redis
-        if self.use_redis:
-            try:
-                self.redis_client.setex(
-                    cache_key, 
-                    ttl, 
-                    pickle.dumps(cache_data)
-                )
-            except Exception as e:
-                print(f"خطا در ذخیره Redis: {e}")
-        
-        # ذخیره در cache محلی
-        expires_at = datetime.now() + timedelta(seconds=ttl)
-        self.local_cache[cache_key] = {
-            "data": cache_data,
-            "expires_at": expires_at
+            "scope": scope,
+            "context_size": len(context) if context else 0,
+            "expires_at": time.time() + ttl
         }
         
-        # مدیریت اندازه cache
-        self._manage_cache_size()
-        
-        print(f"💾 Cached: {message[:30]}...")
-    
-    def _find_similar_cached_response(self, message: str) -> Optional[Dict]:
-        """جستجوی پاسخ مشابه در cache"""
-        message_words = set(message.lower().split())
-        
-        best_match = None
-        best_similarity = 0
-        
-        for cached_item in self.local_cache.values():
-            if datetime.now() >= cached_item["expires_at"]:
-                continue
-                
-            cached_message = cached_item["data"]["message"]
-            cached_words = set(cached_message.lower().split())
-            
-            # محاسبه شباهت Jaccard
-            intersection = len(message_words & cached_words)
-            union = len(message_words | cached_words)
-            
-            if union > 0:
-                similarity = intersection / union
-                
-                if similarity > best_similarity and similarity >= self.similarity_threshold:
-                    best_similarity = similarity
-                    best_match = cached_item["data"]
+        # ذخیره در لایه دوم
+        self.l2.set(cache_key, cache_data, ttl)
         
-        return best_match
+        # ذخیره در cache حافظه
+        if self._store_local(cache_key, cache_data, ttl):
+            print(f"💾 Cached: {message[:30]}...")
+        else:
+            print(f"⚠️ پاسخ برای cache حافظه بیش از حد بزرگ است: {message[:30]}...")
+
+    def _store_local(self, cache_key: str, cache_data: Dict, ttl: float) -> bool:
+        """ذخیره در L1 و ایندکس شباهت - بیرون انداختن LRU داخل set انجام می‌شود"""
+        size = len(encode_cache_value(cache_data))
+        if not self.local_cache.set(cache_key, cache_data, ttl, size=size):
+            return False
+        self.similarity_index.add(cache_key, cache_data["message"], cache_data.get("scope", ""))
+        return True
     
-    def _manage_cache_size(self):
-        """مدیریت اندازه cache"""
-        if len(self.local_cache) > self.max_cache_size:
-            # حذف قدیمی‌ترین آیتم‌ها
-            sorted_items = sorted(
-                self.local_cache.items(),
-                key=lambda x: x[1]["expires_at"]
-            )
-            
-            # حذف 20% قدیمی‌ترین آیتم‌ها
-            remove_count = int(self.max_cache_size * 0.2)
-            for i in range(remove_count):
-                if i < len(sorted_items):
-                    del self.local_cache[sorted_items[i][0]]
+    def _find_similar_cached_response(self, message: str, scope: str = "") -> Optional[Dict]:
+        """جستجوی پاسخ مشابه در cache (فقط در همان scope)
+
+        شباهت Jaccard کلمات مثل قبل است، اما فقط نامزدهای ایندکس بررسی می‌شوند
+        """
+        now = time.time()
+
+        def is_fresh(cache_key: str) -> bool:
+            return self.local_cache.peek(cache_key, now) is not None
+
+        match = self.similarity_index.find(message, scope, is_valid=is_fresh)
+        if match is None:
+            return None
+
+        cache_key, _ = match
+        return self.local_cache.get(cache_key)
+
+    def _on_local_remove(self, cache_key: str, reason: str):
+        """هر آیتمی که از cache محلی بیرون می‌رود از ایندکس شباهت هم حذف می‌شود"""
+        self.similarity_index.remove(cache_key)
     
     def get_cache_stats(self) -> Dict:
         """آمار cache"""
@@ -178,17 +176,20 @@ class SmartCache:
             **self.cache_stats,
             "hit_rate": hit_rate,
             "cache_size": len(self.local_cache),
-            "redis_enabled": self.use_redis
+            "cache_bytes": self.local_cache.total_bytes,
+            "evictions": self.local_cache.stats["evictions"],
+            "expirations": self.local_cache.stats["expirations"],
+            "admissions": self.local_cache.stats["admissions"],
+            "rejections": self.local_cache.stats["rejections"],
+            "similarity_index": self.similarity_index.get_stats(),
+            "l2": self.l2.get_stats()
         }
     
     def clear_cache(self):
         """پاک کردن کامل cache"""
         self.local_cache.clear()
-        if self.use_redis:
-            try:
-                self.redis_client.flushdb()
-            except:
-                pass
+        self.similarity_index.clear()
+        self.l2.clear()
         print("🗑️ Cache پاک شد")
 
 # Instance سراسری
@@ -0,0 +1,70 @@
+"""
+⚡ پیش‌نویس سریع (speculative) برای پیام‌های کوتاه
+برای هدف‌های تنظیم شده، مدل سریع پیش‌نویسی می‌سازد که فوراً برای کاربر ارسال می‌شود و
+مدل اصلی همزمان کار می‌کند؛ پاسخ اصلی اگر با پیش‌نویس تفاوت جدی داشته باشد جایگزین آن
+می‌شود و در غیر این صورت فقط تأیید آن است
+تنظیمات: ROBAH_SPECULATIVE_INTENTS (مثلاً conversation,question یا off)،
+ROBAH_SPECULATIVE_MAX_WORDS و ROBAH_SPECULATIVE_SIMILARITY
+"""
+
+import os
+import re
+from typing import Dict, Iterable
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+class SpeculativeDraftPolicy:
+    def __init__(self, intents: Iterable[str] = None, max_words: int = None,
+                 similarity_threshold: float = None):
+        if intents is None:
+            configured = os.getenv("ROBAH_SPECULATIVE_INTENTS", "conversation")
+            intents = [] if configured.strip() == "off" else configured.split(",")
+        self.intents = {intent.strip() for intent in intents if intent.strip()}
+        self.max_words = max_words or int(os.getenv("ROBAH_SPECULATIVE_MAX_WORDS", "12"))
+        # شباهت کمتر از این مقدار = تفاوت جدی و جایگزینی پیش‌نویس
+        self.similarity_threshold = similarity_threshold or float(os.getenv("ROBAH_SPECULATIVE_SIMILARITY", "0.35"))
+
+        # آمار
+        self.stats = {
+            "drafts": 0,
+            "confirmed": 0,
+            "replaced": 0,
+            "draft_only": 0,
+            "cancelled": 0,
+            "failed": 0
+        }
+
+    def should_draft(self, intent: str, word_count: int) -> bool:
+        """آیا برای این پیام پیش‌نویس سریع ساخته شود؟"""
+        return intent in self.intents and word_count <= self.max_words
+
+    def set_intents(self, intents: Iterable[str]):
+        self.intents = {intent.strip() for intent in intents if intent.strip()}
+
+    @staticmethod
+    def similarity(first: str, second: str) -> float:
+        """شباهت Jaccard کلمات دو پاسخ"""
+        first_words = set(_WORD_RE.findall(first.lower()))
+        second_words = set(_WORD_RE.findall(second.lower()))
+        if not first_words or not second_words:
+            return 0.0
+        return len(first_words & second_words) / len(first_words | second_words)
+
+    def judge(self, draft: str, primary: str) -> Dict:
+        """مقایسه پیش‌نویس ارسال شده با پاسخ مدل اصلی"""
+        similarity = self.similarity(draft, primary)
+        outcome = "confirmed" if similarity >= self.similarity_threshold else "replaced"
+        return {"outcome": outcome, "similarity": round(similarity, 3)}
+
+    def record(self, outcome: str):
+        if outcome in self.stats:
+            self.stats[outcome] += 1
+
+    def get_stats(self) -> Dict:
+        """آمار پیش‌نویس‌ها"""
+        return {
+            **self.stats,
+            "intents": sorted(self.intents),
+            "max_words": self.max_words,
+            "similarity_threshold": self.similarity_threshold
+        }
@@ -0,0 +1,74 @@
+"""
+🕸️ اجرای گراف مراحل
+مراحل مستقل به صورت همزمان اجرا می‌شوند و هر مرحله فقط منتظر وابستگی‌های خودش می‌ماند
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+@dataclass
+class Stage:
+    """یک مرحله از گراف"""
+    name: str
+    func: Callable                                  # func(results) - sync یا async
+    depends_on: List[str] = field(default_factory=list)
+    in_thread: bool = False                         # اجرای تابع sync در thread pool
+    halts: bool = False                             # نتیجه غیرخالی = توقف بقیه گراف
+
+class StageGraph:
+    def __init__(self):
+        self.stages: Dict[str, Stage] = {}
+
+    def add(self, name: str, func: Callable, depends_on: List[str] = None,
+            in_thread: bool = False, halts: bool = False) -> "StageGraph":
+        """افزودن مرحله - وابستگی‌ها باید قبلاً اضافه شده باشند"""
+        depends_on = list(depends_on or [])
+        for dependency in depends_on:
+            if dependency not in self.stages:
+                raise ValueError(f"وابستگی ناشناخته برای {name}: {dependency}")
+        self.stages[name] = Stage(name, func, depends_on, in_thread, halts)
+        return self
+
+    async def _call(self, stage: Stage, results: Dict[str, Any]) -> Any:
+        if asyncio.iscoroutinefunction(stage.func):
+            return await stage.func(results)
+        if stage.in_thread:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, stage.func, results)
+        return stage.func(results)
+
+    async def run(self) -> Tuple[Dict[str, Any], Dict[str, float], Optional[str]]:
+        """اجرای گراف
+
+        خروجی: (نتایج هر مرحله، زمان هر مرحله به میلی‌ثانیه، نام مرحله‌ای که گراف را متوقف کرد)
+        خطای یک مرحله فقط همان مرحله را None می‌کند و بقیه ادامه می‌دهند.
+        """
+        results: Dict[str, Any] = {}
+        timings: Dict[str, float] = {}
+        done: Dict[str, asyncio.Event] = {name: asyncio.Event() for name in self.stages}
+        halted: List[str] = []
+
+        async def execute(stage: Stage):
+            try:
+                for dependency in stage.depends_on:
+                    await done[dependency].wait()
+                if halted:
+                    return
+
+                start = time.perf_counter()
+                try:
+                    results[stage.name] = await self._call(stage, results)
+                except Exception as e:
+                    print(f"⚠️ خطا در مرحله {stage.name}: {e}")
+                    results[stage.name] = None
+                timings[stage.name] = round((time.perf_counter() - start) * 1000, 1)
+
+                if stage.halts and results[stage.name]:
+                    halted.append(stage.name)
+            finally:
+                done[stage.name].set()
+
+        await asyncio.gather(*(execute(stage) for stage in self.stages.values()))
+        return results, timings, (halted[0] if halted else None)
@@ -0,0 +1,148 @@
+"""
+💾 ذخیره‌سازی تأخیری وضعیت (write-behind)
+اشیاء در حافظه می‌مانند و فقط «کثیف» علامت می‌خورند؛ یک timer تغییرات پشت سر هم را
+یکجا می‌کند و فایل JSON با نوشتن در فایل موقت و rename به صورت اتمی جایگزین می‌شود
+"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+def write_json_atomic(path: str, data: Any, **dump_kwargs):
+    """نوشتن اتمی JSON - در صورت crash فایل قبلی سالم می‌ماند"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    dump_kwargs.setdefault("ensure_ascii", False)
+    text = json.dumps(data, **dump_kwargs)
+
+    # فایل موقت یکتا - نویسنده‌های همزمان فایل موقت یکدیگر را خراب نمی‌کنند
+    fd, tmp_path = tempfile.mkstemp(dir=directory or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class StateStore:
+    def __init__(self, flush_delay: float = 1.0, max_delay: float = 5.0):
+        self.flush_delay = flush_delay  # سکوت لازم پس از آخرین تغییر
+        self.max_delay = max_delay      # حداکثر تأخیر حتی اگر تغییرات ادامه داشته باشد
+
+        # مسیر -> (تابع snapshot، تنظیمات json.dump، callback پس از نوشتن)
+        self._dirty: Dict[str, tuple] = {}
+        self._first_dirty_at: Optional[float] = None
+        self._last_dirty_at: Optional[float] = None
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()  # یک flush در هر لحظه (thread، close و atexit)
+        self._thread: Optional[threading.Thread] = None
+
+        # آمار
+        self.stats = {
+            "marks": 0,
+            "writes": 0,
+            "coalesced": 0,
+            "failures": 0
+        }
+
+        atexit.register(self.flush_all)
+
+    def schedule_save(self, path: str, snapshot: Callable[[], Any],
+                      on_written: Callable[[str], None] = None, **dump_kwargs):
+        """علامت‌گذاری فایل برای ذخیره - snapshot هنگام نوشتن صدا زده می‌شود تا آخرین وضعیت ذخیره شود"""
+        with self._lock:
+            self.stats["marks"] += 1
+            if path in self._dirty:
+                self.stats["coalesced"] += 1
+            self._dirty[path] = (snapshot, dump_kwargs, on_written)
+
+            now = time.time()
+            if self._first_dirty_at is None:
+                self._first_dirty_at = now
+            self._last_dirty_at = now
+
+            self._ensure_thread()
+            self._wakeup.notify()
+
+    def is_dirty(self, path: str) -> bool:
+        with self._lock:
+            return path in self._dirty
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._flush_loop, name="state-store", daemon=True)
+            self._thread.start()
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                while not self._dirty:
+                    self._wakeup.wait()
+
+                # صبر تا سکوت flush_delay یا رسیدن به max_delay
+                while self._dirty:
+                    now = time.time()
+                    due = min(self._last_dirty_at + self.flush_delay,
+                              self._first_dirty_at + self.max_delay)
+                    if now >= due:
+                        break
+                    self._wakeup.wait(due - now)
+
+            self.flush_all()
+
+    def flush_all(self):
+        """نوشتن فوری همه فایل‌های کثیف (هنگام خاموشی هم صدا زده می‌شود)"""
+        with self._flush_lock:
+            with self._lock:
+                pending = self._dirty
+                self._dirty = {}
+                self._first_dirty_at = None
+                self._last_dirty_at = None
+
+            for path, (snapshot, dump_kwargs, on_written) in pending.items():
+                if self._write(path, snapshot, dump_kwargs):
+                    if on_written:
+                        on_written(path)
+                else:
+                    # تلاش دوباره در دور بعد، مگر اینکه نسخه جدیدتری ثبت شده باشد
+                    with self._lock:
+                        self._dirty.setdefault(path, (snapshot, dump_kwargs, on_written))
+                        now = time.time()
+                        if self._first_dirty_at is None:
+                            self._first_dirty_at = now
+                        self._last_dirty_at = now
+
+    def _write(self, path: str, snapshot: Callable[[], Any], dump_kwargs: Dict) -> bool:
+        try:
+            write_json_atomic(path, snapshot(), **dump_kwargs)
+            self.stats["writes"] += 1
+            return True
+        except RuntimeError as e:
+            # شیء همزمان در حال تغییر بود (dictionary changed size) - دور بعد
+            self.stats["failures"] += 1
+            print(f"⚠️ ذخیره {path} به تعویق افتاد: {e}")
+            return False
+        except Exception as e:
+            self.stats["failures"] += 1
+            print(f"⚠️ خطا در ذخیره {path}: {e}")
+            return True
+
+    def get_stats(self) -> Dict:
+        """آمار ذخیره‌سازی"""
+        with self._lock:
+            return {**self.stats, "dirty_files": len(self._dirty)}
+
+# Instance سراسری
+state_store = StateStore()
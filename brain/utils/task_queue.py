@@ -1,16 +1,23 @@
 """
 ⚡ سیستم Task Queue غیرهمزمان
 مدیریت وظایف سنگین و بهینه‌سازی عملکرد
+- هر task یک future دارد؛ انتظار برای نتیجه بدون polling است
+- تلاش مجدد با backoff نمایی، timeout برای هر task و امکان لغو
+- توابع همزمان (sync) در thread pool (یا process pool) اجرا می‌شوند تا event loop قفل نشود
+- افزایش اولویت با گذشت زمان (aging) تا task های LOW همیشه عقب نمانند
+- task های تمام شده فقط تا سقف تعداد/مدت نگه داشته می‌شوند
 """
 
 import asyncio
-import json
-from typing import Dict, List, Callable, Optional, Any
+import functools
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, Callable, Optional, Any
 from datetime import datetime
 from enum import Enum
 import uuid
-from dataclasses import dataclass
-import logging
+from dataclasses import dataclass, field
 
 class TaskPriority(Enum):
     LOW = 1
@@ -39,22 +46,43 @@ class Task:
     error: str = None
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
+    timeout: Optional[float] = None        # سقف زمان هر تلاش (ثانیه)
+    max_retries: int = 0
+    retry_backoff: float = 1.0             # تأخیر تلاش مجدد اول؛ هر بار دو برابر
+    run_in: str = "thread"                 # محل اجرای توابع sync: thread یا process
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic, repr=False)
+    future: Optional[asyncio.Future] = field(default=None, repr=False)
+    handle: Optional[asyncio.Task] = field(default=None, repr=False)
 
 class AsyncTaskQueue:
-    def __init__(self, max_workers: int = 3):
+    def __init__(self, max_workers: int = 3, max_retained: int = 500, retention_seconds: float = 600,
+                 aging_interval: float = 5.0, executor: Executor = None):
         self.max_workers = max_workers
-        self.tasks = {}
-        self.pending_queue = asyncio.PriorityQueue()
-        self.running_tasks = {}
-        self.completed_tasks = {}
+        self.max_retained = max_retained            # سقف task های تمام شده نگه داشته شده
+        self.retention_seconds = retention_seconds  # مدت نگه‌داری task های تمام شده
+        self.aging_interval = aging_interval        # هر این مقدار انتظار = یک سطح اولویت بیشتر
+        self.executor = executor                    # None = thread pool پیش‌فرض event loop
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+
+        self.tasks: Dict[str, Task] = {}
+        self.pending: Dict[TaskPriority, deque] = {priority: deque() for priority in TaskPriority}
+        self.running_tasks: Dict[str, Task] = {}
+        self.completed_tasks: "OrderedDict[str, Task]" = OrderedDict()
         self.workers = []
         self.is_running = False
+        self._wakeup: Optional[asyncio.Event] = None  # در event loop جاری ساخته می‌شود
         
         # آمار
         self.stats = {
             "total_tasks": 0,
             "completed_tasks": 0,
             "failed_tasks": 0,
+            "cancelled_tasks": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "aged_promotions": 0,
+            "evicted": 0,
             "average_execution_time": 0
         }
         
@@ -62,10 +90,14 @@ class AsyncTaskQueue:
     
     async def start(self):
         """شروع task queue"""
+        self._start_workers()
+
+    def _start_workers(self):
         if self.is_running:
             return
         
         self.is_running = True
+        self._wakeup = asyncio.Event()
         
         # ایجاد worker ها
         for i in range(self.max_workers):
@@ -78,13 +110,17 @@ class AsyncTaskQueue:
         """توقف task queue"""
         self.is_running = False
         
-        # لغو همه worker ها
+        # لغو همه worker ها (و task های در حال اجرا)
         for worker in self.workers:
             worker.cancel()
         
         # انتظار برای تمام شدن worker ها
         await asyncio.gather(*self.workers, return_exceptions=True)
         self.workers.clear()
+
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False)
+            self._process_pool = None
         
         print("⏹️ Task Queue متوقف شد")
     
@@ -93,8 +129,16 @@ class AsyncTaskQueue:
                  func: Callable, 
                  *args, 
                  priority: TaskPriority = TaskPriority.NORMAL,
+                 timeout: float = None,
+                 max_retries: int = 0,
+                 retry_backoff: float = 1.0,
+                 run_in: str = "thread",
                  **kwargs) -> str:
-        """اضافه کردن task جدید"""
+        """اضافه کردن task جدید
+
+        timeout: سقف زمان هر تلاش؛ max_retries/retry_backoff: تلاش مجدد پس از خطا یا timeout
+        run_in: اجرای تابع sync در "thread" یا "process" (تابع و آرگومان‌ها باید picklable باشند)
+        """
         
         task_id = str(uuid.uuid4())[:8]
         
@@ -105,86 +149,197 @@ class AsyncTaskQueue:
             args=args,
             kwargs=kwargs,
             priority=priority,
-            created_at=datetime.now()
+            created_at=datetime.now(),
+            timeout=timeout,
+            max_retries=max_retries,
+            retry_backoff=retry_backoff,
+            run_in=run_in
         )
         
+        loop = asyncio.get_event_loop()
+        task.future = loop.create_future()
+        # خطای task ای که کسی منتظرش نیست نباید هشدار «never retrieved» بدهد
+        task.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
         self.tasks[task_id] = task
-        
-        # اضافه کردن به صف با اولویت
-        priority_value = -priority.value  # منفی برای ترتیب نزولی
-        asyncio.create_task(self.pending_queue.put((priority_value, task_id)))
-        
         self.stats["total_tasks"] += 1
         
+        # worker ها در اولین استفاده داخل event loop شروع می‌شوند
+        if not self.is_running and loop.is_running():
+            self._start_workers()
+        self._enqueue(task)
+        
         print(f"📝 Task اضافه شد: {name} (ID: {task_id})")
         return task_id
+
+    def _enqueue(self, task: Task):
+        if task.status != TaskStatus.PENDING:
+            return
+        task.enqueued_at = time.monotonic()
+        self.pending[task.priority].append(task)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # ---------- انتخاب task بعدی ----------
+
+    def _effective_priority(self, task: Task, now: float) -> float:
+        return task.priority.value + (now - task.enqueued_at) / self.aging_interval
+
+    def _next_task(self) -> Optional[Task]:
+        """task با بیشترین اولویت مؤثر (اولویت + زمان انتظار)
+
+        در هر سطح قدیمی‌ترین task جلوی صف است، پس مقایسه سر صف‌ها کافی است
+        """
+        now = time.monotonic()
+        best = None
+        for priority, queue in self.pending.items():
+            while queue and queue[0].status != TaskStatus.PENDING:
+                queue.popleft()  # لغو شده
+            if queue and (best is None or
+                          self._effective_priority(queue[0], now) > self._effective_priority(best, now)):
+                best = queue[0]
+        if best is None:
+            return None
+
+        if any(queue and queue[0].priority.value > best.priority.value for queue in self.pending.values()):
+            self.stats["aged_promotions"] += 1
+        return self.pending[best.priority].popleft()
+
+    # ---------- اجرا ----------
     
     async def _worker(self, worker_name: str):
         """Worker برای اجرای task ها"""
         print(f"👷 {worker_name} شروع به کار کرد")
         
         while self.is_running:
-            try:
-                # دریافت task از صف
-                priority, task_id = await asyncio.wait_for(
-                    self.pending_queue.get(), 
-                    timeout=1.0
-                )
-                
-                if task_id not in self.tasks:
-                    continue
-                
-                task = self.tasks[task_id]
-                
-                # شروع اجرای task
-                task.status = TaskStatus.RUNNING
-                task.started_at = datetime.now()
-                self.running_tasks[task_id] = task
-                
-                print(f"🔄 {worker_name} در حال اجرای: {task.name}")
-                
-                try:
-                    # اجرای task
-                    if asyncio.iscoroutinefunction(task.func):
-                        result = await task.func(*task.args, **task.kwargs)
-                    else:
-                        result = task.func(*task.args, **task.kwargs)
-                    
-                    # تکمیل موفق
-                    task.result = result
-                    task.status = TaskStatus.COMPLETED
-                    task.completed_at = datetime.now()
-                    
-                    self.stats["completed_tasks"] += 1
-                    
-                    print(f"✅ {worker_name} تکمیل کرد: {task.name}")
-                
-                except Exception as e:
-                    # خطا در اجرا
-                    task.error = str(e)
-                    task.status = TaskStatus.FAILED
-                    task.completed_at = datetime.now()
-                    
-                    self.stats["failed_tasks"] += 1
-                    
-                    print(f"❌ {worker_name} خطا در: {task.name} - {e}")
-                
-                finally:
-                    # انتقال از running به completed
-                    if task_id in self.running_tasks:
-                        del self.running_tasks[task_id]
-                    self.completed_tasks[task_id] = task
-                    
-                    # محاسبه میانگین زمان اجرا
-                    if task.started_at and task.completed_at:
-                        execution_time = (task.completed_at - task.started_at).total_seconds()
-                        self._update_average_execution_time(execution_time)
-            
-            except asyncio.TimeoutError:
-                # timeout عادی برای بررسی is_running
+            task = self._next_task()
+            if task is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
                 continue
+
+            try:
+                task.handle = asyncio.ensure_future(self._run_task(task, worker_name))
+                await asyncio.shield(task.handle)
+            except asyncio.CancelledError:
+                if not self.is_running:
+                    task.handle.cancel()
+                    raise
+                # فقط همین task لغو شد (cancel_task) - worker ادامه می‌دهد
             except Exception as e:
                 print(f"خطا در {worker_name}: {e}")
+            finally:
+                task.handle = None
+
+    async def _call(self, task: Task) -> Any:
+        if asyncio.iscoroutinefunction(task.func):
+            return await task.func(*task.args, **task.kwargs)
+
+        loop = asyncio.get_running_loop()
+        call = functools.partial(task.func, *task.args, **task.kwargs)
+        executor = self.executor
+        if task.run_in == "process":
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            executor = self._process_pool
+        result = await loop.run_in_executor(executor, call)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    async def _run_task(self, task: Task, worker_name: str):
+        task.status = TaskStatus.RUNNING
+        task.started_at = task.started_at or datetime.now()
+        task.attempts += 1
+        self.running_tasks[task.id] = task
+
+        print(f"🔄 {worker_name} در حال اجرای: {task.name}")
+
+        try:
+            if task.timeout:
+                result = await asyncio.wait_for(self._call(task), task.timeout)
+            else:
+                result = await self._call(task)
+        except asyncio.CancelledError:
+            self.running_tasks.pop(task.id, None)
+            self._finish(task, TaskStatus.CANCELLED, error="cancelled")
+            raise
+        except Exception as e:
+            self.running_tasks.pop(task.id, None)
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats["timeouts"] += 1
+                error = f"timeout after {task.timeout}s"
+            else:
+                error = str(e)
+
+            if task.attempts <= task.max_retries:
+                # تلاش مجدد با backoff نمایی
+                delay = task.retry_backoff * (2 ** (task.attempts - 1))
+                task.status = TaskStatus.PENDING
+                task.error = error
+                self.stats["retries"] += 1
+                print(f"🔁 {worker_name} تلاش مجدد {task.name} پس از {delay:.1f}s - {error}")
+                asyncio.get_running_loop().call_later(delay, self._enqueue, task)
+                return
+
+            print(f"❌ {worker_name} خطا در: {task.name} - {error}")
+            self._finish(task, TaskStatus.FAILED, error=error)
+            return
+
+        self.running_tasks.pop(task.id, None)
+        print(f"✅ {worker_name} تکمیل کرد: {task.name}")
+        self._finish(task, TaskStatus.COMPLETED, result=result)
+
+    def _finish(self, task: Task, status: TaskStatus, result: Any = None, error: str = None):
+        """ثبت پایان task، تکمیل future و اعمال سقف نگه‌داری"""
+        task.status = status
+        task.result = result
+        task.error = error
+        task.completed_at = datetime.now()
+
+        if status == TaskStatus.COMPLETED:
+            self.stats["completed_tasks"] += 1
+            if task.started_at:
+                self._update_average_execution_time((task.completed_at - task.started_at).total_seconds())
+            if not task.future.done():
+                task.future.set_result(result)
+        elif status == TaskStatus.FAILED:
+            self.stats["failed_tasks"] += 1
+            if not task.future.done():
+                task.future.set_exception(Exception(f"Task failed: {error}"))
+        else:
+            self.stats["cancelled_tasks"] += 1
+            if not task.future.done():
+                task.future.cancel()
+
+        # آزادسازی ارجاع به تابع و آرگومان‌ها
+        task.func, task.args, task.kwargs = None, (), {}
+        self.completed_tasks[task.id] = task
+        self._evict_finished()
+
+    def _evict_finished(self):
+        cutoff = datetime.now().timestamp() - self.retention_seconds
+        while self.completed_tasks:
+            task_id, task = next(iter(self.completed_tasks.items()))
+            if len(self.completed_tasks) <= self.max_retained and task.completed_at.timestamp() >= cutoff:
+                break
+            self.completed_tasks.popitem(last=False)
+            self.tasks.pop(task_id, None)
+            self.stats["evicted"] += 1
+
+    def cancel_task(self, task_id: str) -> bool:
+        """لغو task در صف یا در حال اجرا (تابع sync در حال اجرا در thread متوقف نمی‌شود، فقط منتظرش نمی‌مانیم)"""
+        task = self.tasks.get(task_id)
+        if task is None or task.status in (TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED):
+            return False
+
+        if task.status == TaskStatus.RUNNING and task.handle is not None:
+            task.handle.cancel()
+        else:
+            # در صف یا منتظر تلاش مجدد - هنگام برداشتن از صف نادیده گرفته می‌شود
+            self._finish(task, TaskStatus.CANCELLED, error="cancelled")
+        print(f"🚫 Task لغو شد: {task.name}")
+        return True
     
     def _update_average_execution_time(self, execution_time: float):
         """به‌روزرسانی میانگین زمان اجرا"""
@@ -209,6 +364,7 @@ class AsyncTaskQueue:
             "name": task.name,
             "status": task.status.value,
             "priority": task.priority.name,
+            "attempts": task.attempts,
             "created_at": task.created_at.isoformat(),
             "started_at": task.started_at.isoformat() if task.started_at else None,
             "completed_at": task.completed_at.isoformat() if task.completed_at else None,
@@ -220,7 +376,11 @@ class AsyncTaskQueue:
         """آمار صف"""
         return {
             **self.stats,
-            "pending_tasks": self.pending_queue.qsize(),
+            "pending_tasks": sum(1 for task in self.tasks.values() if task.status == TaskStatus.PENDING),
+            "pending_by_priority": {
+                priority.name: sum(1 for task in queue if task.status == TaskStatus.PENDING)
+                for priority, queue in self.pending.items()
+            },
             "running_tasks": len(self.running_tasks),
             "completed_tasks_stored": len(self.completed_tasks),
             "workers": len(self.workers),
@@ -228,20 +388,19 @@ class AsyncTaskQueue:
         }
     
     async def wait_for_task(self, task_id: str, timeout: float = 30.0) -> Optional[Any]:
-        """انتظار برای تکمیل task"""
-        start_time = datetime.now()
-        
-        while (datetime.now() - start_time).total_seconds() < timeout:
-            if task_id in self.completed_tasks:
-                task = self.completed_tasks[task_id]
-                if task.status == TaskStatus.COMPLETED:
-                    return task.result
-                elif task.status == TaskStatus.FAILED:
-                    raise Exception(f"Task failed: {task.error}")
-            
-            await asyncio.sleep(0.1)
-        
-        raise asyncio.TimeoutError(f"Task {task_id} timeout after {timeout}s")
+        """انتظار برای تکمیل task - بدون polling، با future همان task"""
+        task = self.tasks.get(task_id)
+        if task is None:
+            raise KeyError(f"Task {task_id} not found")
+        
+        try:
+            return await asyncio.wait_for(asyncio.shield(task.future), timeout)
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError(f"Task {task_id} timeout after {timeout}s") from None
+        except asyncio.CancelledError:
+            if task.future.cancelled():
+                raise Exception(f"Task cancelled: {task_id}") from None
+            raise
 
 # Instance سراسری
 task_queue = AsyncTaskQueue(max_workers=3)
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+🗂️ ایندکس موضوعات یادگیری شده
+موضوعات در حافظه می‌مانند و کلمات کلیدی همه موضوعات در یک automaton (KeywordMatcher)
+جمع می‌شوند؛ فایل فقط وقتی mtime آن عوض شده باشد دوباره خوانده می‌شود و تشخیص موضوع
+به جای پیمایش همه موضوعات، پیام را یک بار پیمایش می‌کند. تطبیق مثل قبل زیررشته‌ای است
+تا کلمات کلیدی شکل‌های صرف شده و چسبیده (مثلاً «برنامه‌نویسیم») را هم پیدا کنند
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .keyword_matcher import KeywordMatcher
+from .state_store import state_store
+
+class LearnedTopicIndex:
+    def __init__(self, path: str = "data/learning/learned_topics.json", min_score: int = 2):
+        self.path = path
+        self.min_score = min_score  # حداقل تعداد کلمات کلیدی مشترک برای تشخیص موضوع
+
+        self.topics: Dict[str, Dict] = {}
+        self._matcher: Optional[KeywordMatcher] = None  # پس از هر تغییر دوباره ساخته می‌شود
+
+        self._mtime: Optional[float] = None
+        self._lock = threading.RLock()
+
+        # آمار
+        self.stats = {
+            "reloads": 0,
+            "lookups": 0,
+            "hits": 0,
+            "updates": 0
+        }
+
+    # ---------- بارگذاری ----------
+
+    def refresh(self):
+        """بارگذاری مجدد فقط اگر فایل از بیرون تغییر کرده باشد"""
+        with self._lock:
+            # تغییرات در حافظه هنوز نوشته نشده‌اند - فایل روی دیسک قدیمی‌تر است
+            if state_store.is_dirty(self.path):
+                return
+
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                mtime = None
+
+            if mtime == self._mtime:
+                return
+
+            topics = {}
+            if mtime is not None:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        topics = json.load(f)
+                except Exception as e:
+                    print(f"⚠️ خطا در خواندن موضوعات یادگیری شده: {e}")
+                    topics = {}
+
+            self.topics = topics if isinstance(topics, dict) else {}
+            self._mtime = mtime
+            self._rebuild()
+            self.stats["reloads"] += 1
+
+    def _rebuild(self):
+        self._matcher = None
+
+    def _get_matcher(self) -> KeywordMatcher:
+        if self._matcher is None:
+            self._matcher = KeywordMatcher({
+                topic_name: [str(keyword) for keyword in topic_data.get('keywords', [])]
+                for topic_name, topic_data in self.topics.items()
+            })
+        return self._matcher
+
+    # ---------- تشخیص ----------
+
+    def detect(self, text: str) -> Optional[str]:
+        """تشخیص موضوع یادگیری شده - هزینه متناسب با طول پیام
+
+        امتیاز هر موضوع = تعداد کلمات کلیدی متمایز آن که در پیام (به صورت زیررشته) آمده‌اند
+        """
+        self.refresh()
+        self.stats["lookups"] += 1
+
+        with self._lock:
+            if not self.topics:
+                return None
+            matcher = self._get_matcher()
+        scores = matcher.scores(text)
+
+        if not scores:
+            return None
+
+        # در تساوی امتیاز، موضوعی که زودتر تعریف شده (مثل پیمایش قبلی)
+        best_topic = max(matcher.categories, key=lambda name: scores.get(name, 0))
+        if scores.get(best_topic, 0) < self.min_score:
+            return None
+
+        self.stats["hits"] += 1
+        return best_topic
+
+    # ---------- به‌روزرسانی ----------
+
+    def learn(self, topic_name: str, keywords: List[str]):
+        """افزودن/به‌روزرسانی یک موضوع به صورت درجا و ذخیره تأخیری"""
+        self.refresh()
+        with self._lock:
+            topic_data = self.topics.get(topic_name)
+            if topic_data is not None:
+                existing_keywords = set(topic_data.get('keywords', []))
+                combined_keywords = list(existing_keywords.union(keywords))
+                topic_data['keywords'] = combined_keywords
+                topic_data['usage_count'] = topic_data.get('usage_count', 0) + 1
+            else:
+                topic_data = {
+                    'keywords': keywords[:10],  # حداکثر 10 کلمه کلیدی
+                    'created_at': datetime.now().isoformat(),
+                    'usage_count': 1
+                }
+                self.topics[topic_name] = topic_data
+            self._rebuild()
+            self.stats["updates"] += 1
+
+        self._schedule_save()
+
+    def replace(self, topics: Dict):
+        """جایگزینی کامل موضوعات (مثلاً پاک کردن همه)"""
+        with self._lock:
+            self.topics = dict(topics)
+            self._rebuild()
+            self.stats["updates"] += 1
+        self._schedule_save()
+
+    def get_topics(self) -> Dict:
+        """موضوعات فعلی (پس از بررسی تغییر فایل)"""
+        self.refresh()
+        return self.topics
+
+    def _snapshot(self) -> Dict:
+        with self._lock:
+            return {name: dict(data, keywords=list(data.get('keywords', [])))
+                    for name, data in self.topics.items()}
+
+    def _on_written(self, path: str):
+        """ثبت mtime نوشته شده توسط خودمان تا بارگذاری مجدد بی‌دلیل انجام نشود"""
+        with self._lock:
+            try:
+                self._mtime = os.path.getmtime(path)
+            except OSError:
+                pass
+
+    def _schedule_save(self):
+        state_store.schedule_save(self.path, self._snapshot, on_written=self._on_written, indent=2)
+
+    def get_stats(self) -> Dict:
+        """آمار ایندکس"""
+        with self._lock:
+            return {
+                **self.stats,
+                "topics": len(self.topics),
+                "indexed_keywords": len(self._matcher.patterns) if self._matcher else None
+            }
@@ -0,0 +1,190 @@
+"""
+📥 صف نوشتن دسته‌ای در پایگاه برداری (ChromaDB)
+نوشتن‌ها در درخواست فقط در صف قرار می‌گیرند؛ یک thread پس‌زمینه آن‌ها را بر اساس
+اندازه دسته یا حداکثر تأخیر یکجا می‌کند، embedding همه متن‌ها را در یک فراخوانی
+محاسبه می‌کند و با upsert (بدون خطای شناسه تکراری) در هر مجموعه می‌نویسد؛
+دسته ناموفق به صف برمی‌گردد و با backoff نمایی دوباره نوشته می‌شود
+"""
+
+import atexit
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+class VectorWriteQueue:
+    def __init__(self, embed_texts: Callable[[Sequence[str]], Optional[List[List[float]]]] = None,
+                 batch_size: int = 32, max_delay: float = 2.0,
+                 retry_delay: float = 1.0, max_retry_delay: float = 60.0):
+        self.embed_texts = embed_texts  # None = embedding توسط خود ChromaDB
+        self.batch_size = batch_size    # با رسیدن به این تعداد فوراً نوشته می‌شود
+        self.max_delay = max_delay      # حداکثر ماندن اولین آیتم در صف
+        self.retry_delay = retry_delay          # تأخیر اولین تلاش دوباره پس از شکست
+        self.max_retry_delay = max_retry_delay  # سقف backoff
+
+        self.collections: Dict[str, object] = {}
+        # مجموعه -> شناسه -> (متن، metadata)؛ نسخه جدیدتر همان شناسه جایگزین قبلی می‌شود
+        self._pending: Dict[str, Dict[str, tuple]] = {}
+        self._pending_count = 0
+        self._first_pending_at: Optional[float] = None
+        self._consecutive_failures = 0
+        self._retry_at: Optional[float] = None
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()  # یک flush در هر لحظه
+        self._thread: Optional[threading.Thread] = None
+
+        # آمار
+        self.stats = {
+            "queued": 0,
+            "deduplicated": 0,
+            "written": 0,
+            "batches": 0,
+            "size_flushes": 0,
+            "time_flushes": 0,
+            "failures": 0,
+            "retried": 0,
+            "last_batch_ms": 0.0
+        }
+
+        atexit.register(self.flush)
+
+    def register_collection(self, name: str, collection):
+        self.collections[name] = collection
+
+    def enqueue(self, name: str, item_id: str, document: str, metadata: Dict = None):
+        """افزودن سند به صف - فوری برمی‌گردد"""
+        with self._lock:
+            self.stats["queued"] += 1
+            pending = self._pending.setdefault(name, {})
+            if item_id in pending:
+                self.stats["deduplicated"] += 1
+            else:
+                self._pending_count += 1
+            pending[item_id] = (document, metadata or {})
+
+            if self._first_pending_at is None:
+                self._first_pending_at = time.time()
+
+            self._ensure_thread()
+            self._wakeup.notify()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._pending_count
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._flush_loop, name="vector-writes", daemon=True)
+            self._thread.start()
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                while not self._pending_count:
+                    self._wakeup.wait()
+
+                # پس از شکست، صبر تا زمان تلاش دوباره
+                while self._retry_at is not None:
+                    remaining = self._retry_at - time.time()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.wait(remaining)
+
+                # صبر تا پر شدن دسته یا رسیدن به max_delay
+                while self._pending_count and self._pending_count < self.batch_size:
+                    remaining = self._first_pending_at + self.max_delay - time.time()
+                    if remaining <= 0:
+                        break
+                    self._wakeup.wait(remaining)
+
+                if not self._pending_count:
+                    continue
+                reason = "size_flushes" if self._pending_count >= self.batch_size else "time_flushes"
+                self.stats[reason] += 1
+
+            self.flush()
+
+    def flush(self):
+        """نوشتن فوری همه آیتم‌های صف (هنگام خاموشی هم صدا زده می‌شود)"""
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending
+                self._pending = {}
+                self._pending_count = 0
+                self._first_pending_at = None
+
+            if not pending:
+                return
+
+            started = time.perf_counter()
+            failed = False
+            for name, items in pending.items():
+                if not self._write_batch(name, items):
+                    self._requeue(name, items)
+                    failed = True
+            self.stats["last_batch_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+            with self._lock:
+                if failed:
+                    self._consecutive_failures += 1
+                    delay = min(self.max_retry_delay, self.retry_delay * 2 ** (self._consecutive_failures - 1))
+                    self._retry_at = time.time() + delay
+                else:
+                    self._consecutive_failures = 0
+                    self._retry_at = None
+
+    def _requeue(self, name: str, items: Dict[str, tuple]):
+        """بازگرداندن دسته ناموفق به صف - نسخه جدیدتر همان شناسه (ثبت شده در حین نوشتن) حفظ می‌شود"""
+        with self._lock:
+            pending = self._pending.setdefault(name, {})
+            for item_id, item in items.items():
+                if item_id not in pending:
+                    pending[item_id] = item
+                    self._pending_count += 1
+            self.stats["retried"] += len(items)
+            if self._first_pending_at is None:
+                self._first_pending_at = time.time()
+
+    def _write_batch(self, name: str, items: Dict[str, tuple]) -> bool:
+        """نوشتن دسته در مجموعه - False یعنی باید دوباره تلاش شود"""
+        collection = self.collections.get(name)
+        if collection is None:
+            print(f"⚠️ مجموعه برداری {name} ثبت نشده، {len(items)} آیتم نادیده گرفته شد")
+            return True
+
+        ids = list(items)
+        documents = [items[item_id][0] for item_id in ids]
+        metadatas = [items[item_id][1] for item_id in ids]
+
+        try:
+            embeddings = self.embed_texts(documents) if self.embed_texts else None
+            collection.upsert(
+                ids=ids,
+                documents=documents,
+                metadatas=metadatas,
+                **({"embeddings": embeddings} if embeddings else {})
+            )
+            self.stats["written"] += len(ids)
+            self.stats["batches"] += 1
+            print(f"📥 {len(ids)} آیتم در {name} نوشته شد")
+            return True
+        except Exception as e:
+            self.stats["failures"] += 1
+            print(f"خطا در ذخیره دسته‌ای vector ({name}): {e} - تلاش دوباره")
+            return False
+
+    def close(self):
+        self.flush()
+
+    def get_stats(self) -> Dict:
+        """آمار صف نوشتن برداری"""
+        with self._lock:
+            pending = self._pending_count
+        return {
+            **self.stats,
+            "pending": pending,
+            "retry_in": round(max(0.0, self._retry_at - time.time()), 1) if self._retry_at else 0.0,
+            "batch_size": self.batch_size,
+            "max_delay": self.max_delay
+        }
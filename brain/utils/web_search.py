@@ -3,7 +3,7 @@
 قابلیت جستجو و دریافت اطلاعات از اینترنت
 """
 
-import requests
+import asyncio
 import json
 from typing import List, Dict, Optional
 from datetime import datetime
@@ -11,6 +11,35 @@ import re
 from urllib.parse import quote_plus
 import time
 
+import aiohttp
+
+from .keyword_matcher import KeywordMatcher, normalize_persian
+from .message_analysis import MessageAnalysis
+from .expiring_lru import ExpiringLRU
+from .connectivity import ConnectivityMonitor
+
+# نشانگرهای cache جستجو
+_MISSING = object()
+_NO_RESULTS = object()  # جستجو انجام شد ولی نتیجه‌ای نداشت (negative caching)
+
+# دسته‌های کلمات کلیدی تصمیم جستجوی وب
+SEARCH_KEYWORDS = KeywordMatcher({
+    # پیام‌های ساده که نیاز به جستجوی وب ندارن
+    "greeting": [
+        "سلام", "درود", "صبح بخیر", "عصر بخیر", "شب بخیر",
+        "چطوری", "حالت چطوره", "خوبی", "چه خبر",
+        "hello", "hi", "how are you", "good morning"
+    ],
+    # کلمات کلیدی که نشان‌دهنده نیاز به اطلاعات جدید هستند
+    "web": [
+        "آخرین", "جدیدترین", "امروز", "الان", "فعلی", "اخبار",
+        "قیمت", "نرخ", "ارز", "بورس", "هوا", "آب و هوا",
+        "چه خبر", "چه اتفاقی", "وضعیت", "آمار", "تاریخ",
+        "کی", "کجا", "چطور", "چرا", "چیست", "تعریف",
+        "latest", "current", "today", "now", "news", "price"
+    ]
+})
+
 class WebSearchEngine:
     def __init__(self):
         self.search_engines = {
@@ -23,43 +52,61 @@ class WebSearchEngine:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
         
+        # منابع به ترتیب اولویت در خلاصه و timeout هر کدام (ثانیه)
+        self.sources = {
+            "wikipedia": self._search_wikipedia_fa,
+            "duckduckgo": self._search_duckduckgo
+        }
+        self.source_timeouts = {"wikipedia": 4.0, "duckduckgo": 4.0}
+        self.search_deadline = 5.0   # سقف کل جستجو
+        self.grace_period = 0.5      # صبر برای بقیه منابع پس از اولین نتیجه مفید
+        
+        # session مشترک aiohttp
+        self.max_connections = 10
+        self._session: Optional[aiohttp.ClientSession] = None
+        
+        # وضعیت اتصال در حافظه - با نتیجه جستجوها و بررسی پس‌زمینه به‌روز می‌شود
+        self.connectivity = ConnectivityMonitor(self._get_session)
+        
+        # cache نتایج بر اساس پرسش یکسان‌سازی شده
+        self.result_ttl = 900        # 15 دقیقه
+        self.negative_ttl = 120      # نتیجه خالی/ناقص: 2 دقیقه
+        self.search_cache = ExpiringLRU(max_entries=500)
+        
+        # آمار
+        self.stats = {
+            "searches": 0,
+            "cache_hits": 0,
+            "negative_hits": 0,
+            "source_timeouts": 0,
+            "source_errors": 0,
+            "cancelled_sources": 0,
+            "last_search_ms": 0
+        }
+        
         print("🌐 سیستم جستجوی وب راه‌اندازی شد")
     
-    def should_search_web(self, query: str, context: List[Dict] = None) -> bool:
+    def should_search_web(self, query: str, context: List[Dict] = None, message_analysis: MessageAnalysis = None) -> bool:
         """تشخیص اینکه آیا نیاز به جستجوی وب هست یا نه"""
+        message_analysis = MessageAnalysis.of(message_analysis or query)
         
-        # پیام‌های ساده که نیاز به جستجوی وب ندارن
-        simple_greetings = [
-            "سلام", "درود", "صبح بخیر", "عصر بخیر", "شب بخیر",
-            "چطوری", "حالت چطوره", "خوبی", "چه خبر",
-            "hello", "hi", "how are you", "good morning"
-        ]
-        
-        query_lower = query.lower().strip()
+        query_lower = message_analysis.lower.strip()
+        matched = message_analysis.scan(SEARCH_KEYWORDS)
         
         # اگر پیام ساده سلام و احوال‌پرسی باشه، جستجو نکن
-        if any(greeting in query_lower for greeting in simple_greetings):
+        if "greeting" in matched:
             return False
         
         # اگر پیام خیلی کوتاه باشه (کمتر از 5 کلمه)
-        if len(query.split()) < 5:
+        if message_analysis.word_count < 5:
             return False
         
-        # کلمات کلیدی که نشان‌دهنده نیاز به اطلاعات جدید هستند
-        web_indicators = [
-            "آخرین", "جدیدترین", "امروز", "الان", "فعلی", "اخبار",
-            "قیمت", "نرخ", "ارز", "بورس", "هوا", "آب و هوا",
-            "چه خبر", "چه اتفاقی", "وضعیت", "آمار", "تاریخ",
-            "کی", "کجا", "چطور", "چرا", "چیست", "تعریف",
-            "latest", "current", "today", "now", "news", "price"
-        ]
-        
         # اگر شامل کلمات کلیدی باشد
-        if any(indicator in query_lower for indicator in web_indicators):
+        if "web" in matched:
             return True
         
         # اگر سؤال پیچیده باشد و در context جواب نباشد
-        if "؟" in query and len(query.split()) > 8 and (not context or len(context) == 0):
+        if "؟" in query and message_analysis.word_count > 8 and (not context or len(context) == 0):
             return True
         
         # پیش‌فرض: جستجو نکن
@@ -73,160 +120,235 @@ class WebSearchEngine:
         
         return False
     
-    async def search_and_summarize(self, query: str) -> Optional[Dict]:
-        """جستجو و خلاصه‌سازی نتایج"""
-        
-        print(f"🔍 جستجوی وب برای: {query}")
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """session مشترک با connection pool - به صورت تنبل ساخته می‌شود چون نیاز به event loop دارد"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300),
+                headers=self.headers
+            )
+        return self._session
+    
+    async def close(self):
+        """بستن session و آزادسازی اتصال‌ها"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """کلید cache: متن یکسان‌سازی شده بدون علامت سؤال و فاصله‌های اضافه"""
+        return " ".join(normalize_persian(query).replace("؟", " ").replace("?", " ").split())
+    
+    async def search_and_summarize(self, query: str, deadline: float = None) -> Optional[Dict]:
+        """جستجو و خلاصه‌سازی نتایج
+
+        منابع همزمان جستجو می‌شوند و کل جستجو حداکثر deadline ثانیه طول می‌کشد؛
+        نتیجه (حتی «بدون نتیجه») با TTL در cache می‌ماند
+        """
+        cache_key = self._normalize_query(query)
+        self.stats["searches"] += 1
         
-        # جستجو در منابع مختلف
-        results = []
+        cached = self.search_cache.get(cache_key, _MISSING)
+        if cached is _NO_RESULTS:
+            self.stats["negative_hits"] += 1
+            print(f"🔍 جستجوی وب (cache): بدون نتیجه برای {query}")
+            return None
+        if cached is not _MISSING:
+            self.stats["cache_hits"] += 1
+            print(f"🔍 جستجوی وب (cache): {query}")
+            return cached
         
-        # جستجو در ویکی‌پدیا فارسی
-        wiki_result = await self._search_wikipedia_fa(query)
-        if wiki_result:
-            results.append(wiki_result)
+        print(f"🔍 جستجوی وب برای: {query}")
         
-        # جستجو در DuckDuckGo
-        ddg_result = await self._search_duckduckgo(query)
-        if ddg_result:
-            results.extend(ddg_result)
+        # جستجو در منابع مختلف - همزمان
+        results, failures = await self._search_sources(query, deadline or self.search_deadline)
         
         if not results:
+            # اگر همه منابع خطا داشتند (مثلاً قطعی شبکه) نتیجه منفی ذخیره نمی‌شود
+            if failures < len(self.sources):
+                self.search_cache.set(cache_key, _NO_RESULTS, ttl=self.negative_ttl)
             return None
         
         # خلاصه‌سازی نتایج
         summary = self._summarize_results(results, query)
         
-        return {
+        web_info = {
             "query": query,
             "timestamp": datetime.now().isoformat(),
             "sources": len(results),
             "summary": summary,
             "raw_results": results[:3]  # فقط 3 نتیجه اول
         }
+        # نتیجه ناقص (منبع ناموفق یا فقط پاسخ عمومی) عمر کوتاه‌تری در cache دارد
+        complete = not failures and any(item.get("type") != "fallback" for item in results)
+        self.search_cache.set(cache_key, web_info, ttl=self.result_ttl if complete else self.negative_ttl)
+        return web_info
     
-    async def _search_wikipedia_fa(self, query: str) -> Optional[Dict]:
-        """جستجو در ویکی‌پدیا فارسی"""
+    async def _search_sources(self, query: str, deadline: float):
+        """اجرای همزمان منابع؛ پس از اولین نتیجه مفید فقط grace_period برای بقیه صبر می‌شود
+
+        خروجی: (نتایج به ترتیب اولویت منابع، تعداد منابع ناموفق)
+        """
+        session = await self._get_session()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        
+        tasks = {
+            asyncio.ensure_future(self._run_source(name, search, session, query)): name
+            for name, search in self.sources.items()
+        }
+        source_results: Dict[str, List[Dict]] = {}
+        failures = 0
+        stop_at = started + deadline
+        
         try:
-            # ابتدا جستجو کنیم
-            search_url = "https://fa.wikipedia.org/w/api.php"
-            search_params = {
-                'action': 'query',
-                'format': 'json',
-                'list': 'search',
-                'srsearch': query.replace("؟", "").strip(),
-                'srlimit': 1
-            }
-            
-            search_response = requests.get(search_url, params=search_params, headers=self.headers, timeout=10)
-            
-            if search_response.status_code == 200:
-                search_data = search_response.json()
-                
-                if search_data.get('query', {}).get('search'):
-                    page_title = search_data['query']['search'][0]['title']
-                    
-                    # حالا محتوای صفحه را بگیریم
-                    content_params = {
-                        'action': 'query',
-                        'format': 'json',
-                        'titles': page_title,
-                        'prop': 'extracts',
-                        'exintro': True,
-                        'explaintext': True,
-                        'exsectionformat': 'plain'
-                    }
-                    
-                    content_response = requests.get(search_url, params=content_params, headers=self.headers, timeout=10)
-                    
-                    if content_response.status_code == 200:
-                        content_data = content_response.json()
-                        pages = content_data.get('query', {}).get('pages', {})
-                        
-                        for page_id, page_data in pages.items():
-                            if page_data.get('extract'):
-                                return {
-                                    "source": "ویکی‌پدیا فارسی",
-                                    "title": page_data.get('title', ''),
-                                    "content": page_data.get('extract', ''),
-                                    "url": f"https://fa.wikipedia.org/wiki/{page_title.replace(' ', '_')}",
-                                    "type": "encyclopedia"
-                                }
-        
-        except Exception as e:
-            print(f"خطا در جستجوی ویکی‌پدیا: {e}")
+            pending = set(tasks)
+            while pending:
+                remaining = stop_at - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    found = task.result()
+                    if found is None:
+                        failures += 1
+                        continue
+                    source_results[tasks[task]] = found
+                    # نتیجه مفید رسید - بقیه منابع فقط کمی دیگر فرصت دارند
+                    if any(item.get("type") != "fallback" for item in found):
+                        stop_at = min(stop_at, loop.time() + self.grace_period)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                    self.stats["cancelled_sources"] += 1
         
-        return None
+        self.stats["last_search_ms"] = round((loop.time() - started) * 1000)
+        
+        # به‌روزرسانی غیرفعال وضعیت اتصال از نتیجه واقعی منابع
+        if source_results:
+            self.connectivity.report_success()
+        elif failures == len(self.sources):
+            self.connectivity.report_failure()
+        
+        results = []
+        for name in self.sources:
+            results.extend(source_results.get(name, []))
+        
+        # پاسخ عمومی فقط وقتی هیچ منبع دیگری نتیجه نداده باشد
+        useful = [item for item in results if item.get("type") != "fallback"]
+        return (useful or results), failures
     
-    async def _search_duckduckgo(self, query: str) -> List[Dict]:
-        """جستجو در DuckDuckGo"""
+    async def _run_source(self, name: str, search, session: aiohttp.ClientSession, query: str) -> Optional[List[Dict]]:
+        """اجرای یک منبع با timeout مخصوص خودش - None یعنی خطا"""
         try:
-            # DuckDuckGo Instant Answer API
-            params = {
-                'q': query,
-                'format': 'json',
-                'no_html': '1',
-                'skip_disambig': '1'
-            }
-            
-            response = requests.get(
-                "https://api.duckduckgo.com/",
-                params=params,
-                headers=self.headers,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                results = []
-                
-                # Abstract (خلاصه اصلی)
-                if data.get('Abstract'):
-                    results.append({
-                        "source": "DuckDuckGo",
-                        "title": data.get('AbstractText', ''),
-                        "content": data.get('Abstract', ''),
-                        "url": data.get('AbstractURL', ''),
-                        "type": "abstract"
-                    })
-                
-                # Definition (تعریف)
-                if data.get('Definition'):
-                    results.append({
-                        "source": "تعریف",
-                        "title": "تعریف",
-                        "content": data.get('Definition', ''),
-                        "url": data.get('DefinitionURL', ''),
-                        "type": "definition"
-                    })
-                
-                # Answer (پاسخ مستقیم)
-                if data.get('Answer'):
-                    results.append({
-                        "source": "پاسخ مستقیم",
-                        "title": "پاسخ",
-                        "content": data.get('Answer', ''),
-                        "url": "",
-                        "type": "direct_answer"
-                    })
-                
-                # اگر نتیجه‌ای نیافتیم، یک پاسخ عمومی بدهیم
-                if not results:
-                    results.append({
-                        "source": "سیستم",
-                        "title": "اطلاعات عمومی",
-                        "content": f"متأسفانه اطلاعات دقیقی درباره '{query}' در دسترس نیست، اما می‌توانم بر اساس دانش عمومی‌ام کمکتان کنم.",
-                        "url": "",
-                        "type": "fallback"
-                    })
-                
-                return results
+            return await asyncio.wait_for(search(session, query), timeout=self.source_timeouts[name])
+        except asyncio.TimeoutError:
+            self.stats["source_timeouts"] += 1
+            print(f"⏰ جستجوی {name} به موقع تمام نشد")
+        except (aiohttp.ClientError, ValueError) as e:
+            self.stats["source_errors"] += 1
+            print(f"خطا در جستجوی {name}: {e}")
+        return None
+    
+    async def _get_json(self, session: aiohttp.ClientSession, url: str, params: Dict) -> Optional[Dict]:
+        """پاسخ غیر 200 (مثلاً 429/5xx) خطای منبع است نه «بدون نتیجه» - ClientResponseError"""
+        async with session.get(url, params=params) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+    
+    async def _search_wikipedia_fa(self, session: aiohttp.ClientSession, query: str) -> List[Dict]:
+        """جستجو در ویکی‌پدیا فارسی - یک درخواست (generator=search همراه با extracts)"""
+        search_url = "https://fa.wikipedia.org/w/api.php"
+        params = {
+            'action': 'query',
+            'format': 'json',
+            'generator': 'search',
+            'gsrsearch': query.replace("؟", "").strip(),
+            'gsrlimit': 1,
+            'prop': 'extracts',
+            'exintro': 1,
+            'explaintext': 1,
+            'exsectionformat': 'plain'
+        }
         
-        except Exception as e:
-            print(f"خطا در جستجوی DuckDuckGo: {e}")
+        data = await self._get_json(session, search_url, params)
+        if not data:
+            return []
+        
+        pages = data.get('query', {}).get('pages', {})
+        for page_id, page_data in pages.items():
+            if page_data.get('extract'):
+                page_title = page_data.get('title', '')
+                return [{
+                    "source": "ویکی‌پدیا فارسی",
+                    "title": page_title,
+                    "content": page_data.get('extract', ''),
+                    "url": f"https://fa.wikipedia.org/wiki/{page_title.replace(' ', '_')}",
+                    "type": "encyclopedia"
+                }]
         
         return []
     
+    async def _search_duckduckgo(self, session: aiohttp.ClientSession, query: str) -> List[Dict]:
+        """جستجو در DuckDuckGo"""
+        # DuckDuckGo Instant Answer API
+        params = {
+            'q': query,
+            'format': 'json',
+            'no_html': '1',
+            'skip_disambig': '1'
+        }
+        
+        data = await self._get_json(session, "https://api.duckduckgo.com/", params)
+        if data is None:
+            return []
+        
+        results = []
+        
+        # Abstract (خلاصه اصلی)
+        if data.get('Abstract'):
+            results.append({
+                "source": "DuckDuckGo",
+                "title": data.get('AbstractText', ''),
+                "content": data.get('Abstract', ''),
+                "url": data.get('AbstractURL', ''),
+                "type": "abstract"
+            })
+        
+        # Definition (تعریف)
+        if data.get('Definition'):
+            results.append({
+                "source": "تعریف",
+                "title": "تعریف",
+                "content": data.get('Definition', ''),
+                "url": data.get('DefinitionURL', ''),
+                "type": "definition"
+            })
+        
+        # Answer (پاسخ مستقیم)
+        if data.get('Answer'):
+            results.append({
+                "source": "پاسخ مستقیم",
+                "title": "پاسخ",
+                "content": data.get('Answer', ''),
+                "url": "",
+                "type": "direct_answer"
+            })
+        
+        # اگر نتیجه‌ای نیافتیم، یک پاسخ عمومی بدهیم
+        if not results:
+            results.append({
+                "source": "سیستم",
+                "title": "اطلاعات عمومی",
+                "content": f"متأسفانه اطلاعات دقیقی درباره '{query}' در دسترس نیست، اما می‌توانم بر اساس دانش عمومی‌ام کمکتان کنم.",
+                "url": "",
+                "type": "fallback"
+            })
+        
+        return results
+    
     def _summarize_results(self, results: List[Dict], original_query: str) -> str:
         """خلاصه‌سازی نتایج جستجو"""
         
@@ -253,10 +375,14 @@ class WebSearchEngine:
         
         return "اطلاعاتی پیدا شد اما قابل خلاصه‌سازی نبود."
     
+    def get_stats(self) -> Dict:
+        """آمار جستجوی وب"""
+        return {
+            **self.stats,
+            "cached_queries": len(self.search_cache),
+            "connectivity": self.connectivity.get_stats()
+        }
+    
     def is_online(self) -> bool:
-        """بررسی اتصال به اینترنت"""
-        try:
-            response = requests.get("https://www.google.com", timeout=5)
-            return response.status_code == 200
-        except:
-            return False
\ No newline at end of file
+        """وضعیت اتصال به اینترنت (کش شده - بدون درخواست شبکه)"""
+        return self.connectivity.is_online()
\ No newline at end of file
@@ -100,6 +100,56 @@ class FoxCLI:
             return "Connection error"
         return response
 
+    def respond(self, message: str) -> str:
+        """ارسال پیام و نمایش پاسخ - در حالت stream توکن‌ها به محض رسیدن چاپ می‌شوند"""
+        if not self.config.get("streaming", True):
+            response = self.chat(message)
+            print(f"{self.fox}🦊: {self.reset}", end='')
+            self.type_text(response)
+            return response
+
+        self.show_thinking()
+        streamed = ""
+        final = None
+        for event in self.client.chat_stream(message):
+            event_type = event.get("type")
+            if event_type == "draft":
+                # پیش‌نویس مدل سریع - پاسخ نهایی آن را تأیید یا جایگزین می‌کند
+                if not streamed:
+                    self.stop_thinking()
+                    print(f"{self.fox}🦊: {self.reset}", end='')
+                    streamed = event.get("message", "")
+                    print(streamed, end='', flush=True)
+            elif event_type == "delta":
+                if not streamed:
+                    self.stop_thinking()
+                    print(f"{self.fox}🦊: {self.reset}", end='')
+                token = event.get("message", "")
+                print(token, end='', flush=True)
+                streamed += token
+            elif event_type == "ai":
+                final = event.get("message")
+
+        if not streamed:
+            self.stop_thinking()
+            response = final if final is not None else "Connection error"
+            print(f"{self.fox}🦊: {self.reset}", end='')
+            self.type_text(response)
+            return response
+
+        if final is None:
+            print()
+            return streamed
+
+        # پاسخ نهایی ممکن است پس از تولید بهبود یافته باشد
+        head = streamed.strip()
+        if final.startswith(head):
+            print(final[len(head):])
+        else:
+            print()
+            self.type_text(final)
+        return final
+
     def show_commands(self):
         """نمایش لیست کوتاه دستورات"""
         commands = [
@@ -154,7 +204,8 @@ class FoxCLI:
         print(f"{self.fox}Config:{self.reset}")
         print(f"{self.dim}  Server: {self.config.get('server')}")
         print(f"  Voice: {'On' if self.config.get('voice_enabled') else 'Off'}")
-        print(f"  Typing effect: {'On' if self.config.get('typing_effect') else 'Off'}{self.reset}")
+        print(f"  Typing effect: {'On' if self.config.get('typing_effect') else 'Off'}")
+        print(f"  Streaming: {'On' if self.config.get('streaming', True) else 'Off'}{self.reset}")
 
     def cmd_server(self, url: str):
         """تنظیم آدرس سرور"""
@@ -292,9 +343,7 @@ class FoxCLI:
         print(f"{self.user}You (voice): {self.reset}{text}")
 
         # پردازش
-        response = self.chat(text)
-        print(f"{self.fox}🦊: {self.reset}", end='')
-        self.type_text(response)
+        response = self.respond(text)
 
         # پخش صدا
         if self.config.get("voice_enabled"):
@@ -376,9 +425,7 @@ class FoxCLI:
                     continue
 
                 # چت
-                response = self.chat(user_input)
-                print(f"{self.fox}🦊: {self.reset}", end='')
-                self.type_text(response)
+                response = self.respond(user_input)
                 print()
 
                 # پخش صدا
@@ -399,8 +446,7 @@ class FoxCLI:
             print(f"{self.err}Server not available{self.reset}")
             return
 
-        response = self.chat(message)
-        print(f"{self.fox}🦊: {self.reset}{response}")
+        self.respond(message)
 
 
 def main():
@@ -2,8 +2,10 @@
 Fox API Client
 """
 
+import json
+import uuid
 import requests
-from typing import Optional
+from typing import Iterator, Optional
 from .config import get_server_url
 
 
@@ -12,6 +14,8 @@ class FoxClient:
 
     def __init__(self, server_url: Optional[str] = None):
         self.server_url = server_url or get_server_url()
+        # هر اجرای CLI یک مکالمه جدا در سرور
+        self.conversation_id = f"cli:{uuid.uuid4().hex[:12]}"
         self.session = requests.Session()
         self.session.headers.update({
             "Content-Type": "application/json",
@@ -34,7 +38,7 @@ class FoxClient:
         try:
             response = self.session.post(
                 f"{self.server_url}/chat",
-                json={"message": message},
+                json={"message": message, "conversation_id": self.conversation_id},
                 timeout=60
             )
             if response.status_code == 200:
@@ -44,6 +48,41 @@ class FoxClient:
             pass
         return None
 
+    def chat_stream(self, message: str) -> Iterator[dict]:
+        """ارسال پیام و دریافت رویدادهای پاسخ (thinking / delta / draft / ai) به محض تولید"""
+        try:
+            response = self.session.post(
+                f"{self.server_url}/chat/stream",
+                json={"message": message, "conversation_id": self.conversation_id},
+                stream=True,
+                timeout=60
+            )
+        except Exception:
+            return
+
+        # سرور قدیمی بدون stream
+        if response.status_code == 404:
+            response.close()
+            text = self.chat(message)
+            if text is not None:
+                yield {"type": "ai", "message": text}
+            return
+
+        try:
+            if response.status_code != 200:
+                return
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line.decode("utf-8"))
+                except ValueError:
+                    continue
+        except Exception:
+            pass
+        finally:
+            response.close()
+
     def get_status(self) -> Optional[dict]:
         """دریافت وضعیت سرور"""
         try:
@@ -14,6 +14,7 @@ DEFAULT_CONFIG = {
     "voice_enabled": False,
     "typing_effect": True,
     "typing_delay": 0.006,
+    "streaming": True,
 }
 
 
@@ -0,0 +1,152 @@
+import time
+
+from brain.utils.cache_backends import (
+    NullCacheBackend, RedisCacheBackend, SqliteCacheBackend, create_cache_backend
+)
+
+class FakeRedis:
+    """جایگزین محلی Redis - down=True یعنی سرور در دسترس نیست"""
+
+    def __init__(self, server):
+        self.server = server
+
+    def _check(self):
+        self.server["calls"] += 1
+        if self.server["down"]:
+            raise ConnectionError("connection refused")
+
+    def ping(self):
+        self._check()
+        return True
+
+    def get(self, key):
+        self._check()
+        return self.server["data"].get(key)
+
+    def setex(self, key, ttl, value):
+        self._check()
+        self.server["data"][key] = value
+
+    def scan_iter(self, match):
+        self._check()
+        prefix = match.rstrip("*")
+        return [key for key in self.server["data"] if key.startswith(prefix)]
+
+    def delete(self, *keys):
+        self._check()
+        for key in keys:
+            self.server["data"].pop(key, None)
+
+def make_redis(**kwargs):
+    server = {"data": {}, "down": False, "calls": 0}
+    backend = RedisCacheBackend(client_factory=lambda: FakeRedis(server), **kwargs)
+    return backend, server
+
+# ---------- SQLite ----------
+
+def test_sqlite_opens_lazily(tmp_path):
+    directory = tmp_path / "cache"
+    backend = SqliteCacheBackend(str(directory / "response_cache.db"))
+    assert not directory.exists()  # ساخت backend (هنگام import) فایلی نمی‌سازد
+
+    backend.set("k", {"v": 1}, ttl=60)
+    assert (directory / "response_cache.db").exists()
+
+def test_sqlite_round_trip_and_persistence(tmp_path):
+    path = str(tmp_path / "cache" / "response_cache.db")
+    backend = SqliteCacheBackend(path)
+    value = {"response": "سلام روباه", "model": "llama", "score": 0.5}
+
+    assert backend.get("k") is None
+    backend.set("k", value, ttl=60)
+    assert backend.get("k") == value
+
+    # فایل پس از ساخت دوباره اتصال باقی می‌ماند
+    assert SqliteCacheBackend(path).get("k") == value
+    stats = backend.get_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["entries"] == 1
+
+def test_sqlite_expiry_and_purge(tmp_path):
+    backend = SqliteCacheBackend(str(tmp_path / "c.db"), purge_every=2)
+    backend.set("old", {"v": 1}, ttl=-1)
+    assert backend.get("old") is None
+
+    backend.set("new", {"v": 2}, ttl=60)  # نوشتن دوم، پاکسازی آیتم منقضی
+    assert backend.get_stats()["purged"] == 1
+    assert backend.get_stats()["entries"] == 1
+
+def test_sqlite_clear(tmp_path):
+    backend = SqliteCacheBackend(str(tmp_path / "c.db"))
+    backend.set("a", {"v": 1}, ttl=60)
+    backend.clear()
+    assert backend.get("a") is None
+    assert backend.get_stats()["entries"] == 0
+
+# ---------- Redis ----------
+
+def test_redis_round_trip_is_lazy_and_prefixed():
+    backend, server = make_redis()
+    assert server["calls"] == 0  # اتصال تا اولین عملیات ساخته نمی‌شود
+
+    backend.set("k", {"response": "سلام"}, ttl=60)
+    assert list(server["data"]) == ["robah:cache:k"]
+    assert backend.get("k") == {"response": "سلام"}
+    assert backend.get("missing") is None
+    assert backend.state == "closed"
+
+    server["data"]["other:key"] = b"1"
+    backend.clear()
+    assert list(server["data"]) == ["other:key"]
+
+def test_redis_circuit_opens_after_threshold():
+    backend, server = make_redis(failure_threshold=2, cooldown=60)
+    server["down"] = True
+
+    assert backend.get("k") is None
+    assert backend.state == "closed"
+    assert backend.get("k") is None
+    assert backend.state == "open"
+    assert backend.stats["circuit_opens"] == 1
+
+    # مدار باز: بدون تماس با شبکه رد می‌شود
+    calls = server["calls"]
+    assert backend.get("k") is None
+    backend.set("k", {"v": 1}, ttl=60)
+    assert server["calls"] == calls
+    assert backend.stats["short_circuits"] == 2
+
+def test_redis_half_open_recovers_on_success():
+    backend, server = make_redis(failure_threshold=1, cooldown=0.05)
+    server["down"] = True
+    backend.get("k")
+    assert backend.state == "open"
+
+    time.sleep(0.06)
+    assert backend.state == "half_open"
+
+    server["down"] = False
+    backend.set("k", {"v": 1}, ttl=60)
+    assert backend.state == "closed"
+    assert backend.get("k") == {"v": 1}
+
+def test_redis_half_open_failure_reopens():
+    backend, server = make_redis(failure_threshold=1, cooldown=0.05)
+    server["down"] = True
+    backend.get("k")
+    time.sleep(0.06)
+    assert backend.state == "half_open"
+
+    # یک تلاش آزمایشی (ping) و باز شدن دوباره مدار
+    calls = server["calls"]
+    assert backend.get("k") is None
+    assert server["calls"] == calls + 1
+    assert backend.state == "open"
+    assert backend.stats["circuit_opens"] == 2
+
+# ---------- انتخاب موتور ----------
+
+def test_create_backend_from_environment(tmp_path, monkeypatch):
+    assert isinstance(create_cache_backend("none"), NullCacheBackend)
+
+    monkeypatch.setenv("ROBAH_CACHE_DB_PATH", str(tmp_path / "c.db"))
+    assert isinstance(create_cache_backend("sqlite"), SqliteCacheBackend)
@@ -0,0 +1,101 @@
+import pytest
+
+from brain.utils import expiring_lru
+from brain.utils.expiring_lru import ExpiringLRU
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(expiring_lru, "time", clock)
+    return clock
+
+def test_evicts_least_recently_used(clock):
+    removed = []
+    cache = ExpiringLRU(max_entries=2, on_remove=lambda key, reason: removed.append((key, reason)))
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    assert cache.get("a") == 1  # a تازه استفاده شد، b قدیمی‌ترین است
+
+    cache.set("c", 3, ttl=60)
+    assert list(cache) == ["a", "c"]
+    assert removed == [("b", "evicted")]
+    assert cache.stats["evictions"] == 1
+
+def test_peek_does_not_touch_order(clock):
+    cache = ExpiringLRU(max_entries=2)
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    assert cache.peek("a") == 1
+
+    cache.set("c", 3, ttl=60)
+    assert "a" not in cache
+
+def test_get_respects_ttl(clock):
+    cache = ExpiringLRU()
+    cache.set("a", 1, ttl=10)
+    clock.now += 9.5
+    assert cache.get("a") == 1
+    clock.now += 1
+    assert cache.get("a") is None
+    assert cache.get("a", "default") == "default"
+
+def test_timer_wheel_expires_untouched_items(clock):
+    removed = []
+    cache = ExpiringLRU(tick_seconds=1.0, wheel_slots=8,
+                        on_remove=lambda key, reason: removed.append((key, reason)))
+    cache.set("short", 1, ttl=2)
+    cache.set("long", 2, ttl=30)  # بیش از یک دور چرخ
+
+    clock.now += 3
+    cache.expire()
+    assert "short" not in cache and "long" in cache
+    assert removed == [("short", "expired")]
+
+    # چند دور کامل چرخ بدون دسترسی
+    clock.now += 100
+    cache.expire()
+    assert len(cache) == 0
+    assert cache.stats["expirations"] == 2
+
+def test_replace_resets_expiry(clock):
+    cache = ExpiringLRU(tick_seconds=1.0, wheel_slots=8)
+    cache.set("a", 1, ttl=2)
+    cache.set("a", 2, ttl=60)
+
+    clock.now += 5
+    cache.expire()
+    assert cache.get("a") == 2
+
+def test_byte_budget(clock):
+    cache = ExpiringLRU(max_entries=100, max_bytes=10)
+    assert cache.set("a", "x", ttl=60, size=4)
+    assert cache.set("b", "y", ttl=60, size=4)
+    assert cache.set("c", "z", ttl=60, size=4)
+    assert list(cache) == ["b", "c"]
+    assert cache.total_bytes == 8
+
+    # بزرگ‌تر از کل سقف پذیرفته نمی‌شود و چیزی را بیرون نمی‌اندازد
+    assert not cache.set("huge", "w", ttl=60, size=11)
+    assert list(cache) == ["b", "c"]
+    assert cache.stats["rejections"] == 1
+
+def test_pop_and_clear(clock):
+    cache = ExpiringLRU()
+    cache.set("a", 1, ttl=60, size=3)
+    cache.set("b", 2, ttl=60, size=3)
+    cache.pop("a")
+    cache.pop("missing")
+    assert list(cache) == ["b"] and cache.total_bytes == 3
+
+    cache.clear()
+    assert len(cache) == 0 and cache.total_bytes == 0
+    clock.now += 120
+    cache.expire()  # خانه‌های چرخ هم خالی شده‌اند
+    assert cache.get_stats()["entries"] == 0
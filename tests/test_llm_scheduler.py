@@ -0,0 +1,152 @@
+import asyncio
+
+import pytest
+
+from brain.utils.llm_scheduler import AdmissionRejected, GenerationScheduler
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+
+    async def generate(self, model, prompt, options=None, timeout=None, **extra):
+        self.calls.append((model, prompt))
+        return {"response": f"{model}: {prompt}"}
+
+def make_scheduler(**kwargs) -> GenerationScheduler:
+    settings = {"per_model_concurrency": 1, "max_concurrency": 3, "max_active_models": 1,
+                "queue_deadline": 1.0, "max_queue": 8}
+    settings.update(kwargs)
+    return GenerationScheduler(FakeClient(), **settings)
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+async def start(scheduler: GenerationScheduler, model: str, order: list) -> asyncio.Task:
+    """درخواستی که پس از گرفتن نوبت نامش را ثبت می‌کند و تا release منتظر می‌ماند"""
+    async def run():
+        await scheduler.acquire(model)
+        order.append(model)
+    task = asyncio.ensure_future(run())
+    await settle()
+    return task
+
+def test_per_model_concurrency_queues_second_request():
+    async def scenario():
+        scheduler = make_scheduler()
+        order = []
+        await start(scheduler, "a", order)
+        second = await start(scheduler, "a", order)
+        assert order == ["a"] and scheduler.queue_depth("a") == 1
+
+        scheduler.release("a")
+        await second
+        assert order == ["a", "a"]
+        assert scheduler.stats["immediate"] == 1 and scheduler.stats["queued"] == 1
+    asyncio.run(scenario())
+
+def test_only_one_heavy_model_at_a_time_but_co_resident_runs_alongside():
+    async def scenario():
+        scheduler = make_scheduler(co_resident=["tiny"])
+        order = []
+        await start(scheduler, "a", order)
+        other = await start(scheduler, "b", order)
+        await start(scheduler, "tiny", order)
+        assert order == ["a", "tiny"]
+
+        scheduler.release("a")
+        await other
+        assert order == ["a", "tiny", "b"]
+        assert scheduler.stats["model_switches"] == 1
+    asyncio.run(scenario())
+
+def test_warm_model_is_served_first():
+    async def scenario():
+        scheduler = make_scheduler()
+        order = []
+        await start(scheduler, "a", order)
+        cold = await start(scheduler, "b", order)   # قدیمی‌تر ولی مدل سرد
+        warm = await start(scheduler, "a", order)
+
+        scheduler.release("a")
+        await warm
+        assert order == ["a", "a"]
+        assert scheduler.stats["resident_first"] == 1
+
+        scheduler.release("a")
+        await cold
+        assert order == ["a", "a", "b"]
+    asyncio.run(scenario())
+
+def test_fairness_window_drains_warm_model_for_starved_request():
+    async def scenario():
+        scheduler = make_scheduler(per_model_concurrency=2, fairness_window=0.05)
+        order = []
+        await start(scheduler, "a", order)
+        starved = await start(scheduler, "b", order)
+        await asyncio.sleep(0.1)
+
+        # مدل a هنوز جا دارد، اما تا سرویس گرفتن b درخواست جدیدش شروع نمی‌شود
+        late = await start(scheduler, "a", order)
+        assert order == ["a"]
+
+        scheduler.release("a")
+        await starved
+        assert order == ["a", "b"]
+        assert scheduler.stats["fairness_switches"] == 1
+
+        scheduler.release("b")
+        await late
+        assert order == ["a", "b", "a"]
+    asyncio.run(scenario())
+
+def test_rejects_when_queue_is_full():
+    async def scenario():
+        scheduler = make_scheduler(max_queue=1)
+        order = []
+        await start(scheduler, "a", order)
+        await start(scheduler, "a", order)
+        with pytest.raises(AdmissionRejected) as error:
+            await scheduler.acquire("a")
+        assert error.value.reason == "queue_full"
+        assert scheduler.stats["rejected_full"] == 1
+    asyncio.run(scenario())
+
+def test_rejects_after_queue_deadline_and_frees_the_waiter():
+    async def scenario():
+        scheduler = make_scheduler()
+        order = []
+        await start(scheduler, "a", order)
+        with pytest.raises(AdmissionRejected) as error:
+            await scheduler.acquire("a", deadline=0.05)
+        assert error.value.reason == "deadline"
+        assert scheduler.queue_depth() == 0
+
+        scheduler.release("a")
+        assert scheduler.total_active == 0
+    asyncio.run(scenario())
+
+def test_cancelled_waiter_does_not_take_a_slot():
+    async def scenario():
+        scheduler = make_scheduler()
+        order = []
+        await start(scheduler, "a", order)
+        waiting = await start(scheduler, "a", order)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+        scheduler.release("a")
+        assert scheduler.total_active == 0 and scheduler.queue_depth() == 0
+        assert scheduler.stats["cancelled"] == 1
+    asyncio.run(scenario())
+
+def test_generate_holds_a_slot_for_the_call():
+    async def scenario():
+        scheduler = make_scheduler()
+        result = await scheduler.generate("a", "سلام")
+        assert result == {"response": "a: سلام"}
+        assert scheduler.client.calls == [("a", "سلام")]
+        assert scheduler.total_active == 0
+        assert scheduler.get_stats()["models"]["a"]["count"] == 1
+    asyncio.run(scenario())
@@ -0,0 +1,83 @@
+import random
+
+from brain.utils.similarity_index import NearDuplicateIndex
+
+def jaccard(a: str, b: str) -> float:
+    a, b = set(a.lower().split()), set(b.lower().split())
+    return len(a & b) / len(a | b)
+
+def brute_force(messages, query, threshold):
+    scores = [(key, jaccard(text, query)) for key, text in messages.items()]
+    scores = [item for item in scores if item[1] >= threshold]
+    return max(scores, key=lambda item: item[1]) if scores else None
+
+def test_finds_near_duplicate_in_same_scope():
+    index = NearDuplicateIndex(threshold=0.8)
+    index.add("a", "سلام روباه امروز هوا چطوره عزیزم", scope="user1")
+
+    key, similarity = index.find("سلام روباه امروز هوا چطوره", scope="user1")
+    assert key == "a"
+    assert similarity == 5 / 6
+    assert index.find("سلام روباه امروز هوا چطوره", scope="user2") is None
+    assert index.find("یک پیام کاملاً متفاوت", scope="user1") is None
+
+def test_matches_brute_force_search():
+    rng = random.Random(7)
+    vocabulary = [f"w{i}" for i in range(30)]
+    messages = {i: " ".join(rng.sample(vocabulary, rng.randint(1, 8))) for i in range(300)}
+
+    for threshold in (0.5, 0.8, 0.85):
+        index = NearDuplicateIndex(threshold=threshold)
+        for key, text in messages.items():
+            index.add(key, text)
+
+        for _ in range(200):
+            base = messages[rng.randrange(len(messages))].split()
+            # حذف یا افزودن یک کلمه به یک پیام موجود
+            if len(base) > 1 and rng.random() < 0.5:
+                base.pop(rng.randrange(len(base)))
+            else:
+                base.append(rng.choice(vocabulary))
+            query = " ".join(base)
+
+            expected = brute_force(messages, query, threshold)
+            found = index.find(query)
+            if expected is None:
+                assert found is None
+            else:
+                assert found is not None and found[1] == expected[1]
+
+def test_remove_and_replace():
+    index = NearDuplicateIndex(threshold=0.9)
+    index.add("a", "hello fox how are you")
+    index.add("a", "completely new text here")  # جایگزینی همان کلید
+    assert len(index) == 1
+    assert index.find("hello fox how are you") is None
+    assert index.find("completely new text here")[0] == "a"
+
+    index.remove("a")
+    assert len(index) == 0
+    assert index.get_stats()["postings"] == 0
+    assert index.find("completely new text here") is None
+
+def test_set_threshold_rebuilds_prefixes():
+    index = NearDuplicateIndex(threshold=0.95)
+    index.add("a", "one two three four five")
+    assert index.find("one two three four") is None
+
+    index.set_threshold(0.8)
+    assert index.find("one two three four") == ("a", 0.8)
+
+def test_is_valid_rejects_candidates():
+    index = NearDuplicateIndex(threshold=0.5)
+    index.add("expired", "hello fox")
+    index.add("fresh", "hello fox friend")
+
+    key, _ = index.find("hello fox", is_valid=lambda key: key != "expired")
+    assert key == "fresh"
+
+def test_empty_message_is_not_indexed():
+    index = NearDuplicateIndex()
+    index.add("a", "   ")
+    assert len(index) == 0
+    assert index.find("") is None
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from brain.utils.task_queue import AsyncTaskQueue, TaskPriority
+
+def run(scenario, **kwargs):
+    """اجرای سناریو با یک صف تازه و توقف آن در پایان"""
+    async def main():
+        queue = AsyncTaskQueue(**kwargs)
+        try:
+            return await scenario(queue)
+        finally:
+            await queue.stop()
+    return asyncio.run(main())
+
+async def blocker(queue: AsyncTaskQueue) -> asyncio.Event:
+    """task ای که تنها worker را تا set شدن event مشغول نگه می‌دارد"""
+    release = asyncio.Event()
+    queue.add_task("blocker", release.wait, priority=TaskPriority.URGENT)
+    await asyncio.sleep(0.01)
+    return release
+
+def test_async_and_sync_results():
+    async def scenario(queue):
+        async def add(a, b):
+            return a + b
+        async_id = queue.add_task("add", add, 1, 2)
+        sync_id = queue.add_task("join", "-".join, ["a", "b"])
+
+        assert await queue.wait_for_task(async_id) == 3
+        assert await queue.wait_for_task(sync_id) == "a-b"
+        assert queue.get_task_status(sync_id)["status"] == "completed"
+        assert queue.stats["completed_tasks"] == 2
+    run(scenario)
+
+def test_failure_is_raised_to_waiter():
+    async def scenario(queue):
+        def boom():
+            raise ValueError("bad input")
+        task_id = queue.add_task("boom", boom)
+        with pytest.raises(Exception, match="bad input"):
+            await queue.wait_for_task(task_id)
+        assert queue.get_task_status(task_id)["status"] == "failed"
+        assert queue.stats["failed_tasks"] == 1
+    run(scenario)
+
+def test_retries_with_backoff_then_succeeds():
+    async def scenario(queue):
+        calls = []
+        async def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise ConnectionError("try again")
+            return "ok"
+        task_id = queue.add_task("flaky", flaky, max_retries=2, retry_backoff=0.01)
+
+        assert await queue.wait_for_task(task_id, timeout=2) == "ok"
+        assert queue.get_task_status(task_id)["attempts"] == 3
+        assert queue.stats["retries"] == 2
+    run(scenario)
+
+def test_timeout_per_attempt():
+    async def scenario(queue):
+        task_id = queue.add_task("slow", asyncio.sleep, 1, timeout=0.05)
+        with pytest.raises(Exception, match="timeout"):
+            await queue.wait_for_task(task_id)
+        assert queue.stats["timeouts"] == 1
+    run(scenario)
+
+def test_cancel_pending_and_running_tasks():
+    async def scenario(queue):
+        release = await blocker(queue)
+        pending_id = queue.add_task("pending", asyncio.sleep, 0)
+        assert queue.cancel_task(pending_id)
+        with pytest.raises(Exception, match="cancelled"):
+            await queue.wait_for_task(pending_id)
+
+        release.set()
+        running_id = queue.add_task("running", asyncio.sleep, 10)
+        await asyncio.sleep(0.02)
+        assert queue.get_task_status(running_id)["status"] == "running"
+        assert queue.cancel_task(running_id)
+        await asyncio.sleep(0.01)
+        assert queue.get_task_status(running_id)["status"] == "cancelled"
+        assert not queue.cancel_task(running_id)
+
+        # worker پس از لغو task در حال اجرا ادامه می‌دهد
+        task_id = queue.add_task("after", asyncio.sleep, 0, "done")
+        assert await queue.wait_for_task(task_id) == "done"
+        assert queue.stats["cancelled_tasks"] == 2
+    run(scenario, max_workers=1)
+
+def test_finished_tasks_are_bounded():
+    async def scenario(queue):
+        ids = [queue.add_task(f"t{i}", asyncio.sleep, 0, i) for i in range(4)]
+        for task_id in ids:
+            await queue.wait_for_task(task_id)
+
+        assert queue.get_task_status(ids[0]) is None
+        assert queue.get_task_status(ids[-1])["result"] == 3
+        assert len(queue.completed_tasks) == 2
+        assert queue.stats["evicted"] == 2
+    run(scenario, max_retained=2)
+
+def test_priority_order_without_aging():
+    async def scenario(queue):
+        order = []
+        async def record(name):
+            order.append(name)
+        release = await blocker(queue)
+        queue.add_task("low", record, "low", priority=TaskPriority.LOW)
+        last = queue.add_task("high", record, "high", priority=TaskPriority.HIGH)
+
+        release.set()
+        await queue.wait_for_task(last)
+        await asyncio.sleep(0.01)
+        assert order == ["high", "low"]
+    run(scenario, max_workers=1, aging_interval=60)
+
+def test_aging_promotes_long_waiting_task():
+    async def scenario(queue):
+        order = []
+        async def record(name):
+            order.append(name)
+        release = await blocker(queue)
+        low = queue.add_task("low", record, "low", priority=TaskPriority.LOW)
+        await asyncio.sleep(0.1)  # ده برابر aging_interval انتظار
+        queue.add_task("urgent", record, "urgent", priority=TaskPriority.URGENT)
+
+        release.set()
+        await queue.wait_for_task(low)
+        await asyncio.sleep(0.01)
+        assert order == ["low", "urgent"]
+        assert queue.stats["aged_promotions"] == 1
+    run(scenario, max_workers=1, aging_interval=0.01)